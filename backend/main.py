@@ -1,14 +1,73 @@
- # FastAPI backend API
- 
+# FastAPI backend API
+
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from backend.routes import products as products
 from backend.routes import reviews as reviews
+from backend.routes import rag as rag
+from backend.routes import sentiment as sentiment
 from backend.agents import agent_bot as agent
-app = FastAPI()
+from ml import rag_engine
+
+# seconds shutdown waits for a warmup thread that is still loading (a model load can't be interrupted)
+WARMUP_JOIN_TIMEOUT = 5
+_warmup_stop = threading.Event()
+
+
+def _warmup_rag():
+    try:
+        counts = rag_engine.warmup(stop=_warmup_stop)
+        if counts is not None:
+            print(f"RAG warmup done: {counts}")
+    except Exception as e:
+        print("Warning: RAG warmup failed, resources will load on first request. Error:", e)
+
+
+def _warmup_sentiment():
+    try:
+        sentiment.warmup()
+        print("Sentiment classifier loaded")
+    except Exception as e:
+        print("Warning: sentiment classifier failed to load, /api/sentiment/score will retry. Error:", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model / Chroma collections in the background so the server starts
+    # accepting connections immediately; /ready reports when it is done.
+    _warmup_stop.clear()
+    threads = [threading.Thread(target=_warmup_rag, name="rag-warmup", daemon=True)]
+    if sentiment.PRELOAD:
+        threads.append(threading.Thread(target=_warmup_sentiment, name="sentiment-warmup", daemon=True))
+    for t in threads:
+        t.start()
+    yield
+    # shutdown: warmup stops at its next step; a thread still inside a model load is left to the
+    # process exit (daemon) rather than holding shutdown up
+    _warmup_stop.set()
+    for t in threads:
+        t.join(WARMUP_JOIN_TIMEOUT)
+        if t.is_alive():
+            print(f"Warning: {t.name} still running at shutdown")
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(products.router)
 app.include_router(reviews.router)
+app.include_router(rag.router)
+app.include_router(sentiment.router)
 app.include_router(agent.router)
 
+
 @app.get("/")
 def home():
     return {"message": "Agentic AI Sentiment Assistant Backend Running"}
+
+
+@app.get("/ready")
+def ready():
+    rag, sentiment_status = rag_engine.readiness(), sentiment.readiness()
+    status = {"ready": rag["ready"] and sentiment_status["ready"], "rag": rag, "sentiment": sentiment_status}
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
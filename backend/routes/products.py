@@ -1,7 +1,7 @@
 # backend/routes/rag.py
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Literal
 from ml import rag_engine  
 
 router = APIRouter(prefix="/api/products", tags=["rag"])
@@ -11,6 +11,8 @@ router = APIRouter(prefix="/api/products", tags=["rag"])
 class ProductRequest(BaseModel):
     query: str = Field(..., description="User query for products (e.g. 'wireless headphones')")
     k: int = Field(3, ge=1, le=50, description="Number of products to return")
+    nprobe: Optional[int] = Field(None, ge=0, description="IVF lists searched on an ANN index: higher = better recall, slower (0 = exact; default ANN_NPROBE)")
+    mode: Optional[Literal["vector", "hybrid"]] = Field(None, description="Retrieval mode: dense only, or dense fused with BM25 (default RETRIEVAL_MODE)")
 
 
 class ReviewRequest(BaseModel):
@@ -31,12 +33,12 @@ class Hit(BaseModel):
 # ---------- Routes ----------
 
 @router.post("/retrieve", response_model=Dict[str, Any])
-async def products(req: ProductRequest):
+def products(req: ProductRequest):
     """
     Return top-k matching products for a user query by calling rag_engine.get_top_products.
     """
     try:
-        results = rag_engine.get_top_products(req.query, k=req.k)
+        results = rag_engine.get_top_products(req.query, k=req.k, nprobe=req.nprobe, mode=req.mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in rag engine: {e}")
 
@@ -1 +1,74 @@
-# this is split to products and reviews seperately to understand the difference
\ No newline at end of file
+# backend/routes/rag.py
+# Batched retrieval for bulk callers (catalog enrichment jobs etc.)
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional, List, Any, Dict, Literal
+from ml import rag_engine
+
+router = APIRouter(prefix="/api/rag", tags=["rag"])
+
+MAX_BATCH_ITEMS = 1000
+
+# ---------- Request / Response Models ----------
+
+class ProductQuery(BaseModel):
+    query: str = Field(..., description="User query for products (e.g. 'wireless headphones')")
+    k: int = Field(3, ge=1, le=50, description="Number of products to return")
+    nprobe: Optional[int] = Field(None, ge=0, description="IVF lists searched on an ANN index: higher = better recall, slower (0 = exact; default ANN_NPROBE)")
+    mode: Optional[Literal["vector", "hybrid"]] = Field(None, description="Retrieval mode: dense only, or dense fused with BM25 (default RETRIEVAL_MODE)")
+
+
+class ReviewLookup(BaseModel):
+    product_id: Optional[str] = Field(None, description="Optional product id (use this to filter)")
+    product_name: Optional[str] = Field(None, description="Exact product name (used when product_id is not given)")
+    k: int = Field(3, ge=1, le=100, description="Number of reviews to return")
+    order_by: Literal["rating", "sentiment", "recency"] = Field("rating", description="Ranking of a product's reviews")
+
+
+class BatchRequest(BaseModel):
+    product_queries: List[ProductQuery] = Field(default_factory=list, description="Product searches, answered in order")
+    review_lookups: List[ReviewLookup] = Field(default_factory=list, description="Review lookups, answered in order")
+
+
+# ---------- Routes ----------
+
+@router.post("/batch", response_model=Dict[str, Any])
+def batch(req: BatchRequest):
+    """
+    Run many product searches and review lookups in one call.
+    All query texts are embedded in one batch; results come back in input order.
+    """
+    total = len(req.product_queries) + len(req.review_lookups)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="Provide product_queries and/or review_lookups")
+    if total > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} items per batch (got {total})")
+    for i, r in enumerate(req.review_lookups):
+        if not r.product_id and not r.product_name:
+            raise HTTPException(status_code=400, detail=f"review_lookups[{i}]: provide product_id or product_name")
+
+    try:
+        out = rag_engine.batch_retrieve(
+            product_queries=[{"query": q.query, "k": q.k, "nprobe": q.nprobe, "mode": q.mode} for q in req.product_queries],
+            review_lookups=[{"product_id": r.product_id, "product_name": r.product_name, "k": r.k, "order_by": r.order_by}
+                            for r in req.review_lookups],
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in rag engine: {e}")
+
+    return {
+        "products": [
+            {"query": q.query, "count": len(res), "results": res}
+            for q, res in zip(req.product_queries, out["products"])
+        ],
+        "reviews": [
+            {"product_id": r.product_id, "product_name": r.product_name, "count": len(res), "results": res}
+            for r, res in zip(req.review_lookups, out["reviews"])
+        ],
+    }
+
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+def cache_stats():
+    """Hit/miss counters of the retrieval caches (use these to size EMBED_CACHE_SIZE / EMBED_CACHE_TTL)."""
+    return rag_engine.cache_stats()
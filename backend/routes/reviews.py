@@ -2,7 +2,7 @@
 # backend/routes/rag.py
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Literal
 from ml import rag_engine  
 
 router = APIRouter(prefix="/api/reviews", tags=["rag"])
@@ -16,8 +16,9 @@ class ProductRequest(BaseModel):
 
 class ReviewRequest(BaseModel):
     product_id: Optional[str] = Field(None, description="Optional product id (use this to filter)")
-    product_name: Optional[str] = Field(None, description="Fallback product name for similarity search")
+    product_name: Optional[str] = Field(None, description="Exact product name (used when product_id is not given)")
     k: int = Field(3, ge=1, le=100, description="Number of reviews to return")
+    order_by: Literal["rating", "sentiment", "recency"] = Field("rating", description="Ranking of a product's reviews")
     include_sources: bool = Field(False, description="Include original review text and metadata in results")
 
 
@@ -32,10 +33,10 @@ class Hit(BaseModel):
 # ---------- Routes ----------
 
 @router.post("/retrieve", response_model=Dict[str, Any])
-async def reviews(req: ReviewRequest):
+def reviews(req: ReviewRequest):
     """
     Return top reviews for a product. If product_id is provided, it will be used to filter results.
-    Otherwise product_name (approximate / semantic match) will be used.
+    Otherwise product_name (exact match) will be used; an unknown product returns no results.
     """
     # validation: need at least one identifier
     if not req.product_id and not req.product_name:
@@ -46,7 +47,8 @@ async def reviews(req: ReviewRequest):
         docs = rag_engine.get_reviews_for_product(
             product_id=req.product_id,
             product_name=req.product_name,
-            k=req.k
+            k=req.k,
+            order_by=req.order_by
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in rag engine: {e}")
@@ -0,0 +1,96 @@
+# backend/routes/sentiment.py
+# Online sentiment scoring: concurrent requests are micro-batched into shared analyze_texts calls
+import asyncio
+import os
+import threading
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional, List, Any, Dict
+from ml import sentiment_model
+from backend.utils.micro_batcher import MicroBatcher, QueueFull
+
+router = APIRouter(prefix="/api/sentiment", tags=["sentiment"])
+
+# Batch closes at SENTIMENT_BATCH_MAX texts or SENTIMENT_BATCH_WAIT_MS after its first text;
+# beyond SENTIMENT_QUEUE_MAX waiting texts requests get 429 instead of queueing.
+BATCH_MAX = int(os.environ.get("SENTIMENT_BATCH_MAX", "32"))
+BATCH_WAIT_MS = float(os.environ.get("SENTIMENT_BATCH_WAIT_MS", "10"))
+QUEUE_MAX = int(os.environ.get("SENTIMENT_QUEUE_MAX", "1000"))
+# SENTIMENT_PRELOAD=1 loads the classifier at app startup; by default it loads on the first /score request,
+# so workers that never score text don't pay the model's startup time and memory
+PRELOAD = os.environ.get("SENTIMENT_PRELOAD", "0") == "1"
+MAX_TEXTS = 100
+MAX_TEXT_CHARS = 5000
+
+# ---------- Shared classifier ----------
+
+_classifier = None
+_classifier_error: Optional[str] = None
+_classifier_lock = threading.Lock()
+
+
+def warmup():
+    """
+    Load the shared classifier (backend from SENTIMENT_BACKEND). Called on the first /score request,
+    or in the background at app startup with SENTIMENT_PRELOAD=1.
+    """
+    global _classifier, _classifier_error
+    with _classifier_lock:
+        if _classifier is None:
+            try:
+                _classifier = sentiment_model.get_classifier()
+                _classifier_error = None
+            except Exception as e:
+                _classifier_error = str(e)
+                raise
+    return _classifier
+
+
+def readiness() -> Dict[str, Any]:
+    """Readiness for /ready: with SENTIMENT_PRELOAD the worker is ready once the classifier has loaded."""
+    loaded = _classifier is not None
+    return {"ready": loaded or not PRELOAD, "loaded": loaded, "preload": PRELOAD, "error": _classifier_error}
+
+
+def _score_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    return sentiment_model.analyze_texts(texts, classifier=_classifier, batch_size=BATCH_MAX)
+
+
+batcher = MicroBatcher(_score_batch, max_batch=BATCH_MAX, max_wait_ms=BATCH_WAIT_MS, max_queue=QUEUE_MAX)
+
+# ---------- Request / Response Models ----------
+
+class ScoreRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=MAX_TEXTS, description="Review texts to score")
+
+
+# ---------- Routes ----------
+
+@router.post("/score", response_model=Dict[str, Any])
+async def score(req: ScoreRequest):
+    """
+    Score review texts as positive / neutral / negative.
+    Concurrent requests are coalesced into batched model calls; 429 when the queue is full,
+    503 when the classifier fails to load (it is loaded by the first request unless preloaded).
+    """
+    if _classifier is None:
+        try:
+            # blocking model load: off the event loop, so other requests keep being served meanwhile
+            await asyncio.get_running_loop().run_in_executor(None, warmup)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Sentiment classifier failed to load: {e}",
+                                headers={"Retry-After": "5"})
+    texts = [t[:MAX_TEXT_CHARS] for t in req.texts]
+    try:
+        results = await batcher.submit(texts)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Sentiment queue is full: {e}", headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in sentiment model: {e}")
+    return {"count": len(results), "results": results}
+
+
+@router.get("/stats", response_model=Dict[str, Any])
+def stats():
+    """Micro-batching counters (use avg_batch_size / rejected_requests to tune SENTIMENT_BATCH_* and SENTIMENT_QUEUE_MAX)."""
+    return {**readiness(), **batcher.stats()}
@@ -0,0 +1,99 @@
+# backend/utils/micro_batcher.py
+# Coalesces concurrent async requests into batched calls of a blocking function
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class QueueFull(Exception):
+    """Raised by MicroBatcher.submit when accepting the items would exceed max_queue (callers answer 429)."""
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests and hands them to process_fn in batches:
+    a batch closes when it holds max_batch items or max_wait_ms after its first item arrived.
+    process_fn(list of items) -> list of results (same order) is blocking, so it runs in a worker
+    thread, one batch at a time; items arriving meanwhile form the next batch.
+
+    At most max_queue items may wait; submit() raises QueueFull beyond that instead of letting
+    latency grow without bound.
+    """
+
+    def __init__(self, process_fn: Callable[[List[Any]], List[Any]], max_batch: int = 32,
+                 max_wait_ms: float = 10.0, max_queue: int = 1000):
+        self.process_fn = process_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _ensure_started(self) -> None:
+        # created lazily so the queue and task belong to the server's running event loop
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, items: List[Any]) -> List[Any]:
+        """Queue items (all or none) and wait for their results, in order."""
+        self._ensure_started()
+        if self._queue.qsize() + len(items) > self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"{self._queue.qsize()} items already queued (max {self.max_queue})")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            fut = loop.create_future()
+            self._queue.put_nowait((item, fut))
+            futures.append(fut)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # requests that were cancelled (client went away) don't need scoring
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(None, self.process_fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for (_, fut), result in zip(batch, results):
+                    if not fut.done():
+                        fut.set_result(result)
+            self.busy_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "rejected_requests": self.rejected,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
@@ -1,8 +1,16 @@
 # analyze_reviews.py
 import pandas as pd
 import argparse
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+from collections import Counter, deque
+from pathlib import Path
 from tqdm import tqdm
-from sentiment_model import get_classifier, analyze_texts
+from data_loader import dataset_path, find_table, format_of, iter_table, read_table, write_table
+from sentiment_model import BACKENDS, CACHE_PATH, DEFAULT_BACKEND, SentimentCache, get_classifier, analyze_texts
 
 COMMON_TEXT_COLS = ["text", "review", "review_text", "comment", "feedback", "body"]
 
@@ -14,7 +22,7 @@ def find_text_column(df, provided=None):
             return c
     # fallback: first string/object column
     for c in df.columns:
-        if df[c].dtype == object:
+        if pd.api.types.is_string_dtype(df[c]):
             return c
     raise ValueError("No text column found. Provide --text_col with column name.")
 
@@ -22,31 +30,267 @@ def preprocess_text(s):
     # simple clean: trim and replace newlines — extend as needed
     return str(s).strip().replace("\n", " ").replace("\r", "")
 
-def main(input_path, output_path, text_col, batch_size):
-    df = pd.read_csv(input_path)
+# -------------------------------
+# CHECKPOINTED CHUNKS (resumable, optionally multi-process)
+# -------------------------------
+# Rows are classified in chunks of checkpoint_every rows. Each finished chunk is written to
+# <output>.parts/part-<first row>.csv as (row, sentiment_label, sentiment_score), so a rerun only
+# classifies rows no part file covers yet, whatever the worker count was.
+MANIFEST_FILE = "manifest.json"
+_worker_state = {}
+
+
+def _init_worker(backend, batch_size, max_tokens, cache_path):
+    # one classifier (and cache connection) per worker process
+    _worker_state.update({
+        "classifier": get_classifier(backend=backend),
+        "cache": SentimentCache(cache_path) if cache_path else None,
+        "batch_size": batch_size,
+        "max_tokens": max_tokens,
+    })
+
+
+def _classify_texts(texts):
+    """Classify texts with this process's classifier. Returns (results, stats)."""
+    stats = {}
+    results = analyze_texts(texts, classifier=_worker_state["classifier"], batch_size=_worker_state["batch_size"],
+                            max_tokens=_worker_state["max_tokens"], stats=stats, cache=_worker_state["cache"])
+    return results, stats
+
+
+def _classify_chunk(task):
+    """Classify one chunk of (row, text) pairs and write its part file. Returns the chunk's stats."""
+    parts_dir, rows, texts = task
+    results, stats = _classify_texts(texts)
+    part = pd.DataFrame({"row": rows, "sentiment_label": [r["label"] for r in results],
+                         "sentiment_score": [r["score"] for r in results]})
+    path = os.path.join(parts_dir, f"part-{rows[0]:09d}.csv")
+    part.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)  # a part file is either complete or absent
+    return stats
+
+
+def _prepare_parts_dir(parts_dir, manifest):
+    """Create the checkpoint dir, or check an existing one belongs to the same job. Returns rows already done."""
+    Path(parts_dir).mkdir(parents=True, exist_ok=True)
+    manifest_path = os.path.join(parts_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise SystemExit(f"{parts_dir} holds checkpoints of a different job ({previous}); "
+                             f"delete it or pass --restart")
+    else:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    done = set()
+    for part in glob.glob(os.path.join(parts_dir, "part-*.csv")):
+        done.update(pd.read_csv(part, usecols=["row"])["row"].tolist())
+    return done
+
+
+def _merge_parts(parts_dir, n_rows):
+    parts = [pd.read_csv(p) for p in sorted(glob.glob(os.path.join(parts_dir, "part-*.csv")))]
+    merged = pd.concat(parts, ignore_index=True).drop_duplicates("row").sort_values("row")
+    if len(merged) != n_rows or merged["row"].iloc[0] != 0 or merged["row"].iloc[-1] != n_rows - 1:
+        raise RuntimeError(f"Checkpoints in {parts_dir} cover {len(merged)} of {n_rows} rows")
+    return merged
+
+
+def _report(chunk_stats, batch_size):
+    if not chunk_stats:
+        return
+    total = {k: sum(s[k] for s in chunk_stats) for k in ("unique_texts", "cache_hits", "classified", "batches", "tokens")}
+    # padded tokens per chunk = tokens / efficiency; overall efficiency is weighted by tokens
+    padded = sum(s["tokens"] / s["padding_efficiency"] for s in chunk_stats if s["tokens"])
+    fixed = sum(s["tokens"] / s["fixed_batch_padding_efficiency"] for s in chunk_stats if s["tokens"])
+    print(f"{total['unique_texts']} unique texts; {total['cache_hits']} from cache, {total['classified']} classified")
+    if padded:
+        print(f"{total['batches']} length-bucketed batches; padding efficiency {total['tokens'] / padded:.1%} "
+              f"(fixed batches of {batch_size}: {total['tokens'] / fixed:.1%})")
+    if any("escalated" in s for s in chunk_stats):
+        escalated = sum(s.get("escalated", 0) for s in chunk_stats)
+        print(f"cascade: {escalated} of {total['classified']} classified texts escalated to the full model "
+              f"({escalated / max(total['classified'], 1):.1%})")
+
+
+def main(input_path, output_path, text_col, batch_size, backend=None, max_tokens=None, cache_path=None,
+         workers=1, checkpoint_every=500, restart=False, keep_checkpoints=False):
+    # resolved here so the manifest tells runs under different SENTIMENT_BACKEND settings apart
+    backend = backend or DEFAULT_BACKEND
+    input_path = find_table(input_path)
+    df = read_table(input_path)
     text_col = find_text_column(df, text_col)
     print(f"Using text column: {text_col} (rows: {len(df)})")
 
     texts = df[text_col].fillna("").astype(str).apply(preprocess_text).tolist()
 
-    classifier = get_classifier()  # will auto-select GPU if available
-    print("Classifier loaded. Processing in batches...")
+    parts_dir = f"{output_path}.parts"
+    if restart:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    manifest = {"input": os.path.abspath(input_path), "rows": len(df), "text_col": text_col, "backend": backend}
+    done = _prepare_parts_dir(parts_dir, manifest)
+    todo = [i for i in range(len(texts)) if i not in done]
+    if done:
+        print(f"Resuming: {len(done)} rows already classified, {len(todo)} to go")
+    tasks = [(parts_dir, todo[b:b + checkpoint_every], [texts[i] for i in todo[b:b + checkpoint_every]])
+             for b in range(0, len(todo), checkpoint_every)]
 
-    results = analyze_texts(texts, classifier=classifier, batch_size=batch_size)
+    chunk_stats = []
+    if tasks and workers > 1:
+        # spawn: torch does not survive fork reliably; each worker loads its own classifier
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(backend, batch_size, max_tokens, cache_path)) as pool:
+            print(f"Classifying {len(todo)} rows in {len(tasks)} chunks on {workers} worker processes...")
+            for stats in tqdm(pool.imap_unordered(_classify_chunk, tasks), total=len(tasks)):
+                chunk_stats.append(stats)
+    elif tasks:
+        _init_worker(backend, batch_size, max_tokens, cache_path)  # will auto-select GPU if available
+        print(f"Classifier loaded ({backend} backend). Processing {len(tasks)} chunks...")
+        try:
+            for task in tqdm(tasks):
+                chunk_stats.append(_classify_chunk(task))
+        finally:
+            if _worker_state["cache"] is not None:
+                _worker_state["cache"].close()
+    _report(chunk_stats, batch_size)
 
-    df["sentiment_label"] = [r["label"] for r in results]
-    df["sentiment_score"] = [r["score"] for r in results]
+    merged = _merge_parts(parts_dir, len(df))
+    df["sentiment_label"] = merged["sentiment_label"].to_numpy()
+    df["sentiment_score"] = merged["sentiment_score"].to_numpy()
 
-    df.to_csv(output_path, index=False)
-    print(f"Saved results to {output_path}")
+    print(f"Saved results to {write_table(df, output_path)}")
+    if not keep_checkpoints:
+        shutil.rmtree(parts_dir, ignore_errors=True)
     print("Label counts:")
     print(df["sentiment_label"].value_counts())
 
+# -------------------------------
+# STREAMING MODE (flat memory for arbitrarily large inputs)
+# -------------------------------
+# The input is read chunk_rows rows at a time; each classified chunk is appended to the output
+# as soon as it (and every chunk before it) is done. <output>.progress.json records the rows and
+# bytes written after every append, so a rerun truncates a half-written chunk and resumes there.
+PROGRESS_SUFFIX = ".progress.json"
+
+
+def _load_progress(output_path, input_path, backend, restart):
+    progress_path = output_path + PROGRESS_SUFFIX
+    if not restart and os.path.exists(progress_path) and os.path.exists(output_path):
+        with open(progress_path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress.get("input") == os.path.abspath(input_path) and progress.get("backend") == backend:
+            with open(output_path, "r+b") as out:
+                out.truncate(progress["bytes"])
+            return progress
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return {"input": os.path.abspath(input_path), "backend": backend, "rows_done": 0, "bytes": 0, "label_counts": {}}
+
+
+def _save_progress(output_path, progress):
+    path = output_path + PROGRESS_SUFFIX
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    os.replace(path + ".tmp", path)
+
+
+def stream_main(input_path, output_path, text_col, batch_size, backend=None, max_tokens=None, cache_path=None,
+                workers=1, chunk_rows=5000, restart=False):
+    # resuming truncates the output at a byte offset, so streamed output is always CSV
+    if format_of(output_path) == "parquet":
+        raise SystemExit("--stream writes CSV; pass a .csv --output (python -m ml.data_loader convert turns it into Parquet)")
+    output_path = dataset_path(output_path, "csv")
+    input_path = find_table(input_path)
+    backend = backend or DEFAULT_BACKEND
+    progress = _load_progress(output_path, input_path, backend, restart)
+    if progress["rows_done"]:
+        print(f"Resuming after {progress['rows_done']} rows already written to {output_path}")
+    frames = iter_table(input_path, chunk_rows, skip_rows=progress["rows_done"])
+    label_counts = Counter(progress["label_counts"])
+    chunk_stats = []
+    pool = None
+    if workers > 1:
+        ctx = multiprocessing.get_context("spawn")
+        pool = ctx.Pool(workers, initializer=_init_worker, initargs=(backend, batch_size, max_tokens, cache_path))
+    else:
+        _init_worker(backend, batch_size, max_tokens, cache_path)  # will auto-select GPU if available
+    print(f"Classifier loaded ({backend} backend, {max(workers, 1)} process(es)). Streaming {chunk_rows}-row chunks...")
+
+    def _write(frame, results, stats):
+        frame["sentiment_label"] = [r["label"] for r in results]
+        frame["sentiment_score"] = [r["score"] for r in results]
+        with open(output_path, "a", encoding="utf-8", newline="") as out:
+            frame.to_csv(out, header=progress["bytes"] == 0, index=False)
+            out.flush()
+            os.fsync(out.fileno())
+            progress["bytes"] = out.tell()
+        label_counts.update(frame["sentiment_label"])
+        progress["rows_done"] += len(frame)
+        progress["label_counts"] = dict(label_counts)
+        _save_progress(output_path, progress)
+        chunk_stats.append(stats)
+
+    try:
+        # at most 2 chunks per worker are in flight: memory stays flat however large the input is
+        pending = deque()
+        col = None
+        for frame in tqdm(frames, unit="chunk"):
+            # detected once: auto-detection on a later chunk could pick a different column
+            col = col or find_text_column(frame, text_col)
+            texts = frame[col].fillna("").astype(str).apply(preprocess_text).tolist()
+            if pool is None:
+                _write(frame, *_classify_texts(texts))
+                continue
+            pending.append((frame, pool.apply_async(_classify_texts, (texts,))))
+            while len(pending) > workers * 2:
+                frame, result = pending.popleft()
+                _write(frame, *result.get())
+        while pending:
+            frame, result = pending.popleft()
+            _write(frame, *result.get())
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        elif _worker_state.get("cache") is not None:
+            _worker_state["cache"].close()
+
+    _report(chunk_stats, batch_size)
+    os.remove(output_path + PROGRESS_SUFFIX)
+    print(f"Saved {progress['rows_done']} rows to {output_path}")
+    print("Label counts:")
+    print(pd.Series(label_counts, name="count").sort_values(ascending=False))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Batch sentiment analysis (positive/neutral/negative)")
-    parser.add_argument("--input", "-i", required=True, help="Input CSV path (must contain a text column)")
-    parser.add_argument("--output", "-o", default="sentiment_output.csv", help="Output CSV path")
+    parser.add_argument("--input", "-i", required=True,
+                        help="Input table (CSV / Parquet, or a dataset name without suffix) with a text column")
+    parser.add_argument("--output", "-o", default="sentiment_output.csv",
+                        help="Output path: .csv / .parquet, or without suffix for DATA_FORMAT (ml/data_loader.py)")
     parser.add_argument("--text_col", default=None, help="Name of text column (auto-detected if omitted)")
-    parser.add_argument("--batch_size", type=int, default=8, help="Batch size (reduce if OOM)")
+    parser.add_argument("--batch_size", type=int, default=8, help="Batch size; sets the default token budget (reduce if OOM)")
+    parser.add_argument("--max_tokens", type=int, default=None,
+                        help="Padded tokens per batch (overrides --batch_size; texts are grouped by length)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="Sentiment backend (default: SENTIMENT_BACKEND env var, else zero-shot)")
+    parser.add_argument("--cache", default=CACHE_PATH,
+                        help="SQLite result cache (model + labels + text hash); reruns only classify new texts "
+                             "(default SENTIMENT_CACHE_PATH, else data/cache/sentiment_cache.sqlite)")
+    parser.add_argument("--no_cache", action="store_true", help="Don't read or write the result cache")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each with its own classifier")
+    parser.add_argument("--checkpoint_every", type=int, default=500,
+                        help="Rows per checkpointed chunk (finished chunks survive a crash; reruns resume)")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints of an earlier run of this output")
+    parser.add_argument("--keep_checkpoints", action="store_true", help="Keep <output>.parts after the final merge")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read, classify and append the input in --chunk_rows chunks (flat memory; resumable)")
+    parser.add_argument("--chunk_rows", type=int, default=5000, help="Rows per streamed chunk")
     args = parser.parse_args()
-    main(args.input, args.output, args.text_col, args.batch_size)
+    if args.stream:
+        stream_main(args.input, args.output, args.text_col, args.batch_size, args.backend, args.max_tokens,
+                    None if args.no_cache else args.cache, args.workers, args.chunk_rows, args.restart)
+    else:
+        main(args.input, args.output, args.text_col, args.batch_size, args.backend, args.max_tokens,
+             None if args.no_cache else args.cache, args.workers, args.checkpoint_every, args.restart,
+             args.keep_checkpoints)
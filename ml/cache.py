@@ -0,0 +1,138 @@
+# cache.py
+# Small in-process caches shared by the retrieval layer
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Size-capped LRU cache whose entries also expire after ttl seconds.
+
+    Thread-safe: FastAPI runs sync endpoints in a threadpool, so every
+    operation takes a lock. Keeps hit/miss/eviction counters for sizing.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600.0, clock: Callable[[], float] = time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = self._clock() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (expires_at, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# -------------------------------
+# COLLECTION VERSIONS
+# -------------------------------
+# ml/embedder.py bumps a collection's version after every ingest; readers key their
+# result caches on it, so cached results go stale exactly when the collection changes.
+VERSIONS_FILE = "collection_versions.json"
+
+
+def read_collection_versions(persist_dir: str) -> Dict[str, str]:
+    path = os.path.join(persist_dir, VERSIONS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def bump_collection_version(persist_dir: str, collection_name: str) -> str:
+    """Give collection_name a new random version and write it atomically. Returns the new version."""
+    versions = read_collection_versions(persist_dir)
+    versions[collection_name] = uuid.uuid4().hex[:12]
+    path = os.path.join(persist_dir, VERSIONS_FILE)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(versions, f, indent=2)
+    os.replace(tmp, path)
+    return versions[collection_name]
+
+
+class CollectionVersions:
+    """
+    Cheap per-request view of collection_versions.json: re-reads the file only when its mtime changes.
+    on_change is called (with the new mapping) whenever the versions differ from the last read.
+    """
+
+    def __init__(self, persist_dir: str, on_change: Optional[Callable[[Dict[str, str]], None]] = None):
+        self.path = os.path.join(persist_dir, VERSIONS_FILE)
+        self.persist_dir = persist_dir
+        self.on_change = on_change
+        self._mtime = None
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, collection_name: str) -> str:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    versions = read_collection_versions(self.persist_dir)
+                    changed = versions != self._versions
+                    self._versions, self._mtime = versions, mtime
+                    if changed and self.on_change is not None:
+                        self.on_change(versions)
+        # unversioned collections (built before versioning existed) rely on the cache TTL alone
+        return self._versions.get(collection_name, "unversioned")
@@ -1 +1,295 @@
-# Loads and cleans Amazon reviews
\ No newline at end of file
+# data_loader.py
+# Table I/O shared by the pipeline stages (prepare_docs, sentiment_prepare_docs, chunk_docs, analyze_reviews,
+# embedder): every dataset in data/processed can be stored as CSV or as partitioned Parquet.
+#
+# Parquet datasets are directories <name>.parquet/ of part files (part-00000.parquet, ...; at most
+# ROWS_PER_PART rows each, so writers can stream). String columns are dictionary-encoded, everything is
+# zstd-compressed and types survive the round trip (no dtype={...} re-parsing); readers can project columns.
+#
+# Stages name datasets without a suffix ("data/processed/reviews_with_sentiment"): writes use DATA_FORMAT
+# (auto = parquet when pyarrow is installed, else csv), reads take whichever stored copy is newest.
+# A path with an explicit .csv / .parquet suffix is used as given.
+#
+#   python -m ml.data_loader convert data/processed/reviews_with_sentiment --to parquet
+#   python -m ml.data_loader export data/processed/reviews_with_sentiment      # -> .csv
+#   python -m ml.data_loader info data/processed/reviews_with_sentiment
+import argparse
+import glob
+import os
+import shutil
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+DATA_FORMAT = os.environ.get("DATA_FORMAT", "auto")
+FORMATS = ("auto", "parquet", "csv")
+SUFFIXES = {".csv": "csv", ".parquet": "parquet"}
+# rows per Parquet part file / row group
+ROWS_PER_PART = 250000
+ROW_GROUP_ROWS = 50000
+COMPRESSION = "zstd"
+PART_PATTERN = "part-*.parquet"
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet datasets need pyarrow: pip install pyarrow (or DATA_FORMAT=csv)") from e
+    return pyarrow
+
+
+def have_parquet() -> bool:
+    try:
+        _pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+def write_format(fmt: Optional[str] = None) -> str:
+    """The concrete format ("csv" / "parquet") writes use: fmt, else DATA_FORMAT; auto = parquet if available."""
+    fmt = fmt or DATA_FORMAT
+    if fmt not in FORMATS:
+        raise ValueError(f"data format must be one of {FORMATS}")
+    if fmt == "auto":
+        return "parquet" if have_parquet() else "csv"
+    return fmt
+
+
+def format_of(path) -> Optional[str]:
+    """Format named by path's suffix, or None for a suffix-less dataset name."""
+    return SUFFIXES.get(os.path.splitext(str(path))[1].lower())
+
+
+def dataset_path(path, fmt: str) -> str:
+    """path with the suffix of fmt (replacing a .csv / .parquet suffix)."""
+    path = str(path)
+    if format_of(path):
+        path = os.path.splitext(path)[0]
+    return f"{path}.{fmt}"
+
+
+def _mtime(path: str) -> float:
+    if os.path.isdir(path):
+        return max([os.path.getmtime(p) for p in glob.glob(os.path.join(path, PART_PATTERN))] or [0.0])
+    return os.path.getmtime(path)
+
+
+def find_table(path) -> str:
+    """
+    The stored copy of a dataset: path itself if it exists, else the newest of <name>.parquet / <name>.csv
+    (so a stage still finds its input after an earlier stage switched formats).
+    """
+    path = str(path)
+    if os.path.exists(path):
+        return path
+    candidates = [p for p in (dataset_path(path, "parquet"), dataset_path(path, "csv")) if os.path.exists(p)]
+    if not candidates:
+        raise FileNotFoundError(f"No dataset at {path} (looked for .parquet and .csv)")
+    return max(candidates, key=_mtime)
+
+
+def _parts(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, PART_PATTERN)))
+    return [path]
+
+
+def _schema(parts: List[str]):
+    pa = _pyarrow()
+    # a part whose column was all null stores it as type null: promote to the other parts' type
+    return pa.unify_schemas([pa.parquet.read_schema(p) for p in parts], promote_options="permissive")
+
+
+def read_table(path, columns: Optional[List[str]] = None, **csv_kwargs) -> pd.DataFrame:
+    """
+    Read a dataset (CSV file, Parquet file or Parquet part directory) into a DataFrame.
+    columns projects: Parquet reads only those column chunks. csv_kwargs go to pd.read_csv.
+    """
+    path = find_table(path)
+    if format_of(path) != "parquet":
+        return pd.read_csv(path, usecols=columns, **csv_kwargs)
+    pa = _pyarrow()
+    parts = _parts(path)
+    schema = _schema(parts)
+    tables = [pa.parquet.read_table(p, columns=columns).cast(_project(schema, columns)) for p in parts]
+    return pa.concat_tables(tables).to_pandas()
+
+
+def _project(schema, columns):
+    pa = _pyarrow()
+    if columns is None:
+        return pa.schema([f for f in schema if not f.name.startswith("__index_level")])
+    return pa.schema([schema.field(c) for c in columns])
+
+
+def iter_table(path, chunk_rows: int, columns: Optional[List[str]] = None, skip_rows: int = 0,
+               **csv_kwargs) -> Iterator[pd.DataFrame]:
+    """
+    Stream a dataset as DataFrames of at most chunk_rows rows (memory stays bounded by chunk_rows),
+    starting after the first skip_rows rows.
+    """
+    path = find_table(path)
+    if format_of(path) != "parquet":
+        yield from pd.read_csv(path, chunksize=chunk_rows, usecols=columns,
+                               skiprows=range(1, skip_rows + 1), **csv_kwargs)
+        return
+    pa = _pyarrow()
+    parts = _parts(path)
+    schema = _project(_schema(parts), columns)
+    for part in parts:
+        pf = pa.parquet.ParquetFile(part)
+        if skip_rows >= pf.metadata.num_rows:
+            skip_rows -= pf.metadata.num_rows
+            continue
+        for batch in pf.iter_batches(batch_size=chunk_rows, columns=columns or schema.names):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            batch = batch.slice(skip_rows)
+            skip_rows = 0
+            yield pa.Table.from_batches([batch]).cast(schema).to_pandas()
+
+
+def _to_arrow(df: pd.DataFrame):
+    pa = _pyarrow()
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # object columns mixing types (e.g. ids that are sometimes numbers): store them as strings
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                try:
+                    pa.array(df[col], from_pandas=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    df[col] = df[col].map(lambda v: v if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+class TableWriter:
+    """
+    Appends DataFrames to a dataset. Output goes to a temporary path that replaces the dataset on
+    close(), so readers never see a half-written table (an exception discards it instead).
+    Parquet rows are buffered into part files of up to rows_per_part rows.
+    """
+
+    def __init__(self, path, fmt: Optional[str] = None, rows_per_part: int = ROWS_PER_PART):
+        self.fmt = format_of(path) or write_format(fmt)
+        self.path = dataset_path(path, self.fmt)
+        self.tmp = f"{self.path}.tmp"
+        self.rows_per_part = rows_per_part
+        self.rows = 0
+        self._buffer: List[pd.DataFrame] = []
+        self._buffered = 0
+        self._parts = 0
+        self._file = None
+        if os.path.isdir(self.tmp):
+            shutil.rmtree(self.tmp)
+        if self.fmt == "parquet":
+            _pyarrow()
+            os.makedirs(self.tmp, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.tmp, "w", encoding="utf-8", newline="")
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.fmt == "csv":
+            df.to_csv(self._file, header=self._file.tell() == 0, index=False)
+        else:
+            self._buffer.append(df)
+            self._buffered += len(df)
+            if self._buffered >= self.rows_per_part:
+                self._flush()
+        self.rows += len(df)
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        pa = _pyarrow()
+        frame = pd.concat(self._buffer, ignore_index=True) if len(self._buffer) > 1 else self._buffer[0]
+        self._buffer, self._buffered = [], 0
+        for start in range(0, len(frame), self.rows_per_part):
+            table = _to_arrow(frame.iloc[start:start + self.rows_per_part])
+            # dictionary pages for string columns: repeated names / labels / product stats are stored once per row group
+            strings = [f.name for f in table.schema if pa.types.is_string(f.type) or pa.types.is_large_string(f.type)]
+            pa.parquet.write_table(table, os.path.join(self.tmp, f"part-{self._parts:05d}.parquet"),
+                                   compression=COMPRESSION, use_dictionary=strings or False,
+                                   row_group_size=ROW_GROUP_ROWS)
+            self._parts += 1
+
+    def close(self) -> str:
+        """Finish the dataset; returns its path."""
+        if self.fmt == "csv":
+            self._file.close()
+        else:
+            self._flush()
+            if self._parts == 0:
+                # an empty dataset still has a (schema-less) part so readers find it
+                _pyarrow().parquet.write_table(_to_arrow(pd.DataFrame()), os.path.join(self.tmp, "part-00000.parquet"))
+        _remove(self.path)
+        os.replace(self.tmp, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        _remove(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def write_table(df: pd.DataFrame, path, fmt: Optional[str] = None) -> str:
+    """Write df as the dataset at path (format: path's suffix, else fmt / DATA_FORMAT). Returns the written path."""
+    with TableWriter(path, fmt) as writer:
+        writer.write(df)
+    return writer.path
+
+
+def disk_bytes(path: str) -> int:
+    return sum(os.path.getsize(p) for p in _parts(path)) if os.path.isdir(path) else os.path.getsize(path)
+
+
+def convert(path, fmt: str, chunk_rows: int = ROWS_PER_PART) -> str:
+    """Rewrite a dataset in another format (streamed). Returns the new path; the source is kept."""
+    source = find_table(path)
+    with TableWriter(dataset_path(source, fmt)) as writer:
+        for frame in iter_table(source, chunk_rows):
+            writer.write(frame)
+    return writer.path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert / export / inspect pipeline datasets")
+    parser.add_argument("command", choices=["convert", "export", "info"])
+    parser.add_argument("paths", nargs="+", help="Datasets (with or without .csv / .parquet suffix)")
+    parser.add_argument("--to", choices=["parquet", "csv"], default="parquet", help="convert: target format")
+    args = parser.parse_args()
+    for p in args.paths:
+        if args.command == "info":
+            src = find_table(p)
+            df = read_table(src)
+            print(f"{src}: {len(df)} rows, {disk_bytes(src) / 1e6:.2f} MB on disk, "
+                  f"{df.memory_usage(deep=True).sum() / 1e6:.2f} MB in memory")
+            print(df.dtypes.to_string())
+        else:
+            src = find_table(p)
+            out = convert(src, "csv" if args.command == "export" else args.to)
+            print(f"{src} ({disk_bytes(src) / 1e6:.2f} MB) -> {out} ({disk_bytes(out) / 1e6:.2f} MB)")
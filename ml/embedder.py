@@ -1,20 +1,44 @@
 # OpenAI embeddings
+# Run from the repo root: python -m ml.embedder [--mode full|incremental] [--resume] [--workers N]
 
 from langchain_huggingface import HuggingFaceEmbeddings
 #from langchain_community.vectorstores import Chroma
 from langchain_chroma import Chroma
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
 import pandas as pd
 from pathlib import Path
+from ml.cache import bump_collection_version
+from ml.data_loader import find_table, iter_table
+from ml.lexical_index import LEXICAL_FILE, build_from_collection
+from ml.onnx_models import OnnxSentenceEmbeddings, hub_name, use_onnx
+from ml.sentiment_head import SentimentHead
+from ml.vector_index import export_chroma_collection
 
 persist_dir = "./chroma_db"
-Path(persist_dir).mkdir(exist_ok=True)
+# NumPy exact-index exports (rag_engine VECTOR_BACKEND=numpy) live under <persist_dir>/numpy/<collection>
+NUMPY_SUBDIR = "numpy"
+# BM25 index for hybrid product retrieval (rag_engine RETRIEVAL_MODE=hybrid): <persist_dir>/lexical/<collection>
+LEXICAL_SUBDIR = "lexical"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# chunk datasets (CSV or Parquet, see ml/data_loader.py)
+PRODUCT_CHUNKS = "data/processed/chunked_products_with_sentiment"
+REVIEW_CHUNKS = "data/processed/chunked_reviews_with_sentiment"
+PRODUCT_COLLECTION = "products_with_sentiment"
+REVIEW_COLLECTION = "reviews_with_sentiment"
+# chunks embedded / written to Chroma per batch
+UPSERT_BATCH_SIZE = 256
+# chunk rows read at a time (bounds memory independently of the file size)
+READ_CHUNK_ROWS = 10000
+PROGRESS_EVERY_SEC = 5
+# metadata written by label_missing_sentiment rather than read from the source rows
+HEAD_LABEL_FIELDS = ("review_sentiment_label", "review_sentiment_score", "review_sentiment_source")
 
-# choose embeddings model
-emb = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-
-# 1) index product chunks
-#prod_chunks = pd.read_csv("data/processed/chunked_products.csv")
-prod_chunks = pd.read_csv("data/processed/chunked_products_with_sentiment.csv")
 
 def safe_none(val):
     # convert NaN/empty strings to None for metadata
@@ -41,23 +65,7 @@ def build_product_meta(row):
         # keep original chunk text length for filters (optional)
         "chunk_length": len(row.get("chunk_review_text", "")),
     }
-    
-texts = prod_chunks["chunk_review_text"].astype(str).tolist()
-#metas = prod_chunks[["product_id", "product_name", "chunk_id"]].to_dict(orient="records")
-metas = [build_product_meta(row) for _, row in prod_chunks.iterrows()]
-
-product_store = Chroma.from_texts(
-    texts=texts,
-    embedding=emb,
-    metadatas=metas,
-    collection_name="products_with_sentiment",
-    persist_directory=persist_dir
-)
-
-print("Persisted products collection.")
-
-# 2) index  chunk reviews
-reviews = pd.read_csv("data/processed/chunked_reviews_with_sentiment.csv")
+
 def build_review_meta(row):
     return {
         "product_id": safe_none(row.get("product_id")),
@@ -65,6 +73,7 @@ def build_review_meta(row):
         "rating": safe_none(row.get("rating")),
         "review_id": safe_none(row.get("review_id") or row.get("reviews.id") or row.get("id")),
         "chunk_id": safe_none(row.get("chunk_id")),
+        "review_date": safe_none(row.get("review_date") or row.get("reviews.date")),
         # per-review sentiment (if present)
         "review_sentiment_label": safe_none(row.get("review_sentiment_label") or row.get("sentiment_label")),
         "review_sentiment_score": safe_none(row.get("review_sentiment_score") or row.get("sentiment_score")),
@@ -79,15 +88,387 @@ def build_review_meta(row):
         "num_reviews_used": safe_none(row.get("num_reviews_used") or row.get("num_reviews")),
         "chunk_length": len(row.get("chunk_review_text", "")),
     }
-texts2 = reviews["chunk_review_text"].astype(str).tolist()
-metas2 = [build_review_meta(row) for _, row in reviews.iterrows()]
-
-review_store = Chroma.from_texts(
-    texts=texts2,
-    embedding=emb,
-    metadatas=metas2,
-    collection_name="reviews_with_sentiment",
-    persist_directory=persist_dir
-)
-
-print("Persisted reviews collection.")
+
+
+def clean_meta(meta):
+    """Chroma-ready metadata: drop None values, unwrap numpy scalars to plain Python values."""
+    return {k: (v.item() if hasattr(v, "item") else v) for k, v in meta.items() if v is not None}
+
+
+def content_hash(text):
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:16]
+
+
+def doc_id(text, meta):
+    """
+    Stable document id: chunk_id plus a hash of the chunk text, so text edits get a new id (and a new embedding).
+    Metadata is left out: the product stats on every review change with each new review of the product,
+    and are refreshed in place (refresh_metadata) instead of re-embedding the product's chunks.
+    """
+    h = content_hash(text)
+    return f"{meta['chunk_id']}:{h}" if meta.get("chunk_id") else h
+
+
+def iter_chunk_batches(data_path, build_meta, batch_size, start_row=0, read_rows=READ_CHUNK_ROWS):
+    """
+    Stream a chunk table (CSV or Parquet) as (rows_done, texts, metas) batches of at most batch_size rows.
+    Only read_rows rows are held in memory at a time; start_row skips rows already ingested.
+    rows_done is the absolute number of data rows consumed once the batch is written.
+    """
+    rows_done = start_row
+    reader = iter_table(data_path, read_rows, skip_rows=start_row)
+    for frame in reader:
+        records = frame.to_dict("records")
+        for b in range(0, len(records), batch_size):
+            rows = records[b:b + batch_size]
+            rows_done += len(rows)
+            texts = [str(r.get("chunk_review_text")) for r in rows]
+            metas = [clean_meta(build_meta(r)) for r in rows]
+            yield rows_done, texts, metas
+
+
+def existing_ids(collection, page_size=10000):
+    ids = []
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)
+        ids.extend(page["ids"])
+        if len(page["ids"]) < page_size:
+            return ids
+        offset += len(page["ids"])
+
+
+# -------------------------------
+# CHECKPOINTS (resume after a crash)
+# -------------------------------
+# One entry per collection of the current run; a finished collection keeps its entry (done=True) until
+# every collection of the run has finished, so --resume after a crash in a later collection skips it.
+STATE_FILE = "ingest_state.json"
+
+
+def _state_path():
+    return Path(persist_dir) / STATE_FILE
+
+
+def _load_state():
+    try:
+        return json.loads(_state_path().read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def load_checkpoint(collection_name, data_path, mode):
+    """(rows_done, done) of collection_name's checkpoint for this source and mode; (0, False) without one."""
+    entry = _load_state().get(collection_name) or {}
+    if entry.get("source") != str(data_path) or entry.get("mode") != mode:
+        return 0, False
+    return int(entry.get("rows_done", 0)), bool(entry.get("done"))
+
+
+def save_checkpoint(collection_name, data_path, mode, rows_done, done=False):
+    path = _state_path()
+    state = _load_state()
+    state[collection_name] = {"source": str(data_path), "mode": mode, "rows_done": rows_done, "done": done}
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def clear_checkpoints():
+    """Forget the run's checkpoints (every collection finished, or a new run starts)."""
+    _state_path().unlink(missing_ok=True)
+
+
+# -------------------------------
+# STREAMING INGEST
+# -------------------------------
+def _plan_writes(batches, stored, seen):
+    """
+    Turn row batches into write batches: (rows_done, ids, texts, metas, stored_ids, stored_metas).
+    ids / texts / metas hold only chunks that still have to be embedded; chunks whose id is already stored
+    go to stored_ids / stored_metas (their metadata may still need a refresh). Chunks seen earlier in this
+    run are skipped.
+    """
+    for rows_done, texts, metas in batches:
+        ids, out_texts, out_metas = [], [], []
+        stored_ids, stored_metas = [], []
+        for t, m in zip(texts, metas):
+            i = doc_id(t, m)
+            if i in seen:
+                continue
+            seen.add(i)
+            if i in stored:
+                stored_ids.append(i)
+                stored_metas.append(m)
+                continue
+            ids.append(i)
+            out_texts.append(t)
+            out_metas.append(m)
+        yield rows_done, ids, out_texts, out_metas, stored_ids, stored_metas
+
+
+def refresh_metadata(collection, ids, metas):
+    """
+    Update the metadata of stored chunks whose fields differ from metas (e.g. product stats after new
+    reviews), without re-embedding them. Chroma merges updated metadata into the stored entry, so keys
+    the stored copy has but metas lacks (values now None, dropped by clean_meta) are sent as None,
+    which removes them. Sentiment head labels are kept while the source row still has no label of its own.
+    Returns the number of chunks updated.
+    """
+    if not ids:
+        return 0
+    page = collection.get(ids=ids, include=["metadatas"])
+    current = {i: md or {} for i, md in zip(page["ids"], page["metadatas"])}
+    changed = []
+    for i, m in zip(ids, metas):
+        stored = current.get(i, {})
+        head_labeled = stored.get("review_sentiment_source") == "embedding-head" and not m.get("review_sentiment_label")
+        keep = HEAD_LABEL_FIELDS if head_labeled else ()
+        replacement = {**{k: None for k in stored if k not in m and k not in keep}, **m}
+        if any(stored.get(k) != v for k, v in replacement.items()):
+            changed.append((i, replacement))
+    if changed:
+        collection.update(ids=[i for i, _ in changed], metadatas=[m for _, m in changed])
+    return len(changed)
+
+
+def load_embeddings(model_name=EMBEDDING_MODEL, threads=None):
+    """
+    The embedding model: its ONNX export when one exists (INFERENCE_RUNTIME, see ml/onnx_models.py), else PyTorch.
+    threads caps the runtime's intra-op threads (torch's are process-wide).
+    """
+    if use_onnx(model_name):
+        return OnnxSentenceEmbeddings(model_name, threads=threads)
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+# -------------------------------
+# PARALLEL EMBEDDING (worker processes)
+# -------------------------------
+_worker_emb = None
+
+
+def _init_worker(model_name, threads):
+    # one model copy per worker; pin its threads so workers don't oversubscribe the cores
+    # (torch is only imported on the PyTorch path: ONNX workers don't need it installed)
+    global _worker_emb
+    _worker_emb = load_embeddings(model_name, threads)
+
+
+def _embed_in_worker(texts):
+    return _worker_emb.embed_documents(texts)
+
+
+class ParallelEmbedder:
+    """
+    Pool of embedding worker processes. Write batches are sharded across the workers and their
+    embeddings come back in submission order, so the single writer (and its checkpoints) stays sequential.
+    """
+
+    def __init__(self, workers, model_name=EMBEDDING_MODEL, threads_per_worker=None):
+        self.workers = workers
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        # spawn: torch does not survive fork reliably, and it is the only option on Windows
+        ctx = multiprocessing.get_context("spawn")
+        self.pool = ctx.Pool(workers, initializer=_init_worker, initargs=(model_name, threads))
+        # enough queued work to keep every worker busy without reading the whole file ahead
+        self.max_in_flight = workers * 2
+
+    def map_writes(self, writes):
+        """Yield (write, embeddings) for each _plan_writes write, in order."""
+        pending = deque()
+        for write in writes:
+            result = self.pool.apply_async(_embed_in_worker, (write[2],)) if write[1] else None
+            pending.append((write, result))
+            while len(pending) > self.max_in_flight:
+                w, r = pending.popleft()
+                yield w, r.get() if r is not None else []
+        while pending:
+            w, r = pending.popleft()
+            yield w, r.get() if r is not None else []
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def _embed_writes(writes, emb):
+    if isinstance(emb, ParallelEmbedder):
+        yield from emb.map_writes(writes)
+        return
+    for write in writes:
+        yield write, emb.embed_documents(write[2]) if write[1] else []
+
+
+def label_missing_sentiment(head, embeddings, metas):
+    """Fill review_sentiment_label / _score from the embedding sentiment head for chunks without a label."""
+    missing = [i for i, m in enumerate(metas) if not m.get("review_sentiment_label")]
+    if missing:
+        for i, pred in zip(missing, head.predict([embeddings[i] for i in missing])):
+            metas[i]["review_sentiment_label"] = pred["label"]
+            metas[i]["review_sentiment_score"] = pred["score"]
+            metas[i]["review_sentiment_source"] = "embedding-head"
+    return len(missing)
+
+
+def ingest(data_path, build_meta, collection_name, emb, mode="full", batch_size=UPSERT_BATCH_SIZE, resume=False,
+           sentiment_head=None):
+    """
+    Stream data_path into collection_name in fixed-size batches, writing each batch as soon as it is embedded.
+    emb is an embeddings model (in-process) or a ParallelEmbedder (worker processes).
+
+    mode="full" rebuilds the collection; mode="incremental" embeds only chunks whose id
+    (chunk_id + text hash) is not stored yet, updates the metadata of stored chunks where it changed
+    and deletes stored ids missing from the file.
+    Progress is checkpointed after every batch; resume=True continues from the last checkpoint, and
+    skips the collection entirely if the interrupted run had already finished it.
+    sentiment_head (ml/sentiment_head.py) labels chunks that arrive without a sentiment label from
+    the embeddings just computed, so new reviews need no separate BART pass.
+    Returns a report dict ("changed": whether anything was written, i.e. derived indexes are stale).
+    """
+    start = time.time()
+    # the stored copy actually read: a checkpoint of the CSV doesn't apply to a later Parquet copy
+    data_path = find_table(data_path)
+    start_row, done = load_checkpoint(collection_name, data_path, mode) if resume else (0, False)
+    if done:
+        print(f"{collection_name}: finished by the interrupted run, skipping")
+        return {"collection": collection_name, "mode": mode, "skipped": True, "changed": False}
+    # embeddings are computed here (or in the workers) and passed in, so the store needs no embedding function
+    store = Chroma(collection_name=collection_name, persist_directory=persist_dir)
+    if mode == "full" and start_row == 0:
+        # full rebuild: start from an empty collection so reruns don't append duplicates
+        store.delete_collection()
+        store = Chroma(collection_name=collection_name, persist_directory=persist_dir)
+    collection = store._collection
+    stored = set(existing_ids(collection)) if (mode == "incremental" or start_row) else set()
+    if start_row:
+        print(f"{collection_name}: resuming at row {start_row}")
+
+    seen = set()
+    added = 0
+    updated = 0
+    labeled = 0
+    rows_done = start_row
+    last_progress = start
+    batches = iter_chunk_batches(data_path, build_meta, batch_size, start_row=start_row)
+    for (rows_done, ids, texts, metas, stored_ids, stored_metas), embeddings in _embed_writes(
+            _plan_writes(batches, stored, seen), emb):
+        if ids:
+            if sentiment_head is not None:
+                labeled += label_missing_sentiment(sentiment_head, embeddings, metas)
+            collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metas)
+            added += len(ids)
+        updated += refresh_metadata(collection, stored_ids, stored_metas)
+        save_checkpoint(collection_name, data_path, mode, rows_done)
+        now = time.time()
+        if now - last_progress >= PROGRESS_EVERY_SEC:
+            last_progress = now
+            print(f"{collection_name}: {rows_done} rows read, {added} chunks embedded "
+                  f"({added / (now - start):.1f} chunks/sec)", flush=True)
+
+    deleted = None
+    if mode == "incremental":
+        if start_row == 0:
+            to_delete = [i for i in stored if i not in seen]
+            for b in range(0, len(to_delete), batch_size):
+                collection.delete(ids=to_delete[b:b + batch_size])
+            deleted = len(to_delete)
+        else:
+            print(f"{collection_name}: resumed run, skipping deletion of removed chunks (rerun without --resume to prune)")
+
+    changed = bool(added or updated or deleted or mode == "full")
+    if changed:
+        bump_collection_version(persist_dir, collection_name)  # invalidates rag_engine result caches
+    save_checkpoint(collection_name, data_path, mode, rows_done, done=True)
+    elapsed = time.time() - start
+    return {"collection": collection_name, "mode": mode, "rows": rows_done - start_row, "added": added,
+            "metadata_updated": updated, "deleted": deleted, "unchanged": len(seen & stored) - updated, "sentiment_labeled": labeled, "seconds": round(elapsed, 2),
+            "chunks_per_sec": round(added / elapsed, 1) if elapsed else None, "changed": changed}
+
+
+def export_numpy(collection_name, quantization=None, ivf_lists=None):
+    """
+    Export a Chroma collection to the memory-mapped NumPy index read by rag_engine (VECTOR_BACKEND=numpy).
+    quantization ("float16" / "int8") adds a compressed copy that searches scan before re-scoring.
+    ivf_lists (0 = sized from the row count) also trains an IVF for approximate nprobe searches.
+    """
+    start = time.time()
+    collection = Chroma(collection_name=collection_name, persist_directory=persist_dir)._collection
+    out = export_chroma_collection(collection, str(Path(persist_dir) / NUMPY_SUBDIR / collection_name),
+                                   quantization=quantization, ivf_lists=ivf_lists)
+    bump_collection_version(persist_dir, collection_name)  # running servers re-open the new export
+    print(f"{collection_name}: exported {collection.count()} vectors to {out} in {time.time() - start:.1f}s")
+
+
+def build_lexical(collection_name):
+    """(Re)build the BM25 index over the collection's chunk text + product_name, read back from Chroma."""
+    start = time.time()
+    collection = Chroma(collection_name=collection_name, persist_directory=persist_dir)._collection
+    docs = build_from_collection(collection, str(Path(persist_dir) / LEXICAL_SUBDIR / collection_name))
+    bump_collection_version(persist_dir, collection_name)  # running servers re-load the new index
+    print(f"{collection_name}: lexical index over {docs} chunks built in {time.time() - start:.1f}s")
+
+
+def main(mode="full", batch_size=UPSERT_BATCH_SIZE, resume=False, workers=0, threads_per_worker=None,
+         numpy_export=False, quantization=None, ivf_lists=None, label_sentiment=False):
+    Path(persist_dir).mkdir(exist_ok=True)
+    head = None
+    if label_sentiment:
+        head = SentimentHead.load()
+        if head.embedding_model != hub_name(EMBEDDING_MODEL):
+            raise ValueError(f"Sentiment head was trained on {head.embedding_model}, not {EMBEDDING_MODEL}")
+    # choose embeddings model (or a pool of worker processes each holding one)
+    if workers > 1:
+        emb = ParallelEmbedder(workers, EMBEDDING_MODEL, threads_per_worker)
+    else:
+        emb = load_embeddings(EMBEDDING_MODEL)
+
+    if not resume:
+        # a new run: markers of an earlier interrupted run must not make a later --resume skip collections
+        clear_checkpoints()
+    try:
+        # 1) index product chunks
+        #prod_chunks = pd.read_csv("data/processed/chunked_products.csv")
+        report = ingest(PRODUCT_CHUNKS, build_product_meta, PRODUCT_COLLECTION, emb, mode, batch_size, resume)
+        print(report)
+        print("Persisted products collection.")
+        # an unchanged collection keeps its index (rebuilding would also drop every server's result cache)
+        if report["changed"] or not (Path(persist_dir) / LEXICAL_SUBDIR / PRODUCT_COLLECTION / LEXICAL_FILE).exists():
+            build_lexical(PRODUCT_COLLECTION)
+        if numpy_export:
+            export_numpy(PRODUCT_COLLECTION, quantization, ivf_lists)
+
+        # 2) index  chunk reviews
+        print(ingest(REVIEW_CHUNKS, build_review_meta, REVIEW_COLLECTION, emb, mode, batch_size, resume, head))
+        print("Persisted reviews collection.")
+        if numpy_export:
+            export_numpy(REVIEW_COLLECTION, quantization, ivf_lists)
+        clear_checkpoints()
+    finally:
+        if isinstance(emb, ParallelEmbedder):
+            emb.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed product / review chunks into Chroma")
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full",
+                        help="full: rebuild collections; incremental: embed only new/changed chunks, delete removed ones")
+    parser.add_argument("--batch_size", type=int, default=UPSERT_BATCH_SIZE, help="Chunks embedded and written per batch")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint of an interrupted run")
+    parser.add_argument("--workers", type=int, default=0, help="Embedding worker processes (0/1: embed in this process)")
+    parser.add_argument("--threads_per_worker", type=int, default=None,
+                        help="torch threads per worker (default: cpu_count // workers)")
+    parser.add_argument("--export_numpy", action="store_true",
+                        help="Also export each collection to the memory-mapped NumPy index (VECTOR_BACKEND=numpy)")
+    parser.add_argument("--quantize", choices=["float16", "int8"], default=None,
+                        help="With --export_numpy: store a quantized copy of the vectors (re-scored at float32)")
+    parser.add_argument("--ivf_lists", type=int, default=None,
+                        help="With --export_numpy: build an IVF ANN index with this many lists (0 = ~4*sqrt(rows))")
+    parser.add_argument("--label_sentiment", action="store_true",
+                        help="Label review chunks that have no sentiment with the embedding head (python -m ml.sentiment_head)")
+    args = parser.parse_args()
+    main(args.mode, args.batch_size, args.resume, args.workers, args.threads_per_worker, args.export_numpy,
+         args.quantize, args.ivf_lists, args.label_sentiment)
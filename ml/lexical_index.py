@@ -0,0 +1,133 @@
+# lexical_index.py
+# BM25 inverted index over chunk text + product_name (exact-token side of hybrid retrieval)
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LEXICAL_FILE = "bm25.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric runs: "Fire HD 8, 16 GB" -> ["fire", "hd", "8", "16", "gb"]."""
+    return _TOKEN.findall(str(text).lower())
+
+
+def document_text(text: str, metadata: Optional[dict]) -> str:
+    """What a chunk is indexed under: its product_name (when the chunk text doesn't start with it) plus the text."""
+    name = (metadata or {}).get("product_name")
+    if name and name not in text[:len(name) + 16]:
+        return f"{name}\n{text}"
+    return text
+
+
+class LexicalIndex:
+    """
+    BM25 over a collection's documents, stored as compact postings (CSR layout):
+    terms[t] has postings docs[offsets[t]:offsets[t + 1]] with term frequencies tfs[...].
+    Everything lives in one .npz file, replaced atomically on rebuild.
+    """
+
+    def __init__(self, ids: np.ndarray, terms: np.ndarray, offsets: np.ndarray, docs: np.ndarray,
+                 tfs: np.ndarray, doc_len: np.ndarray, k1: float = BM25_K1, b: float = BM25_B):
+        self.ids = ids
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self._term_of = {term: i for i, term in enumerate(terms.tolist())}
+        n = len(ids)
+        df = np.diff(offsets)
+        self._idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_len = float(doc_len.mean()) if n else 1.0
+        # per-document part of the BM25 denominator, precomputed once
+        self._norm = (k1 * (1.0 - b + b * doc_len / max(avg_len, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(os.path.join(path, LEXICAL_FILE)) as f:
+            return cls(f["ids"], f["terms"], f["offsets"], f["docs"], f["tfs"], f["doc_len"],
+                       float(f["k1"]), float(f["b"]))
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (document id, BM25 score) for a query, best first. Documents sharing no term are never returned."""
+        terms = [self._term_of[t] for t in dict.fromkeys(tokenize(query)) if t in self._term_of]
+        if not terms or k < 1:
+            return []
+        docs = np.concatenate([self.docs[self.offsets[t]:self.offsets[t + 1]] for t in terms])
+        tfs = np.concatenate([self.tfs[self.offsets[t]:self.offsets[t + 1]] for t in terms]).astype(np.float32)
+        idf = np.concatenate([np.full(self.offsets[t + 1] - self.offsets[t], self._idf[t]) for t in terms])
+        contrib = idf * tfs * (self.k1 + 1.0) / (tfs + self._norm[docs])
+        # sum per document over the (few) matched docs only, not over the whole collection
+        matched, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib)
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.ids[matched[i]]), float(scores[i])) for i in top]
+
+
+class LexicalIndexBuilder:
+    """Accumulates (id, text, metadata) pages into postings; write() sorts them term-major and saves."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.doc_len: List[int] = []
+        self._term_id: Dict[str, int] = {}
+        self._pages: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []  # (term ids, docs, tfs)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Optional[dict]]) -> None:
+        term_ids, docs, tfs = [], [], []
+        for chunk_id, text, md in zip(ids, texts, metadatas):
+            doc = len(self.ids)
+            tokens = tokenize(document_text(text or "", md))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(self._term_id.setdefault(term, len(self._term_id)))
+                docs.append(doc)
+                tfs.append(tf)
+            self.ids.append(chunk_id)
+            self.doc_len.append(len(tokens))
+        self._pages.append((np.asarray(term_ids, dtype=np.int32), np.asarray(docs, dtype=np.int32),
+                            np.minimum(np.asarray(tfs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)))
+
+    def write(self, path: str) -> str:
+        os.makedirs(path, exist_ok=True)
+        term_ids = np.concatenate([p[0] for p in self._pages]) if self._pages else np.empty(0, np.int32)
+        docs = np.concatenate([p[1] for p in self._pages]) if self._pages else np.empty(0, np.int32)
+        tfs = np.concatenate([p[2] for p in self._pages]) if self._pages else np.empty(0, np.uint16)
+        order = np.lexsort((docs, term_ids))
+        counts = np.bincount(term_ids, minlength=len(self._term_id))
+        terms = sorted(self._term_id, key=self._term_id.get)
+        out = os.path.join(path, LEXICAL_FILE)
+        tmp = os.path.join(path, "bm25.tmp.npz")
+        np.savez(tmp, ids=np.asarray(self.ids, dtype=str), terms=np.asarray(terms, dtype=str),
+                 offsets=np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+                 docs=docs[order], tfs=tfs[order], doc_len=np.asarray(self.doc_len, dtype=np.int32),
+                 k1=BM25_K1, b=BM25_B)
+        os.replace(tmp, out)
+        return out
+
+
+def build_from_collection(collection, path: str, page_size: int = 5000) -> int:
+    """Build the BM25 index of a chromadb collection (documents + metadatas, page by page). Returns the doc count."""
+    builder = LexicalIndexBuilder()
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        builder.add(page["ids"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+        if len(page["ids"]) < page_size:
+            break
+    builder.write(path)
+    return len(builder.ids)
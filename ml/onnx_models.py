@@ -0,0 +1,162 @@
+# onnx_models.py
+# Optional ONNX Runtime (CPU, optionally dynamic-int8) inference for the sentiment models and the MiniLM embedder.
+#
+# Export once (needs: pip install "optimum[onnxruntime]"):
+#   python -m ml.onnx_models --sentiment_backend sentiment --embeddings --quantize
+# Exported models are picked up automatically by sentiment_model.get_classifier, ml/embedder.py and
+# ml/rag_engine.py (INFERENCE_RUNTIME=auto); INFERENCE_RUNTIME=torch ignores them, =onnx requires them.
+import argparse
+import os
+from pathlib import Path
+from typing import List, Optional
+
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ONNX_DIR = os.environ.get("ONNX_MODEL_DIR", os.path.join(_REPO_ROOT, "onnx_models"))
+INFERENCE_RUNTIME = os.environ.get("INFERENCE_RUNTIME", "auto")
+RUNTIMES = ("auto", "torch", "onnx")
+ONNX_FILE = "model.onnx"
+QUANTIZED_FILE = "model_quantized.onnx"
+# sentiment models are sequence classifiers; the embedder is a plain encoder (feature extraction)
+SEQUENCE_CLASSIFICATION = "sequence-classification"
+FEATURE_EXTRACTION = "feature-extraction"
+
+
+def hub_name(model_name: str) -> str:
+    """Canonical hub id: sentence-transformers short names ("all-MiniLM-L6-v2") get their org prefix."""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def artifact_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, hub_name(model_name).replace("/", "__"))
+
+
+def find_artifact(model_name: str) -> Optional[str]:
+    """Path of the exported .onnx file for model_name (int8 preferred over fp32), or None."""
+    for name in (QUANTIZED_FILE, ONNX_FILE):
+        path = os.path.join(artifact_dir(model_name), name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def use_onnx(model_name: str, runtime: Optional[str] = None, device: int = -1) -> bool:
+    """Whether to run model_name on ONNX Runtime: auto = when exported and on CPU."""
+    runtime = runtime or INFERENCE_RUNTIME
+    if runtime not in RUNTIMES:
+        raise ValueError(f"runtime must be one of {RUNTIMES}")
+    if runtime == "torch":
+        return False
+    if find_artifact(model_name) is None:
+        if runtime == "onnx":
+            raise FileNotFoundError(f"No ONNX export of {model_name} under {ONNX_DIR}; run python -m ml.onnx_models")
+        return False
+    # the exports target CPUs; with a GPU available, auto keeps torch
+    return runtime == "onnx" or device < 0
+
+
+def _optimum():
+    try:
+        from optimum import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError('ONNX inference needs optimum with onnxruntime: pip install "optimum[onnxruntime]"') from e
+    return ort
+
+
+def _model_class(task: str):
+    ort = _optimum()
+    return ort.ORTModelForSequenceClassification if task == SEQUENCE_CLASSIFICATION else ort.ORTModelForFeatureExtraction
+
+
+def load_model(model_name: str, task: str, threads: Optional[int] = None):
+    """(ORT model, tokenizer) from the exported artifact of model_name. threads caps ONNX Runtime's intra-op threads."""
+    from transformers import AutoTokenizer
+    path = find_artifact(model_name)
+    options = None
+    if threads:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+    model = _model_class(task).from_pretrained(os.path.dirname(path), file_name=os.path.basename(path),
+                                               session_options=options)
+    return model, AutoTokenizer.from_pretrained(os.path.dirname(path))
+
+
+def onnx_pipeline(task: str, model_name: str):
+    """A transformers pipeline (e.g. "zero-shot-classification") running the exported model on ONNX Runtime."""
+    from transformers import pipeline
+    model, tokenizer = load_model(model_name, SEQUENCE_CLASSIFICATION)
+    return pipeline(task, model=model, tokenizer=tokenizer)
+
+
+class OnnxSentenceEmbeddings:
+    """
+    LangChain-compatible embeddings (embed_documents / embed_query) for sentence-transformers models
+    exported to ONNX: mean pooling over the attention mask, then L2 normalization (what
+    all-MiniLM-L6-v2's sentence-transformers pipeline does).
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 64, max_length: int = 256, threads: Optional[int] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.model, self.tokenizer = load_model(model_name, FEATURE_EXTRACTION, threads)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+        out = []
+        for b in range(0, len(texts), self.batch_size):
+            enc = self.tokenizer(list(texts[b:b + self.batch_size]), padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            hidden = np.asarray(self.model(**enc).last_hidden_state, dtype=np.float32)
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.extend(pooled.tolist())
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def export_model(model_name: str, task: str, quantize: bool = False) -> str:
+    """
+    Export model_name to ONNX under artifact_dir(model_name) (with its tokenizer and config).
+    quantize=True also writes a dynamic int8 copy (weights int8, activations quantized at run time),
+    which find_artifact prefers. Returns the path of the file that will be used.
+    """
+    from transformers import AutoTokenizer
+    out = artifact_dir(model_name)
+    Path(out).mkdir(parents=True, exist_ok=True)
+    model = _model_class(task).from_pretrained(hub_name(model_name), export=True)
+    model.save_pretrained(out)
+    AutoTokenizer.from_pretrained(hub_name(model_name)).save_pretrained(out)
+    if quantize:
+        ort = _optimum()
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        # avx2 dynamic config runs on any x86-64 CPU from the last decade
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        ort.ORTQuantizer.from_pretrained(out, file_name=ONNX_FILE).quantize(save_dir=out, quantization_config=config)
+    elif os.path.exists(os.path.join(out, QUANTIZED_FILE)):
+        # a plain re-export replaces an earlier int8 copy rather than being shadowed by it
+        os.remove(os.path.join(out, QUANTIZED_FILE))
+    return find_artifact(model_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the sentiment model and/or embedder to ONNX")
+    parser.add_argument("--sentiment_backend", choices=["zero-shot", "sentiment"], default=None,
+                        help="Export this sentiment backend's default model")
+    parser.add_argument("--sentiment_model", default=None, help="Export this sentiment model instead of the backend default")
+    parser.add_argument("--embeddings", action="store_true", help="Export the MiniLM embedding model")
+    parser.add_argument("--embedding_model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 quantized copy (used when present)")
+    args = parser.parse_args()
+
+    if args.sentiment_backend or args.sentiment_model:
+        from ml.sentiment_model import DEFAULT_MODELS
+        name = args.sentiment_model or DEFAULT_MODELS[args.sentiment_backend]
+        print(f"Exported {name} -> {export_model(name, SEQUENCE_CLASSIFICATION, args.quantize)}")
+    if args.embeddings:
+        print(f"Exported {args.embedding_model} -> {export_model(args.embedding_model, FEATURE_EXTRACTION, args.quantize)}")
+    if not (args.sentiment_backend or args.sentiment_model or args.embeddings):
+        parser.error("nothing to export: pass --sentiment_backend/--sentiment_model and/or --embeddings")
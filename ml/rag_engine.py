@@ -2,82 +2,79 @@
  
  # rag.py
 import os
-import pandas as pd
+import re
+import threading
+from abc import ABC, abstractmethod
 from typing import List, Dict, Any, Optional
 
+import numpy as np
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 
+from ml.cache import TTLCache, CollectionVersions
+from ml.lexical_index import LEXICAL_FILE, LexicalIndex
+from ml.onnx_models import OnnxSentenceEmbeddings, use_onnx
+from ml.vector_index import NumpyVectorIndex
+
 # -------------------------------
 # CONFIGURATION
 # -------------------------------
-dbname = "chroma_db"  # <-- your Chroma DB folder
-PERSIST_DIR = os.path.join(os.path.dirname(__file__), "..","..", dbname)
-
-# Resolve to absolute path
-PERSIST_DIR = os.path.abspath(PERSIST_DIR)
-#print(PERSIST_DIR)
+# Default to the chroma_db folder at the repo root (where ml/embedder.py writes it)
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PERSIST_DIR = os.path.abspath(os.environ.get("CHROMA_PERSIST_DIR", os.path.join(_REPO_ROOT, "chroma_db")))
 
-EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 PRODUCT_COLLECTION = "products_with_sentiment"
 REVIEW_COLLECTION = "reviews_with_sentiment"
+# Vector store behind retrieval: "chroma" (default) or "numpy" (memory-mapped exact index,
+# exported with python -m ml.embedder --export_numpy)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DIR = os.environ.get("NUMPY_INDEX_DIR", os.path.join(PERSIST_DIR, "numpy"))
+# Default IVF lists probed per query when the numpy index was exported with --ivf_lists
+# (per-request nprobe overrides it; 0 = exact search). Ignored by the chroma backend.
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))
+# Product retrieval: "vector" (dense only) or "hybrid" (dense hits fused with BM25 over chunk text +
+# product_name, from the lexical index ml/embedder.py writes under LEXICAL_INDEX_DIR/<collection>)
+RETRIEVAL_MODES = ("vector", "hybrid")
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "vector")
+LEXICAL_INDEX_DIR = os.environ.get("LEXICAL_INDEX_DIR", os.path.join(PERSIST_DIR, "lexical"))
+# Hybrid: BM25 candidates per query, and the reciprocal-rank-fusion constant (1 / (HYBRID_RRF_K + rank))
+HYBRID_LEXICAL_K = int(os.environ.get("HYBRID_LEXICAL_K", "20"))
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", "60"))
+# Product search over-fetches chunks (several chunks share a product_id) and widens only if short
+PRODUCT_FETCH_FACTOR = int(os.environ.get("PRODUCT_FETCH_FACTOR", "2"))
+PRODUCT_MAX_FETCH_K = int(os.environ.get("PRODUCT_MAX_FETCH_K", "200"))
+
+# Query-embedding cache (hot chat queries skip the MiniLM forward pass)
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_TTL = float(os.environ.get("EMBED_CACHE_TTL", "3600"))
+# Result cache for get_top_products / get_reviews_for_product, keyed on the collection version
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "5000"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "3600"))
 
 # -------------------------------
-# INITIALIZE
-# -------------------------------
-embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-
-# Load the persisted Chroma collection for product
-product_store = Chroma(
-    collection_name=PRODUCT_COLLECTION,
-    persist_directory=PERSIST_DIR,
-    embedding_function=embeddings
-)
-print(product_store._collection.count())
-# Load the persisted Chroma collection for review
-review_store = Chroma(
-    collection_name=REVIEW_COLLECTION,
-    persist_directory=PERSIST_DIR,
-    embedding_function=embeddings
-)
-print(review_store._collection.count())
-# -------------------------------
-# FUNCTION TO QUERY THE DB
+# INITIALIZE (lazy, one shared instance per process)
 # -------------------------------
-def query_docs(query_text: str, top_k: int = 3):
-    """
-    Perform a similarity search on the Chroma DB.
-    
-    Args:
-        query_text (str): The user's query.
-        top_k (int): Number of top documents to retrieve.
-    
-    Returns:
-        list of strings: Retrieved document texts.
-    """
-    #print('inside')
-    results = product_store.similarity_search(query_text, k=top_k)
-    return [doc.page_content for doc in results]
-
-# Product discovery: vector search in products collection
-# -------------------------
-# rag.py
-
-# Config
-PERSIST_DIR = os.environ.get("CHROMA_PERSIST_DIR", "./chroma_db")
-EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-
-
-# Initialize embedding and Chroma stores (lazy init pattern)
+# Nothing is loaded at import time: the embedding model and the Chroma clients are
+# built on first use (or by warmup() at app startup) and shared by every request.
+_init_lock = threading.Lock()
 _embeddings = None
 _product_store = None
 _review_store = None
+_ready = False
+_warmup_error: Optional[str] = None
 
 
 def _get_embeddings():
     global _embeddings
     if _embeddings is None:
-        _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        with _init_lock:
+            if _embeddings is None:
+                # ONNX export when present (INFERENCE_RUNTIME, see ml/onnx_models.py), else PyTorch
+                if use_onnx(EMBEDDING_MODEL):
+                    _embeddings = OnnxSentenceEmbeddings(EMBEDDING_MODEL)
+                else:
+                    _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
     return _embeddings
 
 
@@ -85,7 +82,9 @@ def _get_product_store() -> Chroma:
     global _product_store
     if _product_store is None:
         emb = _get_embeddings()
-        _product_store = Chroma(collection_name=PRODUCT_COLLECTION, embedding_function=emb, persist_directory=PERSIST_DIR)
+        with _init_lock:
+            if _product_store is None:
+                _product_store = Chroma(collection_name=PRODUCT_COLLECTION, embedding_function=emb, persist_directory=PERSIST_DIR)
     return _product_store
 
 
@@ -93,9 +92,281 @@ def _get_review_store() -> Chroma:
     global _review_store
     if _review_store is None:
         emb = _get_embeddings()
-        _review_store = Chroma(collection_name=REVIEW_COLLECTION, embedding_function=emb, persist_directory=PERSIST_DIR)
+        with _init_lock:
+            if _review_store is None:
+                _review_store = Chroma(collection_name=REVIEW_COLLECTION, embedding_function=emb, persist_directory=PERSIST_DIR)
     return _review_store
 
+
+def warmup(stop: Optional[threading.Event] = None) -> Optional[Dict[str, Any]]:
+    """
+    Load the embedding model, open both collections (through the configured vector backend),
+    build the review index and (in hybrid mode) load the lexical index so the first request does not pay for it.
+    Safe to call more than once; called in the background from the FastAPI lifespan handler.
+    stop (set at shutdown) is checked between steps: warmup then returns None without finishing.
+
+    Returns a dict with the collection sizes.
+    """
+    global _ready, _warmup_error
+
+    def stopped() -> bool:
+        return stop is not None and stop.is_set()
+
+    try:
+        emb = _get_embeddings()
+        if stopped():
+            return None
+        # one forward pass so the model weights are paged in and any lazy setup has run
+        emb.embed_query("warmup")
+        counts = {
+            PRODUCT_COLLECTION: _get_backend(PRODUCT_COLLECTION).count(),
+            REVIEW_COLLECTION: _get_backend(REVIEW_COLLECTION).count(),
+        }
+        if stopped():
+            return None
+        _get_review_index()
+        if RETRIEVAL_MODE == "hybrid" and not stopped():
+            _get_lexical_index(PRODUCT_COLLECTION)
+        if stopped():
+            return None
+    except Exception as e:
+        _warmup_error = str(e)
+        raise
+    _warmup_error = None
+    _ready = True
+    return counts
+
+
+def readiness() -> Dict[str, Any]:
+    """Readiness status for health checks: whether warmup() has completed (and its last error, if any)."""
+    return {"ready": _ready, "error": _warmup_error}
+
+
+# -------------------------------
+# VECTOR BACKENDS
+# -------------------------------
+class VectorBackend(ABC):
+    """
+    The slice of a vector store the retrieval code uses. Implemented by ChromaBackend and by
+    ml.vector_index.NumpyVectorIndex (registered below: same method names and return shapes).
+    A subclass missing any method fails when it is created.
+    """
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored vectors."""
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int, where: Optional[dict] = None,
+              nprobe: Optional[int] = None) -> List[List[tuple]]:
+        """
+        One list per query embedding of (text, metadata, distance) tuples, nearest first.
+        nprobe trades recall for latency on backends with an ANN index (0/None = exact).
+        """
+
+    @abstractmethod
+    def get(self, ids: List[str]) -> List[tuple]:
+        """(id, text, metadata) for the ids that exist, in the order requested."""
+
+    @abstractmethod
+    def distances(self, query_embedding: List[float], ids: List[str]) -> Dict[str, float]:
+        """Distance from one query embedding to each stored id (same metric as query()); unknown ids are left out."""
+
+    @abstractmethod
+    def scan_metadatas(self, page_size: int = 10000):
+        """Yield (ids, metadatas) pages covering the whole collection (no documents, no embeddings)."""
+
+
+class ChromaBackend(VectorBackend):
+    def __init__(self, store: Chroma):
+        self.collection = store._collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def query(self, query_embeddings, n_results, where=None, nprobe=None):
+        # Chroma's HNSW search breadth is a per-collection setting (hnsw:search_ef), so nprobe is ignored
+        if not query_embeddings:
+            return []
+        res = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        out = []
+        for docs, metas, dists in zip(res["documents"], res["metadatas"], res["distances"]):
+            out.append([(doc, md or {}, float(dist)) for doc, md, dist in zip(docs, metas, dists)])
+        return out
+
+    def get(self, ids):
+        page = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        found = {i: (doc, md or {}) for i, doc, md in zip(page["ids"], page["documents"], page["metadatas"])}
+        return [(i, *found[i]) for i in ids if i in found]
+
+    def distances(self, query_embedding, ids):
+        page = self.collection.get(ids=list(ids), include=["embeddings"])
+        if not len(page["ids"]):
+            return {}
+        # Chroma's default "l2" space reports squared euclidean distance
+        diff = np.asarray(page["embeddings"], dtype=np.float32) - np.asarray(query_embedding, dtype=np.float32)
+        return dict(zip(page["ids"], (diff * diff).sum(axis=1).tolist()))
+
+    def scan_metadatas(self, page_size=10000):
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            ids = page["ids"]
+            if ids:
+                yield ids, [md or {} for md in page["metadatas"]]
+            if len(ids) < page_size:
+                return
+            offset += len(ids)
+
+
+# NumpyVectorIndex implements the interface without subclassing it (ml/vector_index.py doesn't depend on rag_engine)
+VectorBackend.register(NumpyVectorIndex)
+
+
+_backend_lock = threading.Lock()
+_backends: Dict[str, tuple] = {}  # collection -> (collection version it was opened at, backend)
+
+
+def _open_backend(collection_name: str):
+    if VECTOR_BACKEND == "numpy":
+        return NumpyVectorIndex.load(os.path.join(NUMPY_INDEX_DIR, collection_name))
+    store = _get_product_store() if collection_name == PRODUCT_COLLECTION else _get_review_store()
+    return ChromaBackend(store)
+
+
+def _get_backend(collection_name: str):
+    # Chroma sees its own writes; file-based indexes are re-opened when the collection version moves
+    version = _collection_versions.get(collection_name) if VECTOR_BACKEND != "chroma" else None
+    entry = _backends.get(collection_name)
+    if entry is None or entry[0] != version:
+        with _backend_lock:
+            entry = _backends.get(collection_name)
+            if entry is None or entry[0] != version:
+                entry = (version, _open_backend(collection_name))
+                _backends[collection_name] = entry
+    return entry[1]
+
+
+_lexical_indexes: Dict[str, tuple] = {}  # collection -> (collection version it was loaded at, LexicalIndex or None)
+
+
+def _get_lexical_index(collection_name: str) -> Optional[LexicalIndex]:
+    """The collection's BM25 index (re-loaded when the collection version moves), or None if none was built."""
+    version = _collection_versions.get(collection_name)
+    entry = _lexical_indexes.get(collection_name)
+    if entry is None or entry[0] != version:
+        with _backend_lock:
+            entry = _lexical_indexes.get(collection_name)
+            if entry is None or entry[0] != version:
+                path = os.path.join(LEXICAL_INDEX_DIR, collection_name)
+                index = None
+                if os.path.exists(os.path.join(path, LEXICAL_FILE)):
+                    index = LexicalIndex.load(path)
+                else:
+                    print(f"No lexical index at {path}; hybrid retrieval falls back to vector search")
+                entry = (version, index)
+                _lexical_indexes[collection_name] = entry
+    return entry[1]
+
+
+def _nprobe(nprobe: Optional[int]) -> int:
+    """Per-request nprobe, or the ANN_NPROBE default."""
+    return ANN_NPROBE if nprobe is None else int(nprobe)
+
+
+# -------------------------------
+# QUERY EMBEDDINGS (cached)
+# -------------------------------
+_embedding_cache = TTLCache(maxsize=EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Cache key / embedding input for a query: trimmed, whitespace-collapsed, lowercased.
+    all-MiniLM-L6-v2 uses an uncased tokenizer, so lowercasing does not change the embedding.
+    """
+    return _WHITESPACE.sub(" ", str(text)).strip().lower()
+
+
+def embed_queries(texts: List[str]) -> List[List[float]]:
+    """
+    Embed query texts, serving repeats from the embedding cache.
+    Cache misses are embedded together in one batched forward pass.
+    """
+    keys = [normalize_query(t) for t in texts]
+    vectors: List[Optional[List[float]]] = [_embedding_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, vec in zip(keys, vectors) if vec is None))
+    if missing:
+        fresh = dict(zip(missing, _get_embeddings().embed_documents(missing)))
+        for key, vec in fresh.items():
+            _embedding_cache.set(key, vec)
+        vectors = [vec if vec is not None else fresh[key] for key, vec in zip(keys, vectors)]
+    return vectors
+
+
+def embed_query(text: str) -> List[float]:
+    return embed_queries([text])[0]
+
+
+# -------------------------------
+# RESULT CACHE (versioned)
+# -------------------------------
+_result_cache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+# ml/embedder.py bumps collection_versions.json on ingest; drop every cached result when it changes
+_collection_versions = CollectionVersions(PERSIST_DIR, on_change=lambda versions: _result_cache.clear())
+
+
+def _result_key(kind: str, collection: str, *parts) -> tuple:
+    return (kind, _collection_versions.get(collection)) + parts
+
+
+def _cached_results(key: tuple, compute) -> List[Dict[str, Any]]:
+    """Serve key from the result cache or compute and store it. Returns fresh dicts so callers may mutate them."""
+    results = _result_cache.get(key)
+    if results is None:
+        results = compute()
+        _result_cache.set(key, results)
+    return [dict(r) for r in results]
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the retrieval caches."""
+    return {
+        "embeddings": _embedding_cache.stats(),
+        "results": _result_cache.stats(),
+        "collection_versions": {
+            PRODUCT_COLLECTION: _collection_versions.get(PRODUCT_COLLECTION),
+            REVIEW_COLLECTION: _collection_versions.get(REVIEW_COLLECTION),
+        },
+    }
+
+
+# -------------------------------
+# FUNCTION TO QUERY THE DB
+# -------------------------------
+def query_docs(query_text: str, top_k: int = 3):
+    """
+    Perform a similarity search on the product collection.
+    
+    Args:
+        query_text (str): The user's query.
+        top_k (int): Number of top documents to retrieve.
+    
+    Returns:
+        list of strings: Retrieved document texts.
+    """
+    hits = _get_backend(PRODUCT_COLLECTION).query([embed_query(query_text)], n_results=top_k, nprobe=_nprobe(None))[0]
+    return [text for text, _, _ in hits]
+
+# Product discovery: vector search in products collection
+# -------------------------
+
 def format_sentiment_summary(md: dict) -> str:
     """
     Returns a human-readable sentiment summary from metadata.
@@ -111,158 +382,400 @@ def format_sentiment_summary(md: dict) -> str:
         summary += f". Avg sentiment score: {round(avg_score, 2)}"
     return summary
 
-def get_top_products(query: str, k: int = 3) -> List[Dict[str, Any]]:
+def _to_product_result(text: str, md: dict, score: Optional[float]) -> Dict[str, Any]:
+    """Shape one product-collection hit into the dict returned by get_top_products."""
+    md = md or {}
+    return {
+        "product_id": md.get("product_id"),
+        "product_name": md.get("product_name"),
+        "snippet": text,
+        "metadata": md,
+        "score": score,
+        "sentiment_summary": format_sentiment_summary(md),
+        # product-level sentiment
+        "positive_count": md.get("positive_count"),
+        "neutral_count": md.get("neutral_count"),
+        "negative_count": md.get("negative_count"),
+        "positive_pct": md.get("positive_pct"),
+        "neutral_pct": md.get("neutral_pct"),
+        "negative_pct": md.get("negative_pct"),
+        "avg_sentiment_score": md.get("avg_sentiment_score"),
+        "num_reviews_used": md.get("num_reviews_used")
+    }
+
+
+def _to_review_result(text: str, md: dict, score: Optional[float]) -> Dict[str, Any]:
+    """Shape one review-collection hit into the dict returned by get_reviews_for_product."""
+    md = md or {}
+    label = md.get("review_sentiment_label")
+    sent_score = md.get("review_sentiment_score")
+    review_sent_summary = ""
+    if label or sent_score is not None:
+        review_sent_summary = f"Label: {label}, Score: {sent_score}" if label else f"Score: {sent_score}"
+    return {
+        "product_id": md.get("product_id"),
+        "product_name": md.get("product_name"),
+        "review_text": text,
+        "rating": md.get("rating"),
+        "metadata": md,
+        "score": score,
+        "review_sentiment_summary": review_sent_summary,
+        # per-review sentiment
+        "review_sentiment_label": label,
+        "review_sentiment_score": sent_score,
+        # product-level sentiment (if you want)
+        "positive_count": md.get("positive_count"),
+        "neutral_count": md.get("neutral_count"),
+        "negative_count": md.get("negative_count"),
+        "positive_pct": md.get("positive_pct"),
+        "neutral_pct": md.get("neutral_pct"),
+        "negative_pct": md.get("negative_pct"),
+        "avg_sentiment_score": md.get("avg_sentiment_score"),
+        "num_reviews_used": md.get("num_reviews_used")
+    }
+
+
+def _unique_product_hits(hits: List[tuple], k: int) -> List[tuple]:
+    """
+    Single pass over (text, metadata, distance) hits sorted nearest first:
+    keep the first, i.e. best scored, hit per product_id, up to k products.
+    """
+    seen = set()
+    unique = []
+    for hit in hits:
+        pid = hit[1].get("product_id")
+        if pid in seen:
+            continue
+        seen.add(pid)
+        unique.append(hit)
+        if len(unique) >= k:
+            break
+    return unique
+
+
+def _product_key(query: str, k: int, nprobe: int, mode: str) -> tuple:
+    return _result_key("products", PRODUCT_COLLECTION, normalize_query(query), k, nprobe, mode)
+
+
+def _retrieval_mode(mode: Optional[str]) -> str:
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"mode must be one of {RETRIEVAL_MODES}")
+    return mode
+
+
+def _review_key(product_id: Optional[str], product_name: Optional[str], k: int, order_by: str) -> tuple:
+    return _result_key("reviews", REVIEW_COLLECTION, product_id, product_name, k, order_by)
+
+
+def get_top_products(query: str, k: int = 3, nprobe: Optional[int] = None, mode: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Return top-k matching products for a user query using product_docs collection.
+    nprobe sets the IVF lists searched on an ANN index (default ANN_NPROBE; 0 = exact search).
+    mode "hybrid" fuses the vector hits with BM25 hits, so exact tokens ("16 GB", "magenta") count;
+    default RETRIEVAL_MODE. Results are cached per (query, k, nprobe, mode) until the products
+    collection is re-ingested.
 
     Returns a list of dicts:
       { "product_id": str, "product_name": str, "score": float, "snippet": str, "metadata": {...} }
     """
     if not query or not query.strip():
         return []
+    nprobe, mode = _nprobe(nprobe), _retrieval_mode(mode)
+    return _cached_results(_product_key(query, k, nprobe, mode), lambda: _search_products(query, k, nprobe, mode))
+
+
+def _initial_fetch_k(k: int) -> int:
+    return min(max(k * PRODUCT_FETCH_FACTOR, k), PRODUCT_MAX_FETCH_K)
 
-    store = _get_product_store()
-  
-    retriever = store.as_retriever(search_kwargs={"k": 20})
-    docs = retriever.get_relevant_documents(query)
-
-    results = []
-    for d in docs:
-        md = getattr(d, "metadata", {}) or {}
-        # Chroma doc content is in page_content
-        snippet = d.page_content if hasattr(d, "page_content") else str(d)
-        sentiment_summary = format_sentiment_summary(md)
-        # Some vectorstores include a 'score' in doc; Chroma via LangChain doc doesn't expose score directly.
-        # If you need scores, use chromadb client directly. For now, we return None for score.
-        results.append({
-            "product_id": md.get("product_id"),
-            "product_name": md.get("product_name"),
-            "snippet": snippet,
-            "metadata": md,
-            "score": None,
-            "sentiment_summary": sentiment_summary, 
-             # product-level sentiment
-            "positive_count": md.get("positive_count"),
-            "neutral_count": md.get("neutral_count"),
-            "negative_count": md.get("negative_count"),
-            "positive_pct": md.get("positive_pct"),
-            "neutral_pct": md.get("neutral_pct"),
-            "negative_pct": md.get("negative_pct"),
-            "avg_sentiment_score": md.get("avg_sentiment_score"),
-            "num_reviews_used": md.get("num_reviews_used")
-        })
-        
-    #print(results)
-    df = pd.DataFrame(results)
-
-        # Drop duplicate product_ids, keeping the best (lowest) score
-    df = df.sort_values("score", ascending=True).drop_duplicates(subset=["product_id"], keep="first")
-
-        # Return top unique 3 products
-    top_results = df.head(k).to_dict(orient="records")
-
-    return top_results
-
-def get_reviews_for_product(product_id: Optional[str] = None, product_name: Optional[str] = None, k: int = 5) -> List[Dict[str, Any]]:
+
+def _search_products_by_vector(query_vec: List[float], k: int, hits: Optional[List[tuple]] = None,
+                               fetch_k: Optional[int] = None, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Scored top-k unique products for one query vector. Starts from a small candidate pool
+    and doubles it only while fewer than k unique products come back and the collection has more.
+    hits/fetch_k let batch callers pass in the result of an already-run first query.
+    """
+    backend = _get_backend(PRODUCT_COLLECTION)
+    if fetch_k is None:
+        fetch_k = _initial_fetch_k(k)
+    while True:
+        if hits is None:
+            hits = backend.query([query_vec], n_results=fetch_k, nprobe=_nprobe(nprobe))[0]
+        unique = _unique_product_hits(hits, k)
+        exhausted = len(hits) < fetch_k
+        if len(unique) >= k or exhausted or fetch_k >= PRODUCT_MAX_FETCH_K:
+            break
+        fetch_k = min(fetch_k * 2, PRODUCT_MAX_FETCH_K)
+        hits = None
+    # score is the collection distance: lower means closer
+    return [_to_product_result(text, md, dist) for text, md, dist in unique]
+
+
+def _search_products_hybrid(query: str, query_vec: List[float], k: int, hits: Optional[List[tuple]] = None,
+                            fetch_k: Optional[int] = None, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Top-k unique products by reciprocal-rank fusion of the vector hits (the initial fetch_k pool,
+    never widened) and the HYBRID_LEXICAL_K best BM25 chunks. Products come back in fused order;
+    score stays the vector distance (computed exactly for chunks only the lexical side found).
+    Falls back to vector search without a lexical index, and tops up from it if fusion finds < k products.
+    """
+    lexical = _get_lexical_index(PRODUCT_COLLECTION)
+    if lexical is None:
+        return _search_products_by_vector(query_vec, k, hits=hits, fetch_k=fetch_k, nprobe=nprobe)
+    backend = _get_backend(PRODUCT_COLLECTION)
+    if fetch_k is None:
+        fetch_k = _initial_fetch_k(k)
+    if hits is None:
+        hits = backend.query([query_vec], n_results=fetch_k, nprobe=_nprobe(nprobe))[0]
+
+    fused: Dict[str, list] = {}  # chunk -> [rrf score, (text, metadata, distance)]
+    for rank, hit in enumerate(hits):
+        fused[hit[1].get("chunk_id") or hit[0]] = [1.0 / (HYBRID_RRF_K + rank + 1), hit]
+    lexical_ids = [chunk_id for chunk_id, _ in lexical.search(query, HYBRID_LEXICAL_K)]
+    lexical_rank = {chunk_id: rank for rank, chunk_id in enumerate(lexical_ids)}
+    lexical_only = []
+    for chunk_id, text, md in backend.get(lexical_ids):
+        key = md.get("chunk_id") or text
+        if key not in fused:
+            fused[key] = [0.0, (text, md, None)]
+            lexical_only.append((chunk_id, key))
+        fused[key][0] += 1.0 / (HYBRID_RRF_K + lexical_rank[chunk_id] + 1)
+    if lexical_only:
+        dists = backend.distances(query_vec, [chunk_id for chunk_id, _ in lexical_only])
+        for chunk_id, key in lexical_only:
+            text, md, _ = fused[key][1]
+            fused[key][1] = (text, md, dists.get(chunk_id))
+
+    ranked = [hit for _, hit in sorted(fused.values(), key=lambda e: -e[0])]
+    results = [_to_product_result(text, md, dist) for text, md, dist in _unique_product_hits(ranked, k)]
+    if len(results) < k:
+        seen = {r["product_id"] for r in results}
+        for r in _search_products_by_vector(query_vec, k, nprobe=nprobe):
+            if r["product_id"] not in seen and len(results) < k:
+                seen.add(r["product_id"])
+                results.append(r)
+    return results
+
+
+def _search_products(query: str, k: int, nprobe: Optional[int] = None, mode: str = "vector") -> List[Dict[str, Any]]:
+    if mode == "hybrid":
+        return _search_products_hybrid(query, embed_query(query), k, nprobe=nprobe)
+    return _search_products_by_vector(embed_query(query), k, nprobe=nprobe)
+
+# -------------------------------
+# REVIEW INDEX (product -> review chunks, no vector search)
+# -------------------------------
+# Built from a metadata-only scan of the reviews collection (at warmup, and again whenever the
+# collection version changes). Review lookups by product_id / exact product_name read the top-k
+# chunk ids from here and fetch just those documents.
+REVIEW_ORDERINGS = ("rating", "sentiment", "recency")
+_INDEX_PAGE_SIZE = 10000
+_review_index: Optional[Dict[str, Any]] = None
+_review_index_lock = threading.Lock()
+
+
+def _sentiment_polarity(md: dict) -> Optional[float]:
+    """Signed review sentiment: +score for positive, -score for negative, 0 for neutral."""
+    score = md.get("review_sentiment_score")
+    if score is None:
+        return None
+    label = (md.get("review_sentiment_label") or "").lower()
+    if label == "negative":
+        return -float(score)
+    if label == "neutral":
+        return 0.0
+    return float(score)
+
+
+def _rank_review_ids(entries: List[tuple], order_by: str) -> List[str]:
+    """
+    entries: (chunk id, metadata, ingest position) for one product. Returns ids best first;
+    reviews missing the sort field go last.
+      rating:    highest rating first, ties broken by sentiment
+      sentiment: most positive first
+      recency:   newest review_date first; without dates, later-ingested chunks count as newer
+    """
+    def _sort_field(md):
+        if order_by == "rating":
+            return md.get("rating")
+        if order_by == "sentiment":
+            return _sentiment_polarity(md)
+        return md.get("review_date")
+
+    present = [e for e in entries if _sort_field(e[1]) is not None]
+    missing = [e for e in entries if _sort_field(e[1]) is None]
+    if order_by == "rating":
+        present.sort(key=lambda e: (-float(e[1]["rating"]), -(_sentiment_polarity(e[1]) or 0.0), e[2]))
+    elif order_by == "sentiment":
+        present.sort(key=lambda e: (-_sentiment_polarity(e[1]), e[2]))
+    else:
+        present.sort(key=lambda e: (str(e[1]["review_date"]), e[2]), reverse=True)
+    missing.sort(key=lambda e: -e[2] if order_by == "recency" else e[2])
+    return [e[0] for e in present + missing]
+
+
+def _build_review_index(backend) -> Dict[str, Any]:
+    """Scan review metadata (no documents, no embeddings) and rank each product's chunks per ordering."""
+    by_field: Dict[str, Dict[str, List[tuple]]] = {"product_id": {}, "product_name": {}}
+    pos = 0
+    for ids, metadatas in backend.scan_metadatas(_INDEX_PAGE_SIZE):
+        for chunk_id, md in zip(ids, metadatas):
+            for field, groups in by_field.items():
+                value = md.get(field)
+                if value is not None:
+                    groups.setdefault(value, []).append((chunk_id, md, pos))
+            pos += 1
+
+    index = {}
+    for field, groups in by_field.items():
+        index[field] = {
+            value: {order: _rank_review_ids(entries, order) for order in REVIEW_ORDERINGS}
+            for value, entries in groups.items()
+        }
+    return index
+
+
+def _get_review_index() -> Dict[str, Any]:
+    global _review_index
+    version = _collection_versions.get(REVIEW_COLLECTION)
+    if _review_index is None or _review_index["version"] != version:
+        with _review_index_lock:
+            if _review_index is None or _review_index["version"] != version:
+                _review_index = {"version": version, **_build_review_index(_get_backend(REVIEW_COLLECTION))}
+    return _review_index
+
+
+def _lookup_indexed_reviews(product_id: Optional[str], product_name: Optional[str], k: int,
+                            order_by: str) -> List[Dict[str, Any]]:
+    """Top-k reviews straight from the review index; [] for a product_id / product_name that matches no product."""
+    index = _get_review_index()
+    if product_id:
+        ranked = index["product_id"].get(product_id)
+    else:
+        ranked = index["product_name"].get(product_name)
+    if ranked is None:
+        return []
+    ids = ranked[order_by][:k]
+    if not ids:
+        return []
+    # score is None: these are exact product matches ranked by order_by, not similarity hits
+    return [_to_review_result(text, md, None) for _, text, md in _get_backend(REVIEW_COLLECTION).get(ids)]
+
+
+def get_reviews_for_product(product_id: Optional[str] = None, product_name: Optional[str] = None, k: int = 5,
+                            order_by: str = "rating") -> List[Dict[str, Any]]:
     """
     Return top-k review snippets for a product. Provide either product_id or product_name.
 
     Results: list of dicts:
       { "review_text": str, "rating": Optional[float], "metadata": {...}, "score": Optional[float] }
 
-    If product_id provided, we use Chroma's metadata filtering (if supported).
-    If metadata filtering is not supported by your Chroma version, this falls back to retrieving top-k nearest and filtering client-side.
+    Lookups by product_id or exact product_name are answered from the review index, ranked by order_by
+    ("rating", "sentiment" or "recency"); a product that matches neither gets []. Results are cached
+    per (product_id, product_name, k, order_by) until the reviews collection is re-ingested.
     """
     if not product_id and not product_name:
         raise ValueError("Provide product_id or product_name")
+    if order_by not in REVIEW_ORDERINGS:
+        raise ValueError(f"order_by must be one of {REVIEW_ORDERINGS}")
+    return _cached_results(_review_key(product_id, product_name, k, order_by),
+                           lambda: _lookup_indexed_reviews(product_id, product_name, k, order_by))
 
-    store = _get_review_store()
-    # Attempt metadata filtering if available
-    try:
-        # langchain's Chroma supports metadata filters via retriever.as_retriever(...) with search_kwargs filter param in some versions.
-        # We'll try a straightforward approach: use the client's query interface if available.
-        search_kwargs = {"k": k}
-
-        # Add metadata filter if product_id exists
-        if product_id:
-            search_kwargs["filter"] = {"product_id": product_id}
-        retriever = store.as_retriever(search_kwargs=search_kwargs)
-        # If product_id is provided, we try to filter manually by retrieving more and filtering.
-        # print(f'for product {product_id}')
-        docs = retriever.get_relevant_documents(product_name if product_name else product_id)
-        filtered = []
-        for d in docs:
-            md = getattr(d, "metadata", {}) or {}
-            review_sent_summary = ""
-            label = md.get("review_sentiment_label")
-            score = md.get("review_sentiment_score")
-            if label or score is not None:
-                review_sent_summary = f"Label: {label}, Score: {score}" if label else f"Score: {score}"
-
-            # print(md.get("product_id"))
-            if product_id and md.get("product_id") == product_id:
-                filtered.append(d)
-            elif product_name and md.get("product_name") == product_name:
-                filtered.append(d)
-            # stop when reached k
-            if len(filtered) >= k:
-                break
-
-        # If we didn't find enough via naive retriever search, do a broader search and filter
-        if len(filtered) < k:
-            # Do another retrieval with higher k
-            docs_more = retriever.get_relevant_documents(product_name if product_name else product_id)
-            for d in docs_more:
-                md = getattr(d, "metadata", {}) or {}
-                if product_id and md.get("product_id") == product_id:
-                    if d not in filtered:
-                        filtered.append(d)
-                    if len(filtered) >= k:
-                        break
-                elif product_name and md.get("product_name") == product_name:
-                    if d not in filtered:
-                        filtered.append(d)
-                    if len(filtered) >= k:
-                        break
-
-        results = []
-        for d in filtered[:k]:
-            md = getattr(d, "metadata", {}) or {}
-            results.append({
-                "review_text": d.page_content,
-                "rating": md.get("rating"),
-                "metadata": md,
-                "score": None,
-                "review_sentiment_summary": review_sent_summary,
-                # per-review sentiment
-                "review_sentiment_label": md.get("review_sentiment_label"),
-                "review_sentiment_score": md.get("review_sentiment_score"),
-                # product-level sentiment (if you want)
-                "positive_count": md.get("positive_count"),
-                "neutral_count": md.get("neutral_count"), 
-                "negative_count": md.get("negative_count"),
-                "positive_pct": md.get("positive_pct"),
-                "neutral_pct": md.get("neutral_pct"),
-                "negative_pct": md.get("negative_pct"),
-                "avg_sentiment_score": md.get("avg_sentiment_score"),
-                "num_reviews_used": md.get("num_reviews_used")
-            })
-        return results
+# -------------------------------
+# BATCH RETRIEVAL
+# -------------------------------
+def _group_by_nprobe(positions: List[int], items: List[Dict[str, Any]]) -> Dict[int, List[int]]:
+    groups: Dict[int, List[int]] = {}
+    for i in positions:
+        groups.setdefault(_nprobe(items[i].get("nprobe")), []).append(i)
+    return groups
 
-    except Exception as e:
-        # Fall back: simple retrieval and filter client-side
-        print("Warning: metadata-filter retrieval raised exception, falling back. Error:", e)
-        docs = store.similarity_search(product_name if product_name else "", k=50)
-        filtered = []
-        for d in docs:
-            md = getattr(d, "metadata", {}) or {}
-            if product_id and md.get("product_id") == product_id:
-                filtered.append(d)
-            elif product_name and md.get("product_name") == product_name:
-                filtered.append(d)
-            if len(filtered) >= k:
-                break
-        return [{"review_text": d.page_content, "rating": d.metadata.get("rating"), "metadata": d.metadata, "score": None} for d in filtered[:k]]
+
+def batch_retrieve(product_queries: Optional[List[Dict[str, Any]]] = None,
+                   review_lookups: Optional[List[Dict[str, Any]]] = None) -> Dict[str, List[List[Dict[str, Any]]]]:
+    """
+    Answer many product queries and review lookups with a single batched embedding pass.
+    Review lookups by product are served from the review index and need no embedding.
+
+    Args:
+        product_queries: list of {"query": str, "k": int, "nprobe": Optional[int], "mode": Optional[str]}
+        review_lookups: list of {"product_id": Optional[str], "product_name": Optional[str], "k": int,
+                                 "order_by": Optional[str]}
+
+    Returns:
+        {"products": [...], "reviews": [...]} with one result list per input item, in input order.
+        Items are shaped like get_top_products / get_reviews_for_product results.
+    """
+    product_queries = product_queries or []
+    review_lookups = review_lookups or []
+
+    # Collect every distinct text that needs an embedding, so duplicates are embedded once
+    texts: List[str] = []
+    slots: Dict[str, int] = {}
+
+    def _slot(text: str) -> int:
+        if text not in slots:
+            slots[text] = len(texts)
+            texts.append(text)
+        return slots[text]
+
+    # Items already in the result cache skip embedding and search entirely
+    product_results: List[Optional[List[Dict[str, Any]]]] = [None] * len(product_queries)
+    product_keys = []
+    product_slots = []
+    for i, q in enumerate(product_queries):
+        query = (q.get("query") or "").strip()
+        mode = _retrieval_mode(q.get("mode"))
+        key = _product_key(query, int(q.get("k", 3)), _nprobe(q.get("nprobe")), mode) if query else None
+        cached = _result_cache.get(key) if key else None
+        if not query:
+            product_results[i] = []
+        elif cached is not None:
+            product_results[i] = [dict(r) for r in cached]
+        product_keys.append(key)
+        product_slots.append(_slot(query) if product_results[i] is None else None)
+
+    # Review lookups are answered from the review index: no embedding
+    review_results: List[List[Dict[str, Any]]] = []
+    for i, r in enumerate(review_lookups):
+        product_id, product_name = r.get("product_id"), r.get("product_name")
+        if not product_id and not product_name:
+            raise ValueError(f"review_lookups[{i}]: provide product_id or product_name")
+        k, order_by = int(r.get("k", 5)), r.get("order_by") or "rating"
+        if order_by not in REVIEW_ORDERINGS:
+            raise ValueError(f"review_lookups[{i}]: order_by must be one of {REVIEW_ORDERINGS}")
+        key = _review_key(product_id, product_name, k, order_by)
+        cached = _result_cache.get(key)
+        if cached is None:
+            cached = _lookup_indexed_reviews(product_id, product_name, k, order_by)
+            _result_cache.set(key, cached)
+        review_results.append([dict(x) for x in cached])
+
+    vectors = embed_queries(texts) if texts else []
+
+    # one batched vector query per nprobe setting
+    active = [i for i, s in enumerate(product_slots) if s is not None]
+    for nprobe, group in _group_by_nprobe(active, product_queries).items():
+        fetch_k = _initial_fetch_k(max(int(product_queries[i].get("k", 3)) for i in group))
+        hits = _get_backend(PRODUCT_COLLECTION).query([vectors[product_slots[i]] for i in group], n_results=fetch_k,
+                                                      nprobe=nprobe)
+        for i, query_hits in zip(group, hits):
+            k = int(product_queries[i].get("k", 3))
+            if _retrieval_mode(product_queries[i].get("mode")) == "hybrid":
+                # fusion depends on the vector pool size: use this query's own pool (as get_top_products
+                # does), not the group's largest, so the cached result doesn't depend on the batch
+                own_k = _initial_fetch_k(k)
+                results = _search_products_hybrid(product_queries[i]["query"].strip(), vectors[product_slots[i]], k,
+                                                  hits=query_hits[:own_k], fetch_k=own_k, nprobe=nprobe)
+            else:
+                # queries short on unique products widen individually
+                results = _search_products_by_vector(vectors[product_slots[i]], k,
+                                                     hits=query_hits, fetch_k=fetch_k, nprobe=nprobe)
+            _result_cache.set(product_keys[i], results)
+            product_results[i] = [dict(r) for r in results]
+
+    return {"products": product_results, "reviews": review_results}
 
 # -------------------------------
 # OPTIONAL: QUICK TEST
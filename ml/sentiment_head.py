@@ -0,0 +1,230 @@
+# sentiment_head.py
+# Sentiment from the MiniLM retrieval embeddings: a multinomial logistic-regression head trained on the
+# BART zero-shot labels. Scoring a review costs one MiniLM embedding (already computed at ingest) plus a
+# 384x3 matrix product, instead of one BART-MNLI pass per label.
+#
+# Train (run from the repo root):
+#   python -m ml.sentiment_head --input data/processed/sentiment_data
+#   python -m ml.sentiment_head --index chroma_db/numpy/reviews_with_sentiment   # reuse the stored vectors
+# Then SENTIMENT_BACKEND=embedding-head (sentiment_model.get_classifier), or ml/embedder.py --label_sentiment.
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from ml import onnx_models
+    from ml.data_loader import read_table
+except ImportError:  # imported as a top-level module by scripts run from ml/ (analyze_reviews.py)
+    import onnx_models
+    from data_loader import read_table
+
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HEAD_PATH = os.environ.get("SENTIMENT_HEAD_PATH", os.path.join(_REPO_ROOT, "models", "sentiment_head.npz"))
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LABELS = ("positive", "neutral", "negative")
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    # stored and freshly computed MiniLM vectors are both unit length; normalizing again makes the head
+    # indifferent to which embedder (PyTorch / ONNX, normalized or not) produced its input
+    return mat / np.clip(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12, None)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class SentimentHead:
+    """Linear softmax head over L2-normalized sentence embeddings: probs = softmax(x @ weights + bias)."""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: Sequence[str], embedding_model: str):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = list(labels)
+        self.embedding_model = embedding_model
+
+    @property
+    def fingerprint(self) -> str:
+        """Short hash of the parameters: identifies this head in the sentiment result cache."""
+        h = hashlib.sha1(self.weights.tobytes())
+        h.update(self.bias.tobytes())
+        return h.hexdigest()[:12]
+
+    def predict_proba(self, embeddings) -> np.ndarray:
+        x = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(-1, self.weights.shape[0]))
+        return _softmax(x @ self.weights + self.bias)
+
+    def predict(self, embeddings) -> List[dict]:
+        """[{"label", "score"}] (top label and its probability) per embedding."""
+        probs = self.predict_proba(embeddings)
+        top = probs.argmax(axis=1)
+        return [{"label": self.labels[j], "score": float(probs[i, j])} for i, j in enumerate(top)]
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, weights=self.weights, bias=self.bias, labels=np.array(self.labels),
+                     embedding_model=np.array(self.embedding_model))
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "SentimentHead":
+        path = path or HEAD_PATH
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No sentiment head at {path}; train one with python -m ml.sentiment_head")
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], data["labels"].tolist(), str(data["embedding_model"]))
+
+
+def train_head(embeddings, labels: Sequence[str], label_names: Sequence[str] = LABELS, l2: float = 1e-3,
+               epochs: int = 500, lr: float = 2.0, balanced: bool = True,
+               embedding_model: str = EMBEDDING_MODEL) -> SentimentHead:
+    """
+    Fit the head by full-batch gradient descent on the (L2-regularized) cross-entropy.
+    balanced=True weights each class by n / (classes * class count), so the ~90% positive majority
+    doesn't drown out neutral and negative reviews.
+    """
+    x = _normalize(np.asarray(embeddings, dtype=np.float32))
+    index = {name: i for i, name in enumerate(label_names)}
+    y = np.array([index[label] for label in labels])
+    n, dim = x.shape
+    k = len(label_names)
+    onehot = np.eye(k, dtype=np.float32)[y]
+    counts = np.bincount(y, minlength=k).astype(np.float32)
+    class_weight = n / (k * np.clip(counts, 1, None)) if balanced else np.ones(k, dtype=np.float32)
+    sample_weight = (class_weight[y] / class_weight[y].sum())[:, None]
+
+    weights = np.zeros((dim, k), dtype=np.float32)
+    bias = np.zeros(k, dtype=np.float32)
+    for _ in range(epochs):
+        grad = (_softmax(x @ weights + bias) - onehot) * sample_weight
+        weights -= lr * (x.T @ grad + l2 * weights)
+        bias -= lr * grad.sum(axis=0)
+    return SentimentHead(weights, bias, label_names, embedding_model)
+
+
+def load_embeddings(model_name: str = EMBEDDING_MODEL, device: int = -1, onnx: Optional[bool] = None):
+    """The embedding model the head reads: its ONNX export when one exists (INFERENCE_RUNTIME), else PyTorch."""
+    if onnx is None:
+        onnx = onnx_models.use_onnx(model_name, device=device)
+    if onnx:
+        return onnx_models.OnnxSentenceEmbeddings(model_name)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cuda" if device >= 0 else "cpu"})
+
+
+class EmbeddingHeadClassifier:
+    """
+    The head behind the zero-shot pipeline's call/return shape (sentiment_model backend "embedding-head"):
+    texts are embedded with the head's MiniLM model, then classified by the head.
+    """
+
+    def __init__(self, head: SentimentHead, embeddings):
+        self.head = head
+        self.embeddings = embeddings
+
+    def classify_embeddings(self, vectors, candidate_labels, multi_label=False):
+        probs = self.head.predict_proba(vectors)
+        columns = [self.head.labels.index(l.lower()) if l.lower() in self.head.labels else None
+                   for l in candidate_labels]
+        results = []
+        for row in probs:
+            scores = [float(row[c]) if c is not None else 0.0 for c in columns]
+            if not multi_label:
+                total = sum(scores) or 1.0
+                scores = [s / total for s in scores]
+            ranked = sorted(zip(candidate_labels, scores), key=lambda x: -x[1])
+            results.append({"labels": [l for l, _ in ranked], "scores": [s for _, s in ranked]})
+        return results
+
+    def __call__(self, texts, candidate_labels, multi_label=False, **kwargs):
+        single = isinstance(texts, str)
+        vectors = self.embeddings.embed_documents([texts] if single else list(texts))
+        results = self.classify_embeddings(vectors, candidate_labels, multi_label)
+        return results[0] if single else results
+
+
+# -------------------------------
+# TRAINING DATA
+# -------------------------------
+def _from_csv(path, text_col, label_col, model_name, batch_size=256):
+    df = read_table(path, columns=[text_col, label_col])
+    df = df[df[label_col].astype(str).str.lower().isin(LABELS)]
+    texts = df[text_col].fillna("").astype(str).tolist()
+    emb = load_embeddings(model_name)
+    vectors = []
+    for b in range(0, len(texts), batch_size):
+        vectors.extend(emb.embed_documents(texts[b:b + batch_size]))
+    return np.asarray(vectors, dtype=np.float32), df[label_col].str.lower().tolist()
+
+
+def _from_index(path, label_field="review_sentiment_label", source_field="review_sentiment_source"):
+    # the NumPy export of the reviews collection (ml/embedder.py --export_numpy): vectors are reused as stored.
+    # Labels the head itself filled in (embedder.py --label_sentiment) are skipped: train on teacher labels only
+    try:
+        from ml.vector_index import NumpyVectorIndex
+    except ImportError:
+        from vector_index import NumpyVectorIndex
+    index = NumpyVectorIndex.load(path)
+    labels = [str(v or "").lower() for v in index.column_values(label_field)]
+    sources = index.column_values(source_field)
+    rows = [i for i, (label, source) in enumerate(zip(labels, sources)) if label in LABELS and source != "embedding-head"]
+    return np.asarray(index.vectors[rows], dtype=np.float32), [labels[i] for i in rows]
+
+
+def _split(n, holdout, seed):
+    order = np.random.default_rng(seed).permutation(n)
+    cut = int(n * holdout)
+    return order[cut:], order[:cut]
+
+
+def evaluate(head: SentimentHead, embeddings, labels: Sequence[str]) -> dict:
+    predicted = np.array([p["label"] for p in head.predict(embeddings)])
+    labels = np.asarray(labels)
+    return {
+        "n": int(len(labels)),
+        "agreement": round(float((predicted == labels).mean()), 4),
+        # share of each BART label the head reproduces
+        "agreement_by_label": {l: round(float((predicted[labels == l] == l).mean()), 3)
+                               for l in head.labels if (labels == l).any()},
+        "label_counts": {l: int((predicted == l).sum()) for l in head.labels},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the embedding sentiment head on the BART labels")
+    parser.add_argument("--input", "-i", default="data/processed/sentiment_data", help="Table with texts and labels (embedded here)")
+    parser.add_argument("--index", default=None, help="Train on the vectors of this NumPy index export instead of --input")
+    parser.add_argument("--text_col", default="reviews.text")
+    parser.add_argument("--label_col", default="sentiment_label")
+    parser.add_argument("--embedding_model", default=EMBEDDING_MODEL)
+    parser.add_argument("--output", "-o", default=HEAD_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of rows held out for the agreement report")
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--no_balance", action="store_true", help="Don't reweight classes by frequency")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.index:
+        X, y = _from_index(args.index)
+    else:
+        X, y = _from_csv(args.input, args.text_col, args.label_col, args.embedding_model)
+    y = np.asarray(y)
+    print(f"{len(y)} labeled vectors; labels: {dict(zip(*np.unique(y, return_counts=True)))}")
+    train_rows, test_rows = _split(len(y), args.holdout, args.seed)
+    model_name = onnx_models.hub_name(args.embedding_model)
+    head = train_head(X[train_rows], y[train_rows], l2=args.l2, epochs=args.epochs,
+                      balanced=not args.no_balance, embedding_model=model_name)
+    if len(test_rows):
+        print("held-out:", json.dumps(evaluate(head, X[test_rows], y[test_rows])))
+    # the saved head is refit on every row
+    head = train_head(X, y, l2=args.l2, epochs=args.epochs, balanced=not args.no_balance, embedding_model=model_name)
+    head.save(args.output)
+    print(f"Saved sentiment head ({head.fingerprint}) -> {args.output}")
@@ -1,39 +1,438 @@
 # sentiment_model.py
-# Zero-shot classifier for 3-label sentiment: positive / neutral / negative
-from transformers import pipeline
-import torch
+# 3-label sentiment (positive / neutral / negative) behind pluggable backends:
+#   zero-shot  - facebook/bart-large-mnli zero-shot classification (one NLI pass per text x label)
+#   sentiment  - a small dedicated 3-class sentiment model (one forward pass per text)
+#   lexicon    - word-list baseline, no model at all
+#   embedding-head - logistic regression on the MiniLM retrieval embeddings (ml/sentiment_head.py)
+#   cascade    - a cheap backend labels everything; only low-confidence texts go to the zero-shot model
+import hashlib
+import math
+import os
+import re
+import sqlite3
 
-def get_classifier(device=None, model_name="facebook/bart-large-mnli"):
+try:
+    from ml import onnx_models, sentiment_head
+except ImportError:  # imported as a top-level module by scripts run from ml/ (analyze_reviews.py)
+    import onnx_models
+    import sentiment_head
+
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_BACKEND = os.environ.get("SENTIMENT_BACKEND", "zero-shot")
+# default SentimentCache file (analyze_reviews.py --cache): under data/cache, not the working directory
+CACHE_PATH = os.environ.get("SENTIMENT_CACHE_PATH", os.path.join(_REPO_ROOT, "data", "cache", "sentiment_cache.sqlite"))
+DEFAULT_MODELS = {
+    "zero-shot": "facebook/bart-large-mnli",
+    "sentiment": "cardiffnlp/twitter-roberta-base-sentiment-latest",
+    "lexicon": None,
+    "embedding-head": sentiment_head.EMBEDDING_MODEL,
+    "cascade": "facebook/bart-large-mnli",
+}
+# cascade: texts the fast backend labels with a top score below the threshold are re-classified by the full model
+CASCADE_FAST_BACKEND = os.environ.get("SENTIMENT_CASCADE_FAST", "lexicon")
+CASCADE_THRESHOLD = float(os.environ.get("SENTIMENT_CASCADE_THRESHOLD", "0.9"))
+# generic LABEL_i names of 3-class sentiment heads, in the usual id order
+_INDEXED_LABELS = ("negative", "neutral", "positive")
+# Dynamic batching (analyze_texts): texts are sorted by token length and packed into batches of at
+# most max_tokens padded tokens (sequences x longest sequence), so short reviews aren't padded to long ones.
+# Without max_tokens the budget is batch_size * TOKENS_PER_ITEM per sequence the model sees.
+TOKENS_PER_ITEM = 128
+MAX_BATCH_ITEMS = 256
+# zero-shot pairs every text with a hypothesis ("This example is positive.")
+HYPOTHESIS_TOKENS = 8
+
+
+def _default_device():
+    # torch / transformers are imported only by the backends that run a Hugging Face model:
+    # lexicon, embedding-head (ONNX) and cascade's fast path work without them
+    try:
+        import torch
+    except ImportError:
+        return -1
+    return 0 if torch.cuda.is_available() else -1
+
+
+def _zero_shot_classifier(model_name, device, onnx=False):
+    if onnx:
+        return onnx_models.onnx_pipeline("zero-shot-classification", model_name)
+    from transformers import pipeline
+    return pipeline("zero-shot-classification", model=model_name, device=device)
+
+
+class TextClassificationAdapter:
+    """
+    Wraps a text-classification pipeline so it is called and answers like the zero-shot pipeline:
+    classifier(texts, candidate_labels, multi_label=False) -> [{"labels": [...], "scores": [...]}, ...],
+    labels sorted by score. Model labels are matched to candidate labels by name (or LABEL_0/1/2).
+    """
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.tokenizer = pipe.tokenizer
+
+    def _label(self, name):
+        name = name.lower()
+        if name.startswith("label_") and name[6:].isdigit() and int(name[6:]) < len(_INDEXED_LABELS):
+            return _INDEXED_LABELS[int(name[6:])]
+        return name
+
+    def __call__(self, texts, candidate_labels, multi_label=False, **kwargs):
+        single = isinstance(texts, str)
+        outputs = self.pipe([texts] if single else list(texts), top_k=None, truncation=True, **kwargs)
+        results = []
+        for out in outputs:
+            by_label = {self._label(o["label"]): float(o["score"]) for o in out}
+            scores = [by_label.get(label.lower(), 0.0) for label in candidate_labels]
+            if not multi_label:
+                total = sum(scores) or 1.0
+                scores = [s / total for s in scores]
+            ranked = sorted(zip(candidate_labels, scores), key=lambda x: -x[1])
+            results.append({"labels": [l for l, _ in ranked], "scores": [s for _, s in ranked]})
+        return results[0] if single else results
+
+
+def _sentiment_classifier(model_name, device, onnx=False):
+    if onnx:
+        return TextClassificationAdapter(onnx_models.onnx_pipeline("text-classification", model_name))
+    from transformers import pipeline
+    return TextClassificationAdapter(pipeline("text-classification", model=model_name, device=device))
+
+
+# Small general-purpose review lexicon; weights are rough polarity strengths
+_POSITIVE_WORDS = {
+    "good": 1.0, "great": 1.5, "excellent": 2.0, "amazing": 2.0, "awesome": 2.0, "love": 1.5, "loves": 1.5,
+    "loved": 1.5, "perfect": 2.0, "best": 1.5, "nice": 1.0, "happy": 1.0, "easy": 0.8, "fast": 0.8,
+    "recommend": 1.2, "fantastic": 2.0, "wonderful": 2.0, "enjoy": 1.0, "enjoys": 1.0, "works": 0.6,
+    "worth": 1.0, "pleased": 1.2, "satisfied": 1.2, "fun": 1.0, "beautiful": 1.2, "reliable": 1.0,
+    "helpful": 1.0, "favorite": 1.2, "quality": 0.5, "glad": 1.0, "like": 0.6, "likes": 0.6, "solid": 0.8,
+}
+_NEGATIVE_WORDS = {
+    "bad": 1.2, "poor": 1.5, "terrible": 2.0, "awful": 2.0, "worst": 2.0, "hate": 1.8, "broken": 1.5,
+    "broke": 1.5, "disappointed": 1.5, "disappointing": 1.5, "slow": 1.0, "problem": 1.0, "problems": 1.0,
+    "issue": 0.8, "issues": 0.8, "return": 0.8, "returned": 1.2, "waste": 1.8, "useless": 1.8, "junk": 2.0,
+    "cheap": 0.8, "difficult": 1.0, "hard": 0.6, "frustrating": 1.5, "defective": 2.0, "stopped": 1.0,
+    "annoying": 1.2, "fails": 1.5, "failed": 1.5, "crash": 1.2, "crashes": 1.2, "refund": 1.2, "sucks": 1.8,
+}
+_NEGATIONS = {"not", "no", "never", "dont", "don't", "didnt", "didn't", "isnt", "isn't", "wasnt", "wasn't",
+              "doesnt", "doesn't", "cant", "can't", "wont", "won't", "nothing", "hardly"}
+_WORD = re.compile(r"[a-z']+")
+
+
+class LexiconClassifier:
+    """
+    Word-list polarity baseline with the zero-shot pipeline's call/return shape.
+    A negation within the previous 3 words flips a word's polarity; the net polarity per word
+    is squashed into positive / neutral / negative probabilities.
     """
-    Returns a Hugging Face zero-shot-classification pipeline.
+
+    def __init__(self, positive=None, negative=None, neutral_width=0.1, steepness=10.0):
+        self.positive = _POSITIVE_WORDS if positive is None else positive
+        self.negative = _NEGATIVE_WORDS if negative is None else negative
+        self.neutral_width = neutral_width
+        self.steepness = steepness
+
+    def polarity(self, text):
+        words = _WORD.findall(str(text).lower())
+        total = 0.0
+        for i, w in enumerate(words):
+            weight = self.positive.get(w, 0.0) - self.negative.get(w, 0.0)
+            if weight and any(p in _NEGATIONS for p in words[max(0, i - 3):i]):
+                weight = -weight
+            total += weight
+        # per-word density, so long reviews don't saturate
+        return total / math.sqrt(len(words) or 1)
+
+    def probabilities(self, text):
+        x = self.polarity(text)
+        pos = 1.0 / (1.0 + math.exp(-self.steepness * (x - self.neutral_width)))
+        neg = 1.0 / (1.0 + math.exp(self.steepness * (x + self.neutral_width)))
+        neu = max(0.0, 1.0 - pos - neg)
+        return {"positive": pos, "neutral": neu, "negative": neg}
+
+    def __call__(self, texts, candidate_labels, multi_label=False, **kwargs):
+        single = isinstance(texts, str)
+        results = []
+        for text in [texts] if single else texts:
+            probs = self.probabilities(text)
+            scores = [probs.get(label.lower(), 0.0) for label in candidate_labels]
+            if not multi_label:
+                total = sum(scores) or 1.0
+                scores = [s / total for s in scores]
+            ranked = sorted(zip(candidate_labels, scores), key=lambda x: -x[1])
+            results.append({"labels": [l for l, _ in ranked], "scores": [s for _, s in ranked]})
+        return results[0] if single else results
+
+
+def _lexicon_classifier(model_name, device, onnx=False):
+    return LexiconClassifier()
+
+
+def _embedding_head_classifier(model_name, device, onnx=False):
+    head = sentiment_head.SentimentHead.load()
+    if onnx_models.hub_name(model_name) != head.embedding_model:
+        raise ValueError(f"Sentiment head was trained on {head.embedding_model} embeddings, not {model_name}")
+    return sentiment_head.EmbeddingHeadClassifier(head, sentiment_head.load_embeddings(model_name, device, onnx))
+
+
+class CascadeClassifier:
+    """
+    Confidence cascade with the zero-shot pipeline's call/return shape: fast labels every text, and
+    texts whose top fast score is below threshold are re-classified by full (results replaced).
+    texts / escalated count what went through the cascade, for escalation-rate reporting.
+    """
+
+    def __init__(self, fast, full, threshold=CASCADE_THRESHOLD):
+        self.fast = fast
+        self.full = full
+        self.threshold = threshold
+        # batches are planned on the full model's token lengths: the escalated texts are the expensive ones
+        self.tokenizer = getattr(full, "tokenizer", None)
+        self.texts = 0
+        self.escalated = 0
+
+    def __call__(self, texts, candidate_labels, multi_label=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        results = list(self.fast(texts, candidate_labels, multi_label=multi_label))
+        unsure = [i for i, r in enumerate(results) if r["scores"][0] < self.threshold]
+        if unsure:
+            per_text = _sequences_per_text(self.full, candidate_labels)
+            out = self.full([texts[i] for i in unsure], candidate_labels, multi_label=multi_label,
+                            batch_size=len(unsure) * per_text)
+            for i, o in zip(unsure, [out] if isinstance(out, dict) else out):
+                results[i] = o
+        self.texts += len(texts)
+        self.escalated += len(unsure)
+        return results[0] if single else results
+
+    def escalation_rate(self):
+        return self.escalated / self.texts if self.texts else 0.0
+
+
+def _cascade_classifier(model_name, device, onnx=False):
+    fast = get_classifier(device=device, backend=CASCADE_FAST_BACKEND)
+    return CascadeClassifier(fast, _zero_shot_classifier(model_name, device, onnx))
+
+
+# backend name -> factory(model_name, device, onnx) returning a classifier callable
+BACKENDS = {
+    "zero-shot": _zero_shot_classifier,
+    "sentiment": _sentiment_classifier,
+    "lexicon": _lexicon_classifier,
+    "embedding-head": _embedding_head_classifier,
+    "cascade": _cascade_classifier,
+}
+
+
+def get_classifier(device=None, model_name=None, backend=None, runtime=None):
+    """
+    Returns a sentiment classifier for the given backend (default SENTIMENT_BACKEND, else "zero-shot").
+    Every backend is called like the Hugging Face zero-shot pipeline:
+    classifier(texts, candidate_labels, multi_label=False) -> [{"labels": [...], "scores": [...]}, ...]
     Automatically uses GPU if available (device=0), otherwise CPU (device=-1).
+    runtime: "auto" (default INFERENCE_RUNTIME) runs an ONNX export of the model on CPU when one exists
+    (python -m ml.onnx_models), "torch" never does, "onnx" requires it.
     """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown sentiment backend {backend!r}; choose from {sorted(BACKENDS)}")
     if device is None:
-        device = 0 if torch.cuda.is_available() else -1
-    classifier = pipeline("zero-shot-classification", model=model_name, device=device)
+        device = _default_device()
+    model_name = model_name or DEFAULT_MODELS[backend]
+    onnx = model_name is not None and onnx_models.use_onnx(model_name, runtime, device)
+    classifier = BACKENDS[backend](model_name, device, onnx)
+    # identifies the model (and runtime: int8 output may differ slightly) in the persistent result cache
+    classifier.cache_id = f"{backend}:{model_name}"
+    if onnx:
+        classifier.cache_id += f":{os.path.basename(onnx_models.find_artifact(model_name))}"
+    if getattr(classifier, "head", None) is not None:
+        # a retrained head gives different labels for the same model name
+        classifier.cache_id += f":{classifier.head.fingerprint}"
+    if isinstance(classifier, CascadeClassifier):
+        # which texts get the full model depends on the fast backend and the threshold
+        classifier.cache_id += f":{classifier.fast.cache_id}@{classifier.threshold}"
     return classifier
 
-def analyze_texts(texts, classifier=None, candidate_labels=None, batch_size=8):
+
+# -------------------------------
+# RESULT CACHE (dedupe + persistent)
+# -------------------------------
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Whitespace-collapsed, trimmed text: the dedupe / cache identity of a review (case is kept, models are cased)."""
+    return _WHITESPACE.sub(" ", str(text)).strip()
+
+
+def _classifier_id(classifier):
+    cache_id = getattr(classifier, "cache_id", None)
+    if cache_id:
+        return cache_id
+    model = getattr(classifier, "model", None)
+    return f"{type(classifier).__name__}:{getattr(model, 'name_or_path', '')}"
+
+
+class SentimentCache:
+    """
+    On-disk (SQLite) cache of classification results keyed by sha1(model id, label set, text),
+    so reruns only classify texts they haven't seen with the same model and labels.
+    """
+
+    # SQLite caps bound parameters per statement (999 on older builds)
+    _CHUNK = 500
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # worker processes share the file: wait for each other's write transactions instead of failing
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, label TEXT NOT NULL, score REAL NOT NULL)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(model_id, candidate_labels, text):
+        payload = "\x1f".join([model_id, "|".join(candidate_labels), text])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, model_id, candidate_labels, texts):
+        """{text: {"label", "score"}} for the texts already cached."""
+        keys = {self.key(model_id, candidate_labels, t): t for t in texts}
+        found = {}
+        key_list = list(keys)
+        for b in range(0, len(key_list), self._CHUNK):
+            chunk = key_list[b:b + self._CHUNK]
+            rows = self.conn.execute(
+                f"SELECT key, label, score FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for key, label, score in rows:
+                found[keys[key]] = {"label": label, "score": score}
+        return found
+
+    def put_many(self, model_id, candidate_labels, texts, results):
+        rows = [(self.key(model_id, candidate_labels, t), r["label"], r["score"]) for t, r in zip(texts, results)]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results (key, label, score) VALUES (?, ?, ?)", rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def token_lengths(texts, classifier):
+    """Tokenized length of each text (special tokens included); word counts for tokenizer-less backends."""
+    tokenizer = getattr(classifier, "tokenizer", None)
+    if tokenizer is None:
+        return [len(str(t).split()) + 2 for t in texts]
+    return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=True, truncation=True)["input_ids"]]
+
+
+def _sequences_per_text(classifier, candidate_labels):
+    # the zero-shot pipeline runs one NLI sequence per (text, label) pair. A cascade is planned as its full
+    # model: a batch where every text escalates must still fit the token budget
+    if isinstance(classifier, CascadeClassifier):
+        classifier = classifier.full
+    return len(candidate_labels) if getattr(classifier, "task", None) == "zero-shot-classification" else 1
+
+
+def plan_batches(lengths, max_tokens, max_items=MAX_BATCH_ITEMS):
+    """
+    Group text indices into batches, shortest texts first: a batch grows while
+    (texts in it) x (its longest length) stays within max_tokens. A text longer than
+    the budget gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batches, current = [], []
+    for i in order:
+        # ascending order: the text being added is the batch's longest
+        if current and ((len(current) + 1) * lengths[i] > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def padding_efficiency(lengths, batches):
+    """Real tokens / padded tokens over batches of indices (1.0 = no padding)."""
+    real = sum(lengths[i] for b in batches for i in b)
+    padded = sum(len(b) * max(lengths[i] for i in b) for b in batches)
+    return real / padded if padded else 1.0
+
+def analyze_texts(texts, classifier=None, candidate_labels=None, batch_size=8, max_tokens=None, stats=None,
+                  cache=None):
     """
     texts: list[str]
-    classifier: pipeline object (from get_classifier)
+    classifier: classifier from get_classifier (any backend)
     candidate_labels: list[str] e.g. ["positive","neutral","negative"]
-    batch_size: process in batches to avoid OOM
-    returns: list of dicts: {"label":..., "score":...}
+    batch_size: sets the default token budget (batch_size * TOKENS_PER_ITEM per model sequence)
+    max_tokens: padded-token budget per batch (overrides batch_size); lower it if OOM
+    stats: optional dict, filled with dedupe / cache counts, batch count and padding efficiency
+    cache: optional SentimentCache; texts already in it are not classified again
+    returns: list of dicts: {"label":..., "score":...}, in input order
+
+    Identical texts (after whitespace normalization) are classified once per call.
     """
     if candidate_labels is None:
         candidate_labels = ["positive", "neutral", "negative"]
     if classifier is None:
         classifier = get_classifier()
 
-    results = []
-    # The pipeline accepts a list or single string; when given a list returns list of outputs
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        out = classifier(batch, candidate_labels, multi_label=False)
-        # out is a list of dicts when input is list
-        for o in out:
-            label = o["labels"][0].lower()
-            score = float(o["scores"][0])
-            results.append({"label": label, "score": score})
+    keys = [normalize_text(t) for t in texts]
+    unique = list(dict.fromkeys(keys))
+    model_id = _classifier_id(classifier)
+    known = cache.get_many(model_id, candidate_labels, unique) if cache is not None else {}
+    todo = [t for t in unique if t not in known]
+    fresh = _classify_batched(todo, classifier, candidate_labels, batch_size, max_tokens, stats)
+    if cache is not None and todo:
+        cache.put_many(model_id, candidate_labels, todo, fresh)
+
+    by_text = dict(known)
+    by_text.update(zip(todo, fresh))
+    if stats is not None:
+        stats.update({"texts": len(texts), "unique_texts": len(unique), "cache_hits": len(known),
+                      "classified": len(todo)})
+    return [dict(by_text[k]) for k in keys]
+
+
+def _classify_batched(texts, classifier, candidate_labels, batch_size, max_tokens, stats):
+    """Classify texts in length-bucketed, token-budgeted batches; results in input order."""
+    escalated_before = getattr(classifier, "escalated", None)
+    if not texts:
+        if stats is not None:
+            stats.update({"batches": 0, "max_tokens": max_tokens, "tokens": 0,
+                          "padding_efficiency": 1.0, "fixed_batch_padding_efficiency": 1.0})
+            if escalated_before is not None:
+                stats["escalated"] = 0
+        return []
+    per_text = _sequences_per_text(classifier, candidate_labels)
+    lengths = token_lengths(texts, classifier)
+    if per_text > 1:
+        lengths = [n + HYPOTHESIS_TOKENS for n in lengths]
+    if max_tokens is None:
+        max_tokens = batch_size * TOKENS_PER_ITEM * per_text
+    # the budget counts model sequences: each text costs per_text sequences of its length
+    batches = plan_batches(lengths, max(1, max_tokens // per_text))
+
+    results = [None] * len(texts)
+    for batch in batches:
+        # batch_size makes the pipeline run the whole batch as one padded forward pass per model step
+        out = classifier([texts[i] for i in batch], candidate_labels, multi_label=False,
+                         batch_size=len(batch) * per_text)
+        for i, o in zip(batch, out):
+            results[i] = {"label": o["labels"][0].lower(), "score": float(o["scores"][0])}
+
+    if stats is not None:
+        fixed = [list(range(i, min(i + batch_size, len(texts)))) for i in range(0, len(texts), batch_size)]
+        stats.update({
+            "batches": len(batches),
+            "max_tokens": max_tokens,
+            "tokens": sum(lengths) * per_text,
+            "padding_efficiency": round(padding_efficiency(lengths, batches), 4),
+            "fixed_batch_padding_efficiency": round(padding_efficiency(lengths, fixed), 4),
+        })
+        if escalated_before is not None:
+            # cascade: texts of this call re-classified by the full model
+            stats["escalated"] = classifier.escalated - escalated_before
     return results
@@ -0,0 +1,579 @@
+# vector_index.py
+# Vector search over a memory-mapped NumPy matrix (alternative to Chroma): exact, or IVF-approximate
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+QUANTIZED_FILE = "vectors_{}.npy"
+SCALES_FILE = "scales.npy"
+# index settings (quantization, JSON-encoded columns); the columns themselves are in ROWS_FILE
+META_FILE = "meta.json"
+# ids, documents and metadata columns: an Arrow IPC file, memory-mapped like the vectors
+ROWS_FILE = "rows.arrow"
+ID_COLUMN = "__id"
+DOCUMENT_COLUMN = "__document"
+# ids in sorted order (fixed-width unicode) and their row numbers: id lookups by binary search on the mmap
+SORTED_IDS_FILE = "ids_sorted.npy"
+ID_ROWS_FILE = "id_rows.npy"
+CURRENT_FILE = "CURRENT"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+IVF_ROWS_FILE = "ivf_rows.npy"
+QUANTIZATIONS = (None, "float16", "int8")
+# queries scored per matmul block (bounds the (queries x rows) score matrix)
+QUERY_BLOCK = 64
+# rows dequantized per block when scoring a quantized matrix
+ROW_BLOCK = 65536
+# quantized search re-scores n_results * RESCORE_FACTOR candidates at full precision
+RESCORE_FACTOR = 4
+# IVF training: k-means over at most IVF_TRAIN_PER_LIST sampled rows per list
+IVF_TRAIN_PER_LIST = 64
+IVF_TRAIN_ITERS = 10
+# rows assigned to centroids per matmul block while building (bounds the rows x lists score matrix)
+ASSIGN_BLOCK = 4096
+# filtered searches over at most this many rows scan them exactly instead of probing lists
+IVF_EXACT_BELOW = 20000
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+    except ImportError as e:
+        raise ImportError("NumPy vector indexes store their metadata with pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def quantize(vectors: np.ndarray, quantization: str):
+    """
+    float16: plain cast. int8: symmetric per-vector scale (max |x| / 127), so x ~= q * scale.
+    Returns (quantized matrix, scales or None).
+    """
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        q = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return q, scales.astype(np.float32)
+    raise ValueError(f"quantization must be one of {QUANTIZATIONS}")
+
+
+def _matches(column: np.ndarray, cond: Any) -> np.ndarray:
+    """Boolean mask for one where-clause condition: a plain value, {"$eq": v}, {"$ne": v} or {"$in": [...]}."""
+    if isinstance(cond, dict):
+        op, value = next(iter(cond.items()))
+        if op == "$eq":
+            return column == value
+        if op == "$ne":
+            return column != value
+        if op == "$in":
+            return np.isin(column, list(value))
+        raise ValueError(f"Unsupported filter operator: {op}")
+    return column == cond
+
+
+def default_ivf_lists(rows: int) -> int:
+    """Usual IVF sizing: about 4 * sqrt(rows) lists."""
+    return max(1, int(4 * np.sqrt(rows)))
+
+
+def _assign(vectors, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (highest cosine) for every row, ASSIGN_BLOCK rows at a time."""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for r0 in range(0, len(vectors), ASSIGN_BLOCK):
+        block = np.asarray(vectors[r0:r0 + ASSIGN_BLOCK], dtype=np.float32)
+        assign[r0:r0 + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def train_ivf(vectors, n_lists: int, iters: int = IVF_TRAIN_ITERS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the (normalized) rows. Returns (n_lists x dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    n_lists = max(1, min(n_lists, len(vectors)))
+    sample_rows = np.sort(rng.choice(len(vectors), min(len(vectors), n_lists * IVF_TRAIN_PER_LIST), replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+    for _ in range(iters):
+        assign = _assign(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums[filled] = np.add.reduceat(sample[order], starts, axis=0)
+        # lists that lost all their rows restart from a random sample row
+        sums[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def build_ivf(version_dir: str, n_lists: Optional[int] = None) -> int:
+    """
+    Train an IVF (inverted file) over an index version and write it next to vectors.npy:
+    the centroids, and every row number grouped by nearest centroid (each list one contiguous,
+    ascending run of ivf_rows.npy, located by ivf_offsets.npy). Returns the number of lists.
+    """
+    vectors = np.load(os.path.join(version_dir, VECTORS_FILE), mmap_mode="r")
+    if not len(vectors):
+        return 0
+    centroids = train_ivf(vectors, n_lists or default_ivf_lists(len(vectors)))
+    assign = _assign(vectors, centroids)
+    rows = np.argsort(assign, kind="stable").astype(np.int64 if len(vectors) > np.iinfo(np.int32).max else np.int32)
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=len(centroids))))).astype(np.int64)
+    np.save(os.path.join(version_dir, IVF_CENTROIDS_FILE), centroids.astype(np.float32))
+    np.save(os.path.join(version_dir, IVF_OFFSETS_FILE), offsets)
+    np.save(os.path.join(version_dir, IVF_ROWS_FILE), rows)
+    return len(centroids)
+
+
+class NumpyVectorIndex:
+    """
+    Exact cosine search over L2-normalized float32 embeddings stored in a .npy file that is
+    opened with mmap_mode="r": every process that loads the same index shares the OS page cache,
+    so extra uvicorn workers cost no extra copy of the vectors.
+
+    Ids, documents and metadata fields are columns of an Arrow IPC file (rows.arrow), memory-mapped too:
+    workers share those pages as well, and only the rows a search returns are turned into Python objects.
+    Id lookups binary-search a sorted copy of the ids (ids_sorted.npy / id_rows.npy, memory-mapped).
+    Distances are reported like Chroma's default l2 space: 2 - 2 * cosine (lower is closer).
+
+    Optionally the index also carries a quantized copy of the matrix (float16, or int8 with a
+    per-vector scale). Searches then scan only the quantized copy and re-score the best
+    n_results * RESCORE_FACTOR candidates against the float32 file, which is read just for those rows.
+
+    An index built with an IVF (build_ivf) can also answer approximately: query(..., nprobe=p) scores
+    only the rows of the p lists whose centroids are closest to the query. Higher nprobe means better
+    recall and slower queries; nprobe=None/0 (or >= the number of lists) searches exactly.
+    """
+
+    def __init__(self, path: str, vectors: np.ndarray, table, sorted_ids: np.ndarray, id_rows: np.ndarray,
+                 json_columns: Sequence[str] = (), quantized: Optional[np.ndarray] = None,
+                 scales: Optional[np.ndarray] = None, quantization: Optional[str] = None,
+                 ivf: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None):
+        self.path = path
+        self.vectors = vectors
+        self.quantized = quantized
+        self.scales = scales
+        self.quantization = quantization
+        # (centroids, offsets, rows) or None
+        self.ivf = ivf
+        # pyarrow Table: ID_COLUMN, DOCUMENT_COLUMN, then one column per metadata field
+        self.table = table
+        self.sorted_ids = sorted_ids
+        self.id_rows = id_rows
+        # metadata fields whose values mix types, stored as JSON strings
+        self.json_columns = set(json_columns)
+        self.fields = [name for name in table.column_names if name not in (ID_COLUMN, DOCUMENT_COLUMN)]
+
+    # ---------- build / load ----------
+
+    @staticmethod
+    def write(path: str, ids: Sequence[str], embeddings, documents: Sequence[str],
+              metadatas: Sequence[Dict[str, Any]], quantization: Optional[str] = None,
+              ivf_lists: Optional[int] = None) -> str:
+        """Write a new index version under path and point CURRENT at it. Returns the version directory."""
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        writer = NumpyIndexWriter(path, len(ids), vectors.shape[1] if len(ids) else 0)
+        writer.add(ids, vectors, documents, metadatas)
+        return writer.commit(quantization=quantization, ivf_lists=ivf_lists)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyVectorIndex":
+        """Open the CURRENT version under path (vectors, rows and ids memory-mapped read-only)."""
+        pa = _pyarrow()
+        with open(os.path.join(path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version_dir = os.path.join(path, f.read().strip())
+        vectors = np.load(os.path.join(version_dir, VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(version_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if "ids" in meta:
+            # version written before rows.arrow: columns still in meta.json (loaded into memory until re-exported)
+            table, json_columns = _rows_table(meta["ids"], meta["documents"], meta["columns"])
+            sorted_ids, id_rows = _sort_ids(meta["ids"])
+        else:
+            # uncompressed IPC read from a memory map: the table's buffers point into the mapped file
+            table = pa.ipc.open_file(pa.memory_map(os.path.join(version_dir, ROWS_FILE), "r")).read_all()
+            json_columns = meta.get("json_columns", [])
+            sorted_ids = np.load(os.path.join(version_dir, SORTED_IDS_FILE), mmap_mode="r")
+            id_rows = np.load(os.path.join(version_dir, ID_ROWS_FILE), mmap_mode="r")
+        quantization = meta.get("quantization")
+        quantized = scales = None
+        if quantization:
+            quantized = np.load(os.path.join(version_dir, QUANTIZED_FILE.format(quantization)), mmap_mode="r")
+            if quantization == "int8":
+                scales = np.load(os.path.join(version_dir, SCALES_FILE))
+        ivf = None
+        if os.path.exists(os.path.join(version_dir, IVF_CENTROIDS_FILE)):
+            ivf = (np.load(os.path.join(version_dir, IVF_CENTROIDS_FILE)),
+                   np.load(os.path.join(version_dir, IVF_OFFSETS_FILE)),
+                   np.load(os.path.join(version_dir, IVF_ROWS_FILE), mmap_mode="r"))
+        return cls(version_dir, vectors, table, sorted_ids, id_rows, json_columns,
+                   quantized=quantized, scales=scales, quantization=quantization, ivf=ivf)
+
+    # ---------- rows ----------
+
+    def _decode(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {name: json.loads(v) if name in self.json_columns else v for name, v in record.items() if v is not None}
+
+    def _records(self, rows) -> List[Tuple[str, str, dict]]:
+        """(id, document, metadata) of the given row numbers, in order; only these rows become Python objects."""
+        if not len(rows):
+            return []
+        pa = _pyarrow()
+        out = []
+        for record in self.table.take(pa.array(np.asarray(rows, dtype=np.int64))).to_pylist():
+            chunk_id, document = record.pop(ID_COLUMN), record.pop(DOCUMENT_COLUMN)
+            out.append((chunk_id, document, self._decode(record)))
+        return out
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        return self._records([row])[0][2]
+
+    def column_values(self, name: str) -> List[Any]:
+        """Every row's value of one metadata field, in row order (None where a row doesn't have it)."""
+        if name not in self.fields:
+            return [None] * self.count()
+        values = self.table.column(name).to_pylist()
+        if name in self.json_columns:
+            values = [None if v is None else json.loads(v) for v in values]
+        return values
+
+    def _rows_of(self, ids: Sequence[str]) -> np.ndarray:
+        """Row number of each id (-1 for unknown ids), by binary search of the sorted ids."""
+        if not len(ids) or not len(self.sorted_ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        keys = np.asarray(list(ids), dtype=str)
+        pos = np.minimum(np.searchsorted(self.sorted_ids, keys), len(self.sorted_ids) - 1)
+        return np.where(self.sorted_ids[pos] == keys, self.id_rows[pos], -1).astype(np.int64)
+
+    def _mask(self, name: str, cond: Any) -> np.ndarray:
+        """Boolean row mask for one where-clause condition, evaluated on the Arrow column."""
+        pa = _pyarrow()
+        op, value = next(iter(cond.items())) if isinstance(cond, dict) else ("$eq", cond)
+        if op not in ("$eq", "$ne", "$in"):
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if name in self.fields and name not in self.json_columns:
+            column = self.table.column(name)
+            try:
+                if op == "$eq":
+                    mask = pa.compute.equal(column, value).fill_null(False)
+                elif op == "$ne":
+                    mask = pa.compute.not_equal(column, value).fill_null(True)
+                else:
+                    mask = pa.compute.is_in(column, value_set=pa.array(list(value)))
+                return mask.to_numpy(zero_copy_only=False)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                pass  # value of another type than the column: compare as Python values below
+        values = np.empty(self.count(), dtype=object)
+        values[:] = self.column_values(name)
+        return _matches(values, cond)
+
+    # ---------- backend interface (same shape as rag_engine.ChromaBackend) ----------
+
+    def count(self) -> int:
+        return self.table.num_rows
+
+    def filter_rows(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Row numbers matching a Chroma-style equality filter (None means all rows)."""
+        if not where:
+            return None
+        clauses = where["$and"] if "$and" in where else [{k: v} for k, v in where.items()]
+        mask = np.ones(self.count(), dtype=bool)
+        for clause in clauses:
+            for name, cond in clause.items():
+                mask &= self._mask(name, cond)
+        return np.flatnonzero(mask)
+
+    def _score(self, queries: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Exact cosine scores (queries x rows) against the float32 matrix."""
+        mat = self.vectors if rows is None else self.vectors[rows]
+        return queries @ mat.T
+
+    def _approx_score(self, queries: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Cosine scores against the quantized matrix, dequantizing ROW_BLOCK rows at a time."""
+        n_rows = self.count() if rows is None else len(rows)
+        sims = np.empty((len(queries), n_rows), dtype=np.float32)
+        for r0 in range(0, n_rows, ROW_BLOCK):
+            r1 = min(r0 + ROW_BLOCK, n_rows)
+            sel = slice(r0, r1) if rows is None else rows[r0:r1]
+            block = np.asarray(self.quantized[sel], dtype=np.float32)
+            sims[:, r0:r1] = queries @ block.T
+            if self.scales is not None:
+                sims[:, r0:r1] *= self.scales[sel]
+        return sims
+
+    def query(self, query_embeddings, n_results: int, where: Optional[dict] = None,
+              rescore: bool = True, nprobe: Optional[int] = None) -> List[List[Tuple[str, dict, float]]]:
+        """
+        Top n_results rows per query embedding: lists of (text, metadata, distance), nearest first.
+        On a quantized index, rescore=False skips the full-precision pass (distances are then approximate).
+        nprobe > 0 searches only the nprobe nearest IVF lists (ignored by indexes built without an IVF).
+        """
+        if not len(query_embeddings):
+            return []
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        rows = self.filter_rows(where)
+        total = self.count() if rows is None else len(rows)
+        n = min(n_results, total)
+        if n == 0:
+            return [[] for _ in range(len(queries))]
+        # small filtered subsets (one product's chunks) are cheaper to scan than to probe
+        use_ivf = (self.ivf is not None and nprobe is not None and 0 < nprobe < len(self.ivf[0])
+                   and (rows is None or len(rows) > IVF_EXACT_BELOW))
+        out: List[List[Tuple[str, dict, float]]] = []
+        for b in range(0, len(queries), QUERY_BLOCK):
+            block = queries[b:b + QUERY_BLOCK]
+            if use_ivf:
+                ranked = self._rank_ivf(block, rows, n, rescore, nprobe)
+            else:
+                ranked = self._rank(block, rows, n, rescore)
+            for best_rows, best_sims in ranked:
+                out.append([(document, md, float(2.0 - 2.0 * sim))
+                            for (_, document, md), sim in zip(self._records(best_rows), best_sims)])
+        return out
+
+    def _rank(self, block: np.ndarray, rows: Optional[np.ndarray], n: int,
+              rescore: bool) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Best n of rows (None = all) for every query in block: (row numbers, cosine scores), best first."""
+        total = self.count() if rows is None else len(rows)
+        n = min(n, total)
+        quantized = self.quantized is not None
+        # how many candidates survive the first (possibly approximate) pass
+        m = min(total, n * RESCORE_FACTOR) if quantized and rescore else n
+        sims = self._approx_score(block, rows) if quantized else self._score(block, rows)
+        top = np.argpartition(-sims, m - 1, axis=1)[:, :m] if m < total else np.tile(np.arange(total), (len(sims), 1))
+        ranked = []
+        for q, cand in enumerate(top):
+            cand_rows = cand if rows is None else rows[cand]
+            if quantized and rescore:
+                # full-precision re-score; reads only the candidate rows of the float32 file
+                cand_rows = np.sort(cand_rows)
+                cand_sims = self.vectors[cand_rows] @ block[q]
+            else:
+                cand_sims = sims[q, cand]
+            best = np.argsort(-cand_sims, kind="stable")[:n]
+            ranked.append((cand_rows[best], cand_sims[best]))
+        return ranked
+
+    def _rank_ivf(self, block: np.ndarray, rows: Optional[np.ndarray], n: int, rescore: bool,
+                  nprobe: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Like _rank, but each query searches only the rows of its nprobe nearest IVF lists."""
+        centroids, offsets, list_rows = self.ivf
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(self.count(), dtype=bool)
+            allowed[rows] = True
+        probes = np.argpartition(-(block @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        ranked = []
+        for q, lists in enumerate(probes):
+            # ascending row numbers keep the reads of the memory-mapped matrix sequential
+            cand = np.sort(np.concatenate([list_rows[offsets[l]:offsets[l + 1]] for l in lists]))
+            if allowed is not None:
+                cand = cand[allowed[cand]]
+            # too few rows in the probed lists: answer this query exactly rather than short
+            ranked.extend(self._rank(block[q:q + 1], cand if len(cand) >= n else rows, n, rescore))
+        return ranked
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes of the matrix a search scans (the quantized copy when present): the working set per query.
+        Quantizing shrinks this, not the disk footprint; see stored_bytes().
+        """
+        if self.quantized is not None:
+            return int(self.quantized.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+        return int(self.vectors.nbytes)
+
+    def stored_bytes(self) -> int:
+        """
+        Bytes of all vector files of the version. A quantized index keeps the float32 vectors.npy
+        next to its compressed copy (memory-mapped for rescoring and exact lookups), so it stores
+        more than an unquantized one; only the pages rescoring touches are read from the float32 file.
+        """
+        arrays = [self.vectors, self.quantized, self.scales] + list(self.ivf or ())
+        return int(sum(a.nbytes for a in arrays if a is not None))
+
+    def get(self, ids: Sequence[str]) -> List[Tuple[str, str, dict]]:
+        """(id, text, metadata) for the ids that exist, in the order requested."""
+        rows = self._rows_of(ids)
+        return self._records(rows[rows >= 0])
+
+    def distances(self, query_embedding, ids: Sequence[str]) -> Dict[str, float]:
+        """Exact distance (2 - 2 * cosine) from one query embedding to each of ids that exists."""
+        found = [(chunk_id, int(row)) for chunk_id, row in zip(ids, self._rows_of(ids)) if row >= 0]
+        if not found:
+            return {}
+        query = _normalize(np.asarray([query_embedding], dtype=np.float32))[0]
+        rows = np.array([row for _, row in found])
+        order = np.argsort(rows)
+        sims = np.empty(len(rows), dtype=np.float32)
+        sims[order] = self.vectors[rows[order]] @ query
+        return {chunk_id: float(2.0 - 2.0 * sim) for (chunk_id, _), sim in zip(found, sims)}
+
+    def scan_metadatas(self, page_size: int = 10000) -> Iterator[Tuple[List[str], List[dict]]]:
+        columns = self.table.select([ID_COLUMN] + self.fields)
+        for start in range(0, self.count(), page_size):
+            records = columns.slice(start, page_size).to_pylist()
+            yield [r.pop(ID_COLUMN) for r in records], [self._decode(r) for r in records]
+
+
+class NumpyIndexWriter:
+    """
+    Streams rows into a new index version: vectors go straight into an open_memmap'd .npy file,
+    ids, documents and metadata columns are collected and written as rows.arrow on commit().
+    """
+
+    def __init__(self, path: str, rows: int, dim: int):
+        self.path = path
+        self.version = uuid.uuid4().hex[:12]
+        self.version_dir = os.path.join(path, self.version)
+        os.makedirs(self.version_dir, exist_ok=True)
+        self.vectors = np.lib.format.open_memmap(os.path.join(self.version_dir, VECTORS_FILE),
+                                                 mode="w+", dtype=np.float32, shape=(rows, dim))
+        self.rows = 0
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.columns: Dict[str, List[Any]] = {}
+
+    def add(self, ids: Sequence[str], embeddings, documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        n = len(ids)
+        if n == 0:
+            return
+        self.vectors[self.rows:self.rows + n] = _normalize(np.asarray(embeddings, dtype=np.float32))
+        for i, md in enumerate(metadatas):
+            md = md or {}
+            for name in md:
+                if name not in self.columns:
+                    self.columns[name] = [None] * (self.rows + i)
+            for name, col in self.columns.items():
+                col.append(md.get(name))
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.rows += n
+
+    def commit(self, keep_versions: int = 2, quantization: Optional[str] = None,
+               ivf_lists: Optional[int] = None) -> str:
+        """
+        Finish the version and make it CURRENT. quantization ("float16" / "int8") additionally
+        writes a compressed copy of the matrix that searches scan instead of the float32 file.
+        ivf_lists (0 = default_ivf_lists(rows)) also trains an IVF for nprobe searches.
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}")
+        vectors_path = os.path.join(self.version_dir, VECTORS_FILE)
+        if self.rows != self.vectors.shape[0]:
+            # fewer rows arrived than were allocated (e.g. the source shrank while exporting)
+            trimmed = np.array(self.vectors[:self.rows])
+            del self.vectors
+            np.save(vectors_path, trimmed)
+        else:
+            self.vectors.flush()
+            del self.vectors
+        if quantization:
+            _write_quantized(self.version_dir, quantization)
+        if ivf_lists is not None:
+            build_ivf(self.version_dir, ivf_lists)
+        pa = _pyarrow()
+        table, json_columns = _rows_table(self.ids, self.documents, self.columns)
+        with pa.ipc.new_file(os.path.join(self.version_dir, ROWS_FILE), table.schema) as writer:
+            writer.write_table(table)
+        sorted_ids, id_rows = _sort_ids(self.ids)
+        np.save(os.path.join(self.version_dir, SORTED_IDS_FILE), sorted_ids)
+        np.save(os.path.join(self.version_dir, ID_ROWS_FILE), id_rows)
+        with open(os.path.join(self.version_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"quantization": quantization, "json_columns": json_columns}, f)
+        tmp = os.path.join(self.path, f"{CURRENT_FILE}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.version)
+        os.replace(tmp, os.path.join(self.path, CURRENT_FILE))
+        _prune_versions(self.path, keep_versions)
+        return self.version_dir
+
+
+def _rows_table(ids: Sequence[str], documents: Sequence[str], columns: Dict[str, List[Any]]):
+    """
+    Arrow table of ids, documents and metadata columns. A column whose values mix types
+    (e.g. ids that are sometimes numbers) is stored as JSON strings so every value round-trips exactly.
+    Returns (table, names of the JSON columns).
+    """
+    pa = _pyarrow()
+    arrays = {ID_COLUMN: pa.array(list(ids), pa.string()), DOCUMENT_COLUMN: pa.array(list(documents), pa.string())}
+    json_columns = []
+    for name, values in columns.items():
+        kinds = {type(v) for v in values if v is not None}
+        if len(kinds) <= 1 and kinds <= {str, int, float, bool}:
+            try:
+                arrays[name] = pa.array(values)
+                continue
+            except (pa.ArrowInvalid, OverflowError):
+                pass
+        json_columns.append(name)
+        arrays[name] = pa.array([None if v is None else json.dumps(v) for v in values], pa.string())
+    return pa.table(arrays), json_columns
+
+
+def _sort_ids(ids: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Ids sorted (fixed-width unicode, searchsorted-able on a memory map) and the row of each."""
+    ids = np.asarray(list(ids), dtype=str)
+    order = np.argsort(ids, kind="stable")
+    return ids[order], order.astype(np.int64)
+
+
+def _write_quantized(version_dir: str, quantization: str) -> None:
+    vectors = np.load(os.path.join(version_dir, VECTORS_FILE), mmap_mode="r")
+    dtype = np.float16 if quantization == "float16" else np.int8
+    out = np.lib.format.open_memmap(os.path.join(version_dir, QUANTIZED_FILE.format(quantization)),
+                                    mode="w+", dtype=dtype, shape=vectors.shape)
+    scales = np.empty(len(vectors), dtype=np.float32)
+    for r0 in range(0, len(vectors), ROW_BLOCK):
+        q, sc = quantize(np.asarray(vectors[r0:r0 + ROW_BLOCK], dtype=np.float32), quantization)
+        out[r0:r0 + len(q)] = q
+        if sc is not None:
+            scales[r0:r0 + len(q)] = sc
+    out.flush()
+    del out
+    if quantization == "int8":
+        np.save(os.path.join(version_dir, SCALES_FILE), scales)
+
+
+def _prune_versions(path: str, keep: int) -> None:
+    """Delete all but the newest `keep` version directories (readers holding an old mmap keep their inode)."""
+    versions = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
+    versions.sort(key=lambda d: os.path.getmtime(os.path.join(path, d)), reverse=True)
+    for d in versions[keep:]:
+        shutil.rmtree(os.path.join(path, d), ignore_errors=True)
+
+
+def export_chroma_collection(collection, path: str, page_size: int = 5000, quantization: Optional[str] = None,
+                             ivf_lists: Optional[int] = None) -> str:
+    """
+    Copy a chromadb collection (ids, embeddings, documents, metadatas) into a NumpyVectorIndex at path,
+    page by page so only one page of rows is in memory besides the metadata columns.
+    """
+    total = collection.count()
+    writer = None
+    offset = 0
+    while offset < total:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+        if writer is None:
+            writer = NumpyIndexWriter(path, total, embeddings.shape[1])
+        writer.add(page["ids"], embeddings, page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+    if writer is None:
+        writer = NumpyIndexWriter(path, 0, 0)
+    return writer.commit(quantization=quantization, ivf_lists=ivf_lists)
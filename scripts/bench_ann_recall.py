@@ -0,0 +1,71 @@
+# scripts/bench_ann_recall.py
+# Recall@k and latency of IVF (nprobe) searches on the NumPy index against exact search, to pick ANN_NPROBE.
+#
+# Run from the repo root, on an index exported with --ivf_lists:
+#   python scripts/bench_ann_recall.py --index chroma_db/numpy/reviews_with_sentiment
+# or on synthetic MiniLM-sized vectors (the IVF is built in a temp dir):
+#   python scripts/bench_ann_recall.py --synthetic 200000
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ml.vector_index import NumpyVectorIndex  # noqa: E402
+from bench_vector_quantization import synthetic_vectors, recall  # noqa: E402
+
+
+def timed_query(index, queries, k, nprobe):
+    start = time.perf_counter()
+    hits = index.query(queries, k, nprobe=nprobe)
+    ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return [[text for text, _, _ in h] for h in hits], ms
+
+
+def sweep(index, queries, k, nprobes):
+    exact, exact_ms = timed_query(index, queries, k, None)
+    print(f"{index.count()} rows, {len(index.ivf[0])} lists; {len(queries)} queries, recall@{k} vs exact search")
+    print(f"{'nprobe':>7} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+    print(f"{'exact':>7} {1.0:>9.4f} {exact_ms:>9.2f} {1.0:>7.1f}x")
+    for nprobe in nprobes:
+        if nprobe >= len(index.ivf[0]):
+            break
+        approx, ms = timed_query(index, queries, k, nprobe)
+        print(f"{nprobe:>7} {recall(approx, exact):>9.4f} {ms:>9.2f} {exact_ms / ms:>7.1f}x")
+
+
+def main(index_path, synthetic, n_queries, k, n_lists, nprobes, seed):
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        if index_path:
+            index = NumpyVectorIndex.load(index_path)
+            if index.ivf is None:
+                sys.exit(f"{index_path} has no IVF; re-export with python -m ml.embedder --export_numpy --ivf_lists 0")
+        else:
+            vectors = synthetic_vectors(synthetic, seed=seed)
+            ids = [str(i) for i in range(len(vectors))]
+            start = time.perf_counter()
+            NumpyVectorIndex.write(tmp, ids, vectors, ids, [{} for _ in ids], ivf_lists=n_lists)
+            print(f"Built IVF over {len(ids)} synthetic rows in {time.perf_counter() - start:.1f}s")
+            index = NumpyVectorIndex.load(tmp)
+        picks = rng.choice(index.count(), size=min(n_queries, index.count()), replace=False)
+        # perturbed stored vectors as queries: realistic neighbourhoods without an embedding model
+        queries = np.asarray(index.vectors[np.sort(picks)], dtype=np.float32)
+        queries += 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+        sweep(index, queries, k, nprobes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of IVF nprobe settings")
+    parser.add_argument("--index", default=None, help="Exported NumPy index directory with an IVF (contains CURRENT)")
+    parser.add_argument("--synthetic", type=int, default=100000, help="Rows of synthetic vectors if --index is not given")
+    parser.add_argument("--ivf_lists", type=int, default=0, help="Lists for the synthetic IVF (0 = ~4*sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64], help="nprobe values to sweep")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("-k", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.index, args.synthetic, args.queries, args.k, args.ivf_lists, args.nprobe, args.seed)
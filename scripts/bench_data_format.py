@@ -0,0 +1,80 @@
+# scripts/bench_data_format.py
+# CSV vs Parquet (ml/data_loader.py) for the data/processed datasets: disk size, full read, projected read
+# (a few columns, as the embedder / sentiment head read them) and write time.
+# --scale N replicates each table N times first, to time tables larger than the sample data.
+#
+# Run from the repo root:
+#   python scripts/bench_data_format.py
+#   python scripts/bench_data_format.py --datasets reviews_with_sentiment --scale 100
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ml.data_loader import disk_bytes, find_table, read_table, write_table  # noqa: E402
+
+DATASETS = ["sentiment_data", "products_with_sentiment", "reviews_with_sentiment",
+            "chunked_reviews_with_sentiment", "chunked_products_with_sentiment"]
+
+
+def _timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return out, best
+
+
+def _text_heavy(df, n=2):
+    # the longest string columns: what the downstream stages project (review / chunk text plus a label)
+    lengths = {c: df[c].astype(str).str.len().mean() for c in df.columns if pd.api.types.is_string_dtype(df[c])}
+    return sorted(lengths, key=lengths.get, reverse=True)[:n]
+
+
+def bench(name, df, tmp_dir, repeat):
+    columns = _text_heavy(df)
+    row = {"dataset": name, "rows": len(df), "cols": df.shape[1]}
+    for fmt in ("csv", "parquet"):
+        path, write_s = _timed(lambda: write_table(df, Path(tmp_dir) / name, fmt), repeat)
+        _, read_s = _timed(lambda: read_table(path), repeat)
+        _, project_s = _timed(lambda: read_table(path, columns=columns), repeat)
+        row.update({f"{fmt}_mb": round(disk_bytes(path) / 1e6, 2), f"{fmt}_write_s": round(write_s, 3),
+                    f"{fmt}_read_s": round(read_s, 3), f"{fmt}_project_s": round(project_s, 3)})
+    row["size_ratio"] = round(row["csv_mb"] / row["parquet_mb"], 1)
+    row["read_speedup"] = round(row["csv_read_s"] / row["parquet_read_s"], 1)
+    row["project_speedup"] = round(row["csv_project_s"] / row["parquet_project_s"], 1)
+    return row
+
+
+def main(data_dir, datasets, scale, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in datasets:
+            try:
+                src = find_table(Path(data_dir) / name)
+            except FileNotFoundError as e:
+                print(e)
+                continue
+            df = read_table(src)
+            if scale > 1:
+                df = pd.concat([df] * scale, ignore_index=True)
+            results.append(bench(name, df, tmp_dir, repeat))
+            print(results[-1], flush=True)
+    print()
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CSV vs Parquet storage of the processed datasets")
+    parser.add_argument("--data_dir", default="data/processed")
+    parser.add_argument("--datasets", nargs="+", default=DATASETS)
+    parser.add_argument("--scale", type=int, default=1, help="Replicate each table this many times")
+    parser.add_argument("--repeat", type=int, default=3, help="Timings keep the best of this many runs")
+    args = parser.parse_args()
+    main(args.data_dir, args.datasets, args.scale, args.repeat)
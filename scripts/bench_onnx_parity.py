@@ -0,0 +1,77 @@
+# scripts/bench_onnx_parity.py
+# Parity and latency of the ONNX Runtime exports (python -m ml.onnx_models) against the PyTorch models:
+#   sentiment  - label agreement and score drift on real reviews
+#   embeddings - cosine similarity between PyTorch and ONNX MiniLM vectors
+#
+# Run from the repo root:
+#   python scripts/bench_onnx_parity.py --sentiment_backend sentiment --embeddings --limit 500
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ml.data_loader import read_table  # noqa: E402
+from ml.onnx_models import OnnxSentenceEmbeddings, find_artifact  # noqa: E402
+from ml.sentiment_model import DEFAULT_MODELS, get_classifier, analyze_texts  # noqa: E402
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def sentiment_parity(backend, texts, batch_size):
+    runs = {}
+    for runtime in ("torch", "onnx"):
+        classifier = get_classifier(backend=backend, runtime=runtime, device=-1)
+        analyze_texts(texts[:batch_size], classifier=classifier, batch_size=batch_size)  # warm-up
+        runs[runtime] = _timed(lambda: analyze_texts(texts, classifier=classifier, batch_size=batch_size))
+    (ref, ref_s), (onnx, onnx_s) = runs["torch"], runs["onnx"]
+    agree = np.mean([a["label"] == b["label"] for a, b in zip(ref, onnx)])
+    drift = np.abs(np.array([a["score"] for a in ref]) - np.array([b["score"] for b in onnx]))
+    print(f"sentiment ({backend}: {DEFAULT_MODELS[backend]}, onnx file {find_artifact(DEFAULT_MODELS[backend])})")
+    print(f"  label agreement {agree:.4f}; top score |diff| mean {drift.mean():.4f}, max {drift.max():.4f}")
+    print(f"  torch {len(texts) / ref_s:.1f} reviews/sec, onnx {len(texts) / onnx_s:.1f} reviews/sec "
+          f"({ref_s / onnx_s:.2f}x)")
+
+
+def embedding_parity(model_name, texts):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    torch_emb = HuggingFaceEmbeddings(model_name=model_name)
+    onnx_emb = OnnxSentenceEmbeddings(model_name)
+    torch_emb.embed_documents(texts[:8])
+    onnx_emb.embed_documents(texts[:8])
+    ref, ref_s = _timed(lambda: np.asarray(torch_emb.embed_documents(texts), dtype=np.float32))
+    got, onnx_s = _timed(lambda: np.asarray(onnx_emb.embed_documents(texts), dtype=np.float32))
+    cos = (ref * got).sum(axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(got, axis=1))
+    print(f"embeddings ({model_name}, onnx file {find_artifact(model_name)})")
+    print(f"  cosine(torch, onnx) mean {cos.mean():.5f}, min {cos.min():.5f}")
+    print(f"  torch {len(texts) / ref_s:.1f} texts/sec, onnx {len(texts) / onnx_s:.1f} texts/sec ({ref_s / onnx_s:.2f}x)")
+
+
+def main(input_path, text_col, sentiment_backend, embeddings, embedding_model, limit, batch_size):
+    df = read_table(input_path)
+    texts = df[text_col].fillna("").astype(str).head(limit).tolist()
+    print(f"{len(texts)} texts from {input_path}")
+    if sentiment_backend:
+        sentiment_parity(sentiment_backend, texts, batch_size)
+    if embeddings:
+        embedding_parity(embedding_model, texts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX vs PyTorch parity and latency")
+    parser.add_argument("--input", "-i", default="data/processed/sentiment_data")
+    parser.add_argument("--text_col", default="reviews.text")
+    parser.add_argument("--sentiment_backend", choices=["zero-shot", "sentiment"], default=None)
+    parser.add_argument("--embeddings", action="store_true")
+    parser.add_argument("--embedding_model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--batch_size", type=int, default=16)
+    args = parser.parse_args()
+    main(args.input, args.text_col, args.sentiment_backend, args.embeddings, args.embedding_model,
+         args.limit, args.batch_size)
@@ -0,0 +1,69 @@
+# scripts/bench_sentiment_backends.py
+# Throughput (reviews/sec) of the sentiment backends and their agreement with the stored BART zero-shot labels.
+#
+# Run from the repo root:
+#   python scripts/bench_sentiment_backends.py --backends sentiment lexicon --limit 1000
+# (add zero-shot to re-time the BART pipeline itself; its agreement is then a consistency check)
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "ml"))
+from sentiment_model import BACKENDS, get_classifier, analyze_texts  # noqa: E402
+from analyze_reviews import preprocess_text  # noqa: E402
+from data_loader import read_table  # noqa: E402
+
+
+def bench_backend(backend, texts, reference, batch_size):
+    start = time.perf_counter()
+    classifier = get_classifier(backend=backend)
+    load_s = time.perf_counter() - start
+    # one warm-up batch so lazy init / first-call overhead doesn't count against throughput
+    analyze_texts(texts[:batch_size], classifier=classifier, batch_size=batch_size)
+    start = time.perf_counter()
+    results = analyze_texts(texts, classifier=classifier, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    labels = pd.Series([r["label"] for r in results], index=reference.index)
+    per_label = {label: round(float((labels[reference == label] == label).mean()), 3)
+                 for label in sorted(reference.unique())}
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 1),
+        "reviews_per_sec": round(len(texts) / elapsed, 1) if elapsed else None,
+        "agreement": round(float((labels == reference).mean()), 4),
+        # share of each BART label the backend reproduces
+        "agreement_by_label": per_label,
+        "label_counts": labels.value_counts().to_dict(),
+    }
+
+
+def main(input_path, text_col, reference_col, backends, limit, batch_size):
+    df = read_table(input_path)
+    df = df[df[reference_col].notna()]
+    if limit:
+        df = df.head(limit)
+    texts = df[text_col].fillna("").astype(str).apply(preprocess_text).tolist()
+    reference = df[reference_col].str.lower()
+    print(f"{len(texts)} reviews from {input_path}; reference labels: {reference.value_counts().to_dict()}")
+    rows = []
+    for backend in backends:
+        row = bench_backend(backend, texts, reference, batch_size)
+        print(row, flush=True)
+        rows.append(row)
+    print()
+    print(pd.DataFrame(rows)[["backend", "load_s", "reviews_per_sec", "agreement"]].to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sentiment backend throughput and agreement with BART labels")
+    parser.add_argument("--input", "-i", default="data/processed/sentiment_data", help="Table with texts and reference labels")
+    parser.add_argument("--text_col", default="reviews.text", help="Review text column")
+    parser.add_argument("--reference_col", default="sentiment_label", help="Column with the zero-shot (BART) labels")
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=["sentiment", "lexicon"])
+    parser.add_argument("--limit", type=int, default=1000, help="Reviews to score (0 = all)")
+    parser.add_argument("--batch_size", type=int, default=16)
+    args = parser.parse_args()
+    main(args.input, args.text_col, args.reference_col, args.backends, args.limit, args.batch_size)
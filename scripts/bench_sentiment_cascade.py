@@ -0,0 +1,112 @@
+# scripts/bench_sentiment_cascade.py
+# Threshold sweep for the cascade sentiment backend: escalation rate, estimated throughput and agreement
+# with the full (BART zero-shot) labels.
+#
+# The fast backend is run once; for each threshold, texts it scores below the threshold are "escalated"
+# and take the stored BART label (what the full model answers for them), the rest keep the fast label.
+# Throughput combines the measured fast time with the full model's reviews/sec (measured on a sample,
+# or --full_reviews_per_sec).
+#
+# Run from the repo root:
+#   python scripts/bench_sentiment_cascade.py --fast_backend lexicon --thresholds 0.6 0.7 0.8 0.9 0.95
+#   python scripts/bench_sentiment_cascade.py --run 0.9     # also time the real cascade at one threshold
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "ml"))
+from sentiment_model import BACKENDS, CascadeClassifier, get_classifier, analyze_texts  # noqa: E402
+from analyze_reviews import preprocess_text  # noqa: E402
+from data_loader import read_table  # noqa: E402
+
+
+def _rate(backend, texts, batch_size):
+    classifier = get_classifier(backend=backend)
+    analyze_texts(texts[:batch_size], classifier=classifier, batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    results = analyze_texts(texts, classifier=classifier, batch_size=batch_size)
+    return results, time.perf_counter() - start
+
+
+def sweep(fast_results, fast_s, reference, thresholds, full_rate):
+    n = len(reference)
+    fast_labels = np.array([r["label"] for r in fast_results])
+    scores = np.array([r["score"] for r in fast_results])
+    rows = []
+    for t in thresholds:
+        escalate = scores < t
+        labels = np.where(escalate, reference, fast_labels)
+        seconds = fast_s + escalate.sum() / full_rate
+        rows.append({
+            "threshold": t,
+            "escalation_rate": round(float(escalate.mean()), 4),
+            "agreement": round(float((labels == reference).mean()), 4),
+            # agreement of the texts the fast backend kept: the errors the cascade lets through
+            "kept_agreement": round(float((fast_labels[~escalate] == reference[~escalate]).mean()), 4)
+            if (~escalate).any() else None,
+            "est_reviews_per_sec": round(n / seconds, 1),
+            "speedup_vs_full": round((n / full_rate) / seconds, 2),
+        })
+    return pd.DataFrame(rows)
+
+
+def run_cascade(texts, reference, fast_backend, threshold, batch_size):
+    """Time the real cascade backend at one threshold (needs the full model)."""
+    fast = get_classifier(backend=fast_backend)
+    cascade = CascadeClassifier(fast, get_classifier(backend="zero-shot"), threshold)
+    analyze_texts(texts[:batch_size], classifier=cascade, batch_size=batch_size)  # warm-up
+    cascade.texts = cascade.escalated = 0
+    start = time.perf_counter()
+    results = analyze_texts(texts, classifier=cascade, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    labels = np.array([r["label"] for r in results])
+    print(f"cascade run @ {threshold}: escalated {cascade.escalation_rate():.1%}, "
+          f"{len(texts) / elapsed:.1f} reviews/sec, agreement {(labels == reference).mean():.4f}")
+
+
+def main(input_path, text_col, reference_col, fast_backend, thresholds, limit, batch_size, full_sample,
+         full_reviews_per_sec, run):
+    df = read_table(input_path)
+    df = df[df[reference_col].notna()]
+    if limit:
+        df = df.head(limit)
+    texts = df[text_col].fillna("").astype(str).apply(preprocess_text).tolist()
+    reference = df[reference_col].str.lower().to_numpy()
+    print(f"{len(texts)} reviews from {input_path}; reference labels: {pd.Series(reference).value_counts().to_dict()}")
+
+    fast_results, fast_s = _rate(fast_backend, texts, batch_size)
+    print(f"fast ({fast_backend}): {len(texts) / fast_s:.1f} reviews/sec, "
+          f"agreement {(np.array([r['label'] for r in fast_results]) == reference).mean():.4f}")
+    if full_reviews_per_sec is None:
+        sample = texts[:full_sample]
+        _, full_s = _rate("zero-shot", sample, batch_size)
+        full_reviews_per_sec = len(sample) / full_s
+    print(f"full (zero-shot): {full_reviews_per_sec:.1f} reviews/sec")
+    print()
+    print(sweep(fast_results, fast_s, reference, thresholds, full_reviews_per_sec).to_string(index=False))
+    if run is not None:
+        print()
+        run_cascade(texts, reference, fast_backend, run, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cascade sentiment: escalation rate / throughput / agreement per threshold")
+    parser.add_argument("--input", "-i", default="data/processed/sentiment_data", help="Table with texts and BART labels")
+    parser.add_argument("--text_col", default="reviews.text", help="Review text column")
+    parser.add_argument("--reference_col", default="sentiment_label", help="Column with the zero-shot (BART) labels")
+    parser.add_argument("--fast_backend", choices=sorted(set(BACKENDS) - {"zero-shot", "cascade"}), default="lexicon")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99])
+    parser.add_argument("--limit", type=int, default=0, help="Reviews to score (0 = all)")
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--full_sample", type=int, default=64, help="Reviews used to time the full model")
+    parser.add_argument("--full_reviews_per_sec", type=float, default=None,
+                        help="Full model throughput to assume instead of timing it")
+    parser.add_argument("--run", type=float, default=None, metavar="THRESHOLD",
+                        help="Also run the real cascade at this threshold")
+    args = parser.parse_args()
+    main(args.input, args.text_col, args.reference_col, args.fast_backend, args.thresholds, args.limit,
+         args.batch_size, args.full_sample, args.full_reviews_per_sec, args.run)
@@ -0,0 +1,91 @@
+# scripts/bench_sentiment_prepare_docs.py
+# Times the product-sentiment aggregation of scripts/sentiment_prepare_docs.py on synthetic review tables
+# (label normalization, per-product groupby/agg, merge back onto the reviews; CSV I/O excluded).
+# --legacy_rows also times the per-review iterrows lookup loop the merge replaced, on a sample.
+#
+# Run from the repo root:
+#   python scripts/bench_sentiment_prepare_docs.py --rows 1000000 10000000 --products 50000
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import sentiment_prepare_docs as prep  # noqa: E402
+
+
+def synthetic_reviews(rows, products, seed=0):
+    """Reviews shaped like sentiment_data.csv: ~91% positive labels, a few unusable labels (inferred from score)."""
+    rng = np.random.default_rng(seed)
+    product = rng.integers(0, products, rows)
+    names = np.array([f"Product {i}" for i in range(products)], dtype=object)
+    # texts repeat from a pool: the strings are shared objects, so tens of millions of rows fit in memory
+    pool = np.array([f"review text {i} " * (1 + i % 20) for i in range(1000)], dtype=object)
+    labels = rng.choice(np.array(["positive", "negative", "neutral", "Positive ", "unknown"], dtype=object),
+                        rows, p=[0.88, 0.075, 0.01, 0.025, 0.01])
+    return pd.DataFrame({
+        prep.product_id_col: names[product],
+        prep.product_col: names[product],
+        prep.category_col: "Electronics",
+        prep.review_col: pool[rng.integers(0, len(pool), rows)],
+        prep.rating_col: rng.integers(1, 6, rows).astype(float),
+        "sentiment_label": labels,
+        "sentiment_score": rng.uniform(0.3, 1.0, rows),
+    })
+
+
+def _legacy_attach(df, products):
+    # the replaced approach: a dict of product stats, then one Python-level lookup per review via iterrows
+    stats_map = {r["product_id"]: r for r in products.to_dict("records")}
+    rows = []
+    for _, r in df.iterrows():
+        stats = stats_map.get(r[prep.product_id_col], {})
+        rows.append({"product_id": r[prep.product_id_col], "review_text": str(r[prep.review_col]).strip(),
+                     **{k: stats.get(v) for k, v in prep.REVIEW_STATS_COLS.items()}})
+    return pd.DataFrame(rows)
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def bench(rows, products, legacy_rows):
+    df, gen_s = _timed(lambda: synthetic_reviews(rows, products))
+    products_df, agg_s = _timed(lambda: prep.aggregate_products(df))
+    reviews_df, merge_s = _timed(lambda: prep.attach_product_stats(df, products_df))
+    assert len(reviews_df) == rows and products_df["num_reviews_used"].sum() == rows
+    result = {
+        "rows": rows,
+        "products": len(products_df),
+        "aggregate_s": round(agg_s, 2),
+        "merge_s": round(merge_s, 2),
+        "total_s": round(agg_s + merge_s, 2),
+        "rows_per_sec": round(rows / (agg_s + merge_s)),
+        "generate_s": round(gen_s, 2),
+    }
+    if legacy_rows:
+        sample = df.head(legacy_rows)
+        _, legacy_s = _timed(lambda: _legacy_attach(sample, products_df))
+        # the iterrows loop is linear in rows: extrapolate the sample to the full table
+        result["legacy_merge_est_s"] = round(legacy_s * rows / len(sample), 1)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized product-sentiment aggregation")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000, 10000000])
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--legacy_rows", type=int, default=20000,
+                        help="Rows to time the old iterrows loop on (0 = skip)")
+    args = parser.parse_args()
+    results = []
+    for n in args.rows:
+        results.append(bench(n, args.products, args.legacy_rows))
+        print(results[-1], flush=True)
+    print()
+    print(pd.DataFrame(results).to_string(index=False))
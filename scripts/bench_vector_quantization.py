@@ -0,0 +1,88 @@
+# scripts/bench_vector_quantization.py
+# Memory saved vs recall@k for the quantized NumPy index (float16 / int8) against exact float32 search.
+# "scanned MB" is what every query reads; "stored MB" is the version on disk, which for a quantized index
+# includes the float32 vectors.npy kept (memory-mapped) for rescoring: quantization trades disk for scan size.
+#
+# Run from the repo root, on an exported index (python -m ml.embedder --export_numpy):
+#   python scripts/bench_vector_quantization.py --index chroma_db/numpy/reviews_with_sentiment
+# or on synthetic MiniLM-sized vectors:
+#   python scripts/bench_vector_quantization.py --synthetic 200000
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ml.vector_index import NumpyVectorIndex  # noqa: E402
+
+
+def synthetic_vectors(n, dim=384, clusters=256, seed=0):
+    # clustered vectors look more like real embeddings than isotropic noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vecs = centers[rng.integers(0, clusters, size=n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vecs
+
+
+def search_ids(index, queries, k, rescore=True):
+    start = time.perf_counter()
+    hits = index.query(queries, k, rescore=rescore) if index.quantized is not None else index.query(queries, k)
+    ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return [[text for text, _, _ in h] for h in hits], ms
+
+
+def recall(approx, exact):
+    return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact)]))
+
+
+def main(index_path, synthetic, n_queries, k, seed):
+    if index_path:
+        vectors = np.asarray(NumpyVectorIndex.load(index_path).vectors, dtype=np.float32)
+        source = index_path
+    else:
+        vectors = synthetic_vectors(synthetic, seed=seed)
+        source = f"synthetic ({synthetic} x {vectors.shape[1]})"
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    # perturbed stored vectors as queries: realistic neighbourhoods without an embedding model
+    queries = vectors[picks] + 0.05 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+    ids = [str(i) for i in range(len(vectors))]
+    metas = [{} for _ in ids]
+    print(f"Source: {source}; {len(queries)} queries, recall@{k} vs exact float32")
+    print(f"{'storage':<10} {'scanned MB':>11} {'saved':>7} {'stored MB':>10} {'recall@k':>9} {'no-rescore':>11} "
+          f"{'ms/query':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        NumpyVectorIndex.write(str(Path(tmp) / "float32"), ids, vectors, ids, metas)
+        exact_idx = NumpyVectorIndex.load(str(Path(tmp) / "float32"))
+        exact, ms = search_ids(exact_idx, queries, k)
+        base_bytes = exact_idx.memory_bytes()
+        print(f"{'float32':<10} {base_bytes / 2**20:>11.1f} {'-':>7} {exact_idx.stored_bytes() / 2**20:>10.1f} "
+              f"{1.0:>9.4f} {'-':>11} {ms:>9.2f}")
+
+        for quantization in ("float16", "int8"):
+            path = str(Path(tmp) / quantization)
+            NumpyVectorIndex.write(path, ids, vectors, ids, metas, quantization=quantization)
+            idx = NumpyVectorIndex.load(path)
+            rescored, ms = search_ids(idx, queries, k, rescore=True)
+            raw, _ = search_ids(idx, queries, k, rescore=False)
+            saved = 1 - idx.memory_bytes() / base_bytes
+            print(f"{quantization:<10} {idx.memory_bytes() / 2**20:>11.1f} {saved:>7.0%} "
+                  f"{idx.stored_bytes() / 2**20:>10.1f} {recall(rescored, exact):>9.4f} {recall(raw, exact):>11.4f} "
+                  f"{ms:>9.2f}")
+        print("saved = scanned bytes per query vs float32; stored MB includes the float32 copy kept for rescoring")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs memory for quantized NumPy vector indexes")
+    parser.add_argument("--index", default=None, help="Exported NumPy index directory (contains CURRENT)")
+    parser.add_argument("--synthetic", type=int, default=100000, help="Rows of synthetic vectors if --index is not given")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("-k", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.index, args.synthetic, args.queries, args.k, args.seed)
@@ -1,44 +1,53 @@
 # scripts/chunk_docs.py
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import pandas as pd
-from pathlib import Path
-
-in_products = "data/processed/products.csv"
-out_chunks = Path("data/processed/chunked_products.csv")
-in_reviews = "data/processed/reviews.csv"
-out_review_chunks = Path("data/processed/chunked_reviews.csv")
-
-df = pd.read_csv(in_products)
-splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-
-rows = []
-for _, r in df.iterrows():
-    chunks = splitter.split_text(r['text'])
-    for i, ch in enumerate(chunks):
-        rows.append({
-            "product_id": r['product_id'],
-            "product_name": r['product_name'],
-            "chunk_id": f"{r['product_id']}_c{i}",
-            "chunk_review_text": ch
-        })
-        
-pd.DataFrame(rows).to_csv(out_chunks, index=False)
-print(f"Wrote {len(rows)} product chunks to {out_chunks}")
-
-# chunk reviews
-df_reviews = pd.read_csv(in_reviews)
+# Run from the repo root: python scripts/chunk_docs.py [--workers N]
+import argparse
+
+from chunking import chunk_table, review_base
+
+in_products = "data/processed/products"
+out_chunks = "data/processed/chunked_products"
+in_reviews = "data/processed/reviews"
+out_review_chunks = "data/processed/chunked_reviews"
+
+
+def product_fields(r):
+    return {
+        "product_id": r['product_id'],
+        "product_name": r['product_name'],
+        "chunk_id": None,
+        "chunk_review_text": None,
+    }
+
+
+def product_base(r):
+    return str(r['product_id'])
+
+
 #product_id,product_name,review_text,rating
-rows = []
-for _, r in df_reviews.iterrows():
-    chunks = splitter.split_text(r['review_text'])
-    for i, ch in enumerate(chunks):
-        rows.append({
-            "product_id": r['product_id'],
-            "product_name": r['product_name'],
-            "rating": r['rating'],
-            "chunk_id": f"{r['product_id']}_c{i}",
-            "chunk_review_text": ch
-        })
-        
-pd.DataFrame(rows).to_csv(out_review_chunks, index=False)
-print(f"Wrote {len(rows)} product chunks to {out_review_chunks}")
+def review_fields(r):
+    return {
+        "product_id": r['product_id'],
+        "product_name": r['product_name'],
+        "rating": r['rating'],
+        "chunk_id": None,
+        "chunk_review_text": None,
+    }
+
+
+def review_chunk_base(r):
+    # reviews.csv has no review id: chunks are keyed by a hash of the review text
+    return review_base(r['product_id'], None, r['review_text'])
+
+
+def main(workers=0):
+    out, n = chunk_table(in_products, out_chunks, "text", product_fields, product_base, workers)
+    print(f"Wrote {n} product chunks to {out}")
+    out, n = chunk_table(in_reviews, out_review_chunks, "review_text", review_fields, review_chunk_base, workers)
+    print(f"Wrote {n} review chunks to {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk products / reviews for embedding")
+    parser.add_argument("--workers", type=int, default=0, help="Splitter processes (0/1: split in this process)")
+    args = parser.parse_args()
+    main(args.workers)
@@ -0,0 +1,152 @@
+# scripts/chunking.py
+# Streaming chunking stage shared by chunk_docs.py and sentiment_chunk_docs.py: the input table is read in
+# blocks of rows, blocks are split into chunks across a process pool, and chunk rows are appended to the
+# output table in input order as soon as their block is done (memory stays bounded by the blocks in flight).
+# Tables are CSV or Parquet datasets (ml/data_loader.py).
+#
+# Chunk ids are deterministic and unique within the output: "{base}_c{i}" where base is
+#   reviews:  "{product_id}_r{review_id}", or "{product_id}_h{hash of the review text}" without a review id
+#   products: "{product_id}"
+# and a base already seen earlier in the file (same review twice, two products sharing an id) gets
+# "_d{hash of its chunk texts}" (plus "_{n}" for repeats of identical content), so a duplicate's id depends on
+# what it says, not on how many duplicates precede it, and later incremental stages
+# (ml/embedder.py --mode incremental) can key on chunk_id.
+import hashlib
+import multiprocessing
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ml.data_loader import TableWriter, iter_table  # noqa: E402
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+# input rows read (and handed to a worker) per block
+READ_ROWS = 2000
+PROGRESS_EVERY_SEC = 5
+
+
+def missing(value) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and pd.isna(value)) or str(value).strip() == ""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:12]
+
+
+def review_base(product_id, review_id, text) -> str:
+    """Chunk id base of a review: by review id when it has one, else by a hash of its text."""
+    if not missing(review_id):
+        return f"{product_id}_r{review_id}"
+    return f"{product_id}_h{text_hash(text)}"
+
+
+_worker = {}
+
+
+def _init_worker(chunk_size, chunk_overlap, text_col, build_fields, base_id):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    _worker.update({
+        "splitter": RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap),
+        "text_col": text_col,
+        "build_fields": build_fields,
+        "base_id": base_id,
+    })
+
+
+def _split_block(records):
+    """[(base id, chunk texts, output fields)] for one block of input rows."""
+    out = []
+    for r in records:
+        text = r.get(_worker["text_col"])
+        text = "" if missing(text) else str(text)
+        chunks = _worker["splitter"].split_text(text) if text else []
+        out.append((_worker["base_id"](r), chunks, _worker["build_fields"](r)))
+    return out
+
+
+def chunk_table(in_path, out_path, text_col: str, build_fields: Callable[[dict], Dict],
+                base_id: Callable[[dict], str], workers: int = 0, read_rows: int = READ_ROWS,
+                chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> Tuple[str, int]:
+    """
+    Split text_col of every row of in_path into chunks and stream them to the out_path dataset.
+    Returns (written path, chunk count).
+
+    build_fields(row) -> output columns for the row's chunks, in output order; its "chunk_id" and
+    "chunk_review_text" entries are filled per chunk. base_id(row) -> chunk id base (review_base or
+    the product id). Both must be module-level functions (they are sent to the worker processes).
+    workers > 1 splits blocks in that many processes; the output is the same for any worker count.
+    """
+    start = time.time()
+    blocks = (frame.to_dict("records") for frame in iter_table(in_path, read_rows))
+    initargs = (chunk_size, chunk_overlap, text_col, build_fields, base_id)
+    pool = None
+    if workers > 1:
+        # spawn: same start method on every platform (callers need an if __name__ == "__main__" guard)
+        pool = multiprocessing.get_context("spawn").Pool(workers, initializer=_init_worker, initargs=initargs)
+        results = _ordered(pool, blocks, workers * 2)
+    else:
+        _init_worker(*initargs)
+        results = map(_split_block, blocks)
+
+    seen: Dict[str, int] = {}
+    written = rows = 0
+    last_progress = start
+    try:
+        # the dataset is replaced only once complete: readers never see a half-written chunk file
+        with TableWriter(out_path) as writer:
+            for block in results:
+                out_rows = []
+                for base, chunks, fields in block:
+                    base = _unique_base(base, chunks, seen)
+                    for i, ch in enumerate(chunks):
+                        out_rows.append({**fields, "chunk_id": f"{base}_c{i}", "chunk_review_text": ch})
+                if out_rows:
+                    writer.write(pd.DataFrame(out_rows))
+                written += len(out_rows)
+                rows += len(block)
+                now = time.time()
+                if now - last_progress >= PROGRESS_EVERY_SEC:
+                    last_progress = now
+                    print(f"{in_path}: {rows} rows, {written} chunks ({rows / (now - start):.0f} rows/sec)", flush=True)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return writer.path, written
+
+
+def _unique_base(base: str, chunks, seen: Dict[str, int]) -> str:
+    """base, or for a base already used a content-derived variant of it; records the result in seen."""
+    if base in seen:
+        digest = text_hash("\x00".join(chunks))
+        base = f"{base}_d{digest}"
+    n = seen.get(base, 0)
+    seen[base] = n + 1
+    # only rows with the same base and the same text get here twice: interchangeable, so numbering is safe
+    return f"{base}_{n}" if n else base
+
+
+def _ordered(pool, blocks, max_in_flight):
+    # imap would read the whole input ahead of the workers; keep at most max_in_flight blocks queued
+    pending = deque()
+    for block in blocks:
+        pending.append(pool.apply_async(_split_block, (block,)))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def first_present(row: dict, *names, default=None):
+    """Value of the first of names that is a column of row (r.get(a, r.get(b, ...)) for CSV records)."""
+    for name in names:
+        if name in row:
+            return row[name]
+    return default
+
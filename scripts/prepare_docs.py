@@ -1,14 +1,18 @@
 # scripts/prepare_docs.py
+import sys
 import pandas as pd
 import hashlib
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ml.data_loader import read_table, write_table  # noqa: E402
+
 INPUT = "data/raw/raw.csv"
 OUT_DIR = Path("data/processed")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # read raw csv
-df = pd.read_csv(INPUT, dtype={1: str, 10: str})
+df = read_table(INPUT, dtype={1: str, 10: str})
 #print(df.columns.tolist())
 df = df.rename(columns=lambda x: x.strip())
 #print('after')
@@ -37,8 +41,8 @@ for prod, group in df.groupby(product_col):
 
 products_df = pd.DataFrame(docs)
 #print(products_df.columns.tolist())
-products_df.to_csv(OUT_DIR/"products.csv", index=False)
-print(f"Saved product docs: {OUT_DIR/'products.csv'}")
+out = write_table(products_df, OUT_DIR/"products")
+print(f"Saved product docs: {out}")
 
 
 # Also write review-level table: keep product_id, review text, rating
@@ -53,5 +57,5 @@ for _, r in df.iterrows():
         rows.append({"product_id": prod_id, "product_name": prod, "review_text": text, "rating": rating})
         
 reviews_df = pd.DataFrame(rows)
-reviews_df.to_csv(OUT_DIR/"reviews.csv", index=False)
-print(f"Saved review snippets: {OUT_DIR/'reviews.csv'}")
\ No newline at end of file
+out = write_table(reviews_df, OUT_DIR/"reviews")
+print(f"Saved review snippets: {out}")
\ No newline at end of file
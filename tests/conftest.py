@@ -0,0 +1,10 @@
+# tests/conftest.py
+# Unit tests for the pure-Python / NumPy parts of the pipeline (no torch, chromadb or model downloads).
+# Run from the repo root: python -m pytest
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# ml.* / backend.* import from the repo root; the chunk scripts import each other from scripts/
+sys.path.insert(0, str(ROOT))
+sys.path.append(str(ROOT / "scripts"))
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from ml.cache import CollectionVersions, TTLCache, bump_collection_version, read_collection_versions
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 3, 1, 1)
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5.0, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a", "gone") == "gone"
+    assert len(cache) == 0 and cache.stats()["expirations"] == 1
+
+
+def test_ttl_cache_rejects_empty_size():
+    with pytest.raises(ValueError):
+        TTLCache(maxsize=0)
+
+
+def test_collection_versions_follow_bumps(tmp_path):
+    changes = []
+    versions = CollectionVersions(str(tmp_path), on_change=changes.append)
+    assert versions.get("reviews") == "unversioned"
+    assert changes == []
+
+    first = bump_collection_version(str(tmp_path), "reviews")
+    assert versions.get("reviews") == first
+    assert changes == [{"reviews": first}]
+    # unchanged file: no re-read callback
+    assert versions.get("reviews") == first and len(changes) == 1
+
+    second = bump_collection_version(str(tmp_path), "reviews")
+    # force a distinct mtime on filesystems with coarse timestamps
+    stat = os.stat(os.path.join(str(tmp_path), "collection_versions.json"))
+    os.utime(os.path.join(str(tmp_path), "collection_versions.json"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert second != first
+    assert versions.get("reviews") == second
+    assert read_collection_versions(str(tmp_path)) == {"reviews": second}
+    assert len(changes) == 2
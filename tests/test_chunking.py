@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from chunking import _unique_base, chunk_table, review_base, text_hash
+
+
+def test_review_base_prefers_review_id():
+    assert review_base("p1", "r9", "text") == "p1_rr9"
+    assert review_base("p1", None, "text") == f"p1_h{text_hash('text')}"
+    assert review_base("p1", float("nan"), "text") == review_base("p1", "  ", "text")
+
+
+def test_duplicate_bases_get_content_derived_ids():
+    seen = {}
+    ids = [_unique_base(base, chunks, seen) for base, chunks in
+           [("p1", ["a"]), ("p1", ["b"]), ("p2", ["a"]), ("p1", ["b"])]]
+    assert ids[:3] == ["p1", f"p1_d{text_hash('b')}", "p2"]
+    # an exact repeat of the same content is numbered
+    assert ids[3] == f"p1_d{text_hash('b')}_1"
+    assert len(set(ids)) == len(ids)
+
+
+def test_duplicate_ids_do_not_depend_on_earlier_duplicates():
+    # dropping one duplicate leaves the ids of the others unchanged
+    rows = [("p1", ["a"]), ("p1", ["b"]), ("p1", ["c"])]
+    seen_all, seen_some = {}, {}
+    all_ids = [_unique_base(base, chunks, seen_all) for base, chunks in rows]
+    some_ids = [_unique_base(base, chunks, seen_some) for base, chunks in [rows[0], rows[2]]]
+    assert some_ids == [all_ids[0], all_ids[2]]
+
+
+def review_fields(r):
+    return {"product_id": r["product_id"], "chunk_id": None, "chunk_review_text": None}
+
+
+def review_chunk_base(r):
+    return review_base(r["product_id"], r.get("review_id"), r["review_text"])
+
+
+def test_chunk_table_writes_unique_ids(tmp_path):
+    pytest.importorskip("langchain.text_splitter")
+    source = pd.DataFrame({
+        "product_id": ["p1", "p1", "p2", "p1"],
+        "review_id": ["r1", "r1", None, "r2"],
+        "review_text": ["good " * 300, "second copy of r1", "short", ""],
+    })
+    source.to_csv(tmp_path / "reviews.csv", index=False)
+    path, n = chunk_table(tmp_path / "reviews.csv", tmp_path / "chunks.csv", "review_text", review_fields,
+                          review_chunk_base, chunk_size=200, chunk_overlap=20)
+    chunks = pd.read_csv(path)
+    assert n == len(chunks) and chunks["chunk_id"].is_unique
+    assert chunks["chunk_id"].iloc[0] == "p1_rr1_c0"
+    assert (chunks["chunk_id"] == f"p1_rr1_d{text_hash('second copy of r1')}_c0").sum() == 1
+    assert f"p2_h{text_hash('short')}_c0" in set(chunks["chunk_id"])
+    # empty text produces no chunks
+    assert not chunks["chunk_id"].str.startswith("p1_rr2").any()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.data_loader import TableWriter, dataset_path, find_table, iter_table, read_table, write_table
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        "product_id": ["p1", "p2", "p3", "p4", "p5"],
+        "review_text": ["great", "bad, really", "ok\nfine", "", "meh"],
+        "rating": [5.0, 1.0, np.nan, 3.0, 2.0],
+        "num_reviews": [10, 20, 30, 40, 50],
+    })
+
+
+def test_parquet_round_trip_keeps_types(tmp_path, frame):
+    path = write_table(frame, tmp_path / "reviews", "parquet")
+    assert path == str(tmp_path / "reviews.parquet")
+    out = read_table(path)
+    assert list(out.columns) == list(frame.columns)
+    assert out["num_reviews"].dtype == np.int64 and out["rating"].dtype == np.float64
+    assert out["rating"].isna().tolist() == frame["rating"].isna().tolist()
+    assert out["review_text"].tolist() == frame["review_text"].tolist()
+    # projection reads only the requested columns
+    assert list(read_table(path, columns=["rating"]).columns) == ["rating"]
+
+
+def test_mixed_type_column_stored_as_strings(tmp_path):
+    frame = pd.DataFrame({"review_id": [1, "r2", None]}, dtype=object)
+    out = read_table(write_table(frame, tmp_path / "mixed", "parquet"))
+    assert out["review_id"].tolist()[:2] == ["1", "r2"] and out["review_id"].isna().tolist()[2]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_iter_table_streams_across_parts(tmp_path, frame, fmt):
+    with TableWriter(tmp_path / "chunks", fmt, rows_per_part=2) as writer:
+        writer.write(frame.iloc[:3])
+        writer.write(frame.iloc[3:])
+    frames = list(iter_table(writer.path, chunk_rows=2))
+    assert all(len(f) <= 2 for f in frames)
+    assert pd.concat(frames)["product_id"].tolist() == frame["product_id"].tolist()
+    resumed = pd.concat(iter_table(writer.path, chunk_rows=2, skip_rows=3))
+    assert resumed["product_id"].tolist() == ["p4", "p5"]
+
+
+def test_find_table_resolves_dataset_names(tmp_path, frame):
+    with pytest.raises(FileNotFoundError):
+        find_table(tmp_path / "reviews")
+    write_table(frame, tmp_path / "reviews", "csv")
+    assert find_table(tmp_path / "reviews") == str(tmp_path / "reviews.csv")
+    assert dataset_path(tmp_path / "reviews.csv", "parquet") == str(tmp_path / "reviews.parquet")
+
+
+def test_failed_write_leaves_previous_dataset(tmp_path, frame):
+    path = write_table(frame, tmp_path / "reviews", "parquet")
+    with pytest.raises(RuntimeError):
+        with TableWriter(path) as writer:
+            writer.write(frame.iloc[:1])
+            raise RuntimeError("crash mid-write")
+    assert len(read_table(path)) == len(frame)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from ml.lexical_index import LexicalIndex, LexicalIndexBuilder, tokenize
+from ml.vector_index import NumpyVectorIndex
+
+
+def _build(tmp_path, pages):
+    builder = LexicalIndexBuilder()
+    for ids, texts, metadatas in pages:
+        builder.add(ids, texts, metadatas)
+    builder.write(str(tmp_path))
+    return LexicalIndex.load(str(tmp_path))
+
+
+def test_tokenize():
+    assert tokenize("Fire HD 8, 16 GB") == ["fire", "hd", "8", "16", "gb"]
+
+
+def test_bm25_ranking(tmp_path):
+    index = _build(tmp_path, [
+        (["a", "b"], ["great battery, battery lasts", "screen is sharp"], [None, None]),
+        (["c", "d"], ["battery is fine", "speaker"], [{"product_name": "Echo Dot"}, None]),
+    ])
+    assert index.count() == 4
+    hits = index.search("battery", 10)
+    # higher term frequency wins; documents without the term are never returned
+    assert [i for i, _ in hits] == ["a", "c"]
+    assert hits[0][1] > hits[1][1] > 0
+    assert index.search("battery", 1) == hits[:1]
+    # the product name is indexed with the chunk text
+    assert [i for i, _ in index.search("echo", 5)] == ["c"]
+    assert index.search("unknown words", 5) == []
+    assert index.search("battery", 0) == []
+
+
+def test_rare_terms_weigh_more(tmp_path):
+    index = _build(tmp_path, [(["a", "b", "c"], ["good tablet", "good case", "good charger"], [None] * 3)])
+    scores = dict(index.search("good charger", 3))
+    assert max(scores, key=scores.get) == "c"
+
+
+def test_reciprocal_rank_fusion(tmp_path, monkeypatch):
+    pytest.importorskip("langchain_community")
+    from ml import rag_engine
+
+    # vector ranking for the query e0: c0, c1, c2, c3; only c1 and c3 contain "wireless"
+    vectors = np.array([[1, 0, 0], [0.9, 0.3, 0], [0.2, 1, 0], [0, 0.2, 1]], dtype=np.float32)
+    texts = ["plain speaker", "wireless speaker", "tablet", "wireless earbuds and case"]
+    metadatas = [{"product_id": f"p{i}", "chunk_id": f"c{i}"} for i in range(4)]
+    NumpyVectorIndex.write(str(tmp_path / "vec"), [f"c{i}" for i in range(4)], vectors, texts, metadatas)
+    backend = NumpyVectorIndex.load(str(tmp_path / "vec"))
+    lexical = _build(tmp_path / "bm25", [([f"c{i}" for i in range(4)], texts, metadatas)])
+    monkeypatch.setattr(rag_engine, "_get_backend", lambda name: backend)
+    monkeypatch.setattr(rag_engine, "_get_lexical_index", lambda name: lexical)
+
+    # vector pool of 2 (c0, c1): c1 is in both lists, c3 only in the lexical one
+    results = rag_engine._search_products_hybrid("wireless", [1.0, 0.0, 0.0], 3, fetch_k=2, nprobe=0)
+    assert [r["product_id"] for r in results] == ["p1", "p0", "p3"]
+    # chunks only the lexical side found still get their exact vector distance
+    assert results[2]["score"] == pytest.approx(backend.distances([1.0, 0.0, 0.0], ["c3"])["c3"])
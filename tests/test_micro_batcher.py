@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.utils.micro_batcher import MicroBatcher, QueueFull
+
+
+def test_concurrent_requests_share_batches():
+    calls = []
+
+    def process(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(process, max_batch=4, max_wait_ms=50)
+        return await asyncio.gather(*(batcher.submit([i, i + 10]) for i in range(3))), batcher.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [[0, 20], [2, 22], [4, 24]]
+    # 6 items with max_batch 4: one full batch, then the rest
+    assert [len(c) for c in calls] == [4, 2]
+    assert (stats["batches"], stats["items"]) == (2, 6)
+
+
+def test_partial_batch_closes_after_max_wait():
+    async def main():
+        batcher = MicroBatcher(lambda items: items, max_batch=100, max_wait_ms=20)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await batcher.submit(["x"])
+        return result, loop.time() - start
+
+    result, elapsed = asyncio.run(main())
+    assert result == ["x"]
+    assert 0.015 <= elapsed < 2.0
+
+
+def test_queue_full_rejects_whole_request():
+    release = threading.Event()
+
+    def slow(items):
+        release.wait(5)
+        return items
+
+    async def main():
+        batcher = MicroBatcher(slow, max_batch=1, max_wait_ms=0, max_queue=2)
+        first = asyncio.ensure_future(batcher.submit(["busy"]))
+        await asyncio.sleep(0.05)  # "busy" is being processed; the queue is empty again
+        queued = asyncio.ensure_future(batcher.submit(["a", "b"]))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFull):
+            await batcher.submit(["c"])
+        release.set()
+        return await first, await queued, batcher.stats()
+
+    first, queued, stats = asyncio.run(main())
+    assert (first, queued) == (["busy"], ["a", "b"])
+    assert stats["rejected_requests"] == 1
+
+
+def test_process_errors_reach_every_caller():
+    def fail(items):
+        raise RuntimeError("model down")
+
+    async def main():
+        batcher = MicroBatcher(fail, max_batch=8, max_wait_ms=10)
+        return await asyncio.gather(batcher.submit([1]), batcher.submit([2]), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,40 @@
+from ml.sentiment_model import SentimentCache, analyze_texts, get_classifier, padding_efficiency, plan_batches
+
+
+def test_plan_batches_respects_token_budget():
+    lengths = [5, 1, 3, 9, 2, 4]
+    batches = plan_batches(lengths, max_tokens=10)
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) * max(lengths[i] for i in batch) <= 10
+    # shortest texts first, so similar lengths share a batch
+    assert batches[0] == [1, 4, 2]
+
+
+def test_plan_batches_item_cap_and_oversized_texts():
+    assert plan_batches([1] * 5, max_tokens=100, max_items=2) == [[0, 1], [2, 3], [4]]
+    # a text longer than the budget still gets classified, alone
+    assert plan_batches([50, 2], max_tokens=10) == [[1], [0]]
+    assert plan_batches([], max_tokens=10) == []
+
+
+def test_padding_efficiency():
+    lengths = [2, 2, 8]
+    assert padding_efficiency(lengths, [[0, 1], [2]]) == 1.0
+    assert padding_efficiency(lengths, [[0, 1, 2]]) == 12 / 24
+
+
+def test_analyze_texts_deduplicates_and_caches(tmp_path):
+    classifier = get_classifier(backend="lexicon")
+    cache = SentimentCache(str(tmp_path / "cache" / "sentiment.sqlite"))
+    stats = {}
+    results = analyze_texts(["great phone", "great phone", "awful battery"], classifier=classifier,
+                            stats=stats, cache=cache)
+    assert [r["label"] for r in results] == ["positive", "positive", "negative"]
+    assert (stats["unique_texts"], stats["classified"]) == (2, 2)
+
+    stats = {}
+    again = analyze_texts(["awful battery", "new text"], classifier=classifier, stats=stats, cache=cache)
+    assert again[0] == results[2]
+    assert (stats["cache_hits"], stats["classified"]) == (1, 1)
+    cache.close()
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from ml.vector_index import NumpyVectorIndex
+
+ROWS = 400
+DIM = 16
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(ROWS, DIM)).astype(np.float32)
+    ids = [f"c{i}" for i in range(ROWS)]
+    documents = [f"doc {i}" for i in range(ROWS)]
+    metadatas = [{"product_id": f"p{i % 5}", "rating": i % 5 + 1, **({"tag": "x"} if i % 2 else {})}
+                 for i in range(ROWS)]
+    return vectors, ids, documents, metadatas
+
+
+def _load(tmp_path, data, name="index", **kwargs):
+    vectors, ids, documents, metadatas = data
+    path = str(tmp_path / name)
+    NumpyVectorIndex.write(path, ids, vectors, documents, metadatas, **kwargs)
+    return NumpyVectorIndex.load(path)
+
+
+def _exact_docs(vectors, query, k, rows=None):
+    rows = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+    normed = vectors[rows] / np.linalg.norm(vectors[rows], axis=1, keepdims=True)
+    best = rows[np.argsort(-(normed @ (query / np.linalg.norm(query))), kind="stable")[:k]]
+    return [f"doc {i}" for i in best]
+
+
+def _queries(vectors, n=20, seed=1):
+    rng = np.random.default_rng(seed)
+    return vectors[:n] + 0.05 * rng.normal(size=(n, vectors.shape[1])).astype(np.float32)
+
+
+def test_exact_query_matches_brute_force(tmp_path, data):
+    vectors = data[0]
+    index = _load(tmp_path, data)
+    assert index.count() == ROWS
+    for query, hits in zip(_queries(vectors), index.query(_queries(vectors), 5)):
+        assert [text for text, _, _ in hits] == _exact_docs(vectors, query, 5)
+    text, md, dist = index.query([vectors[7]], 1)[0][0]
+    assert (text, md) == ("doc 7", {"product_id": "p2", "rating": 3, "tag": "x"})
+    assert dist == pytest.approx(0.0, abs=1e-5)
+
+
+def test_filtered_query(tmp_path, data):
+    vectors = data[0]
+    index = _load(tmp_path, data)
+    hits = index.query([vectors[0]], 10, where={"product_id": "p2"})[0]
+    assert [text for text, _, _ in hits] == _exact_docs(vectors, vectors[0], 10, rows=range(2, ROWS, 5))
+
+    where = {"$and": [{"product_id": {"$in": ["p1", "p3"]}}, {"tag": {"$ne": "x"}}]}
+    rows = index.filter_rows(where)
+    assert all(r % 5 in (1, 3) and r % 2 == 0 for r in rows) and len(rows) == ROWS // 5
+    # a missing field never equals a value, and a value of another type never matches
+    assert len(index.filter_rows({"missing": 1})) == 0
+    assert len(index.filter_rows({"rating": "3"})) == 0
+    assert index.query([vectors[0]], 3, where={"product_id": "nope"}) == [[]]
+    with pytest.raises(ValueError):
+        index.filter_rows({"rating": {"$gt": 2}})
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_query(tmp_path, data, quantization):
+    vectors = data[0]
+    exact = _load(tmp_path, data, "float32")
+    index = _load(tmp_path, data, quantization, quantization=quantization)
+    queries = _queries(vectors)
+    rescored = index.query(queries, 10)
+    found = [len(set(t for t, _, _ in h) & set(_exact_docs(vectors, q, 10))) for q, h in zip(queries, rescored)]
+    assert np.mean(found) / 10 >= 0.95
+    # rescoring reports exact float32 distances
+    assert rescored[0][0][2] == pytest.approx(exact.query(queries[:1], 1)[0][0][2], abs=1e-5)
+    assert len(index.query(queries, 10, rescore=False)[0]) == 10
+    # scans less, stores more (the float32 copy stays for rescoring)
+    assert index.memory_bytes() < exact.memory_bytes()
+    assert index.stored_bytes() > exact.stored_bytes()
+
+
+def test_ivf_query(tmp_path, data):
+    vectors = data[0]
+    index = _load(tmp_path, data, ivf_lists=8)
+    queries = _queries(vectors)
+    exact = [[t for t, _, _ in h] for h in index.query(queries, 5, nprobe=0)]
+    assert exact == [_exact_docs(vectors, q, 5) for q in queries]
+    # probing every list is exhaustive
+    assert [[t for t, _, _ in h] for h in index.query(queries, 5, nprobe=8)] == exact
+    probed = index.query(queries, 5, nprobe=2)
+    assert all(len(h) == 5 for h in probed)
+    filtered = index.query(queries, 5, where={"product_id": "p4"}, nprobe=2)
+    assert all(md["product_id"] == "p4" for h in filtered for _, md, _ in h)
+
+
+def test_get_distances_and_scan(tmp_path, data):
+    vectors = data[0]
+    index = _load(tmp_path, data)
+    assert [(i, t) for i, t, _ in index.get(["c9", "unknown", "c1"])] == [("c9", "doc 9"), ("c1", "doc 1")]
+    dists = index.distances(vectors[1], ["c1", "unknown"])
+    assert list(dists) == ["c1"] and dists["c1"] == pytest.approx(0.0, abs=1e-5)
+    pages = list(index.scan_metadatas(page_size=150))
+    assert [len(ids) for ids, _ in pages] == [150, 150, 100]
+    assert pages[0][1][0] == {"product_id": "p0", "rating": 1}
+
+
+def test_mixed_type_metadata_round_trips(tmp_path):
+    metadatas = [{"review_id": 5}, {"review_id": "r6"}, {}]
+    path = str(tmp_path / "index")
+    NumpyVectorIndex.write(path, ["a", "b", "c"], np.eye(3, 4), ["x", "y", "z"], metadatas)
+    index = NumpyVectorIndex.load(path)
+    assert [md for _, _, md in index.get(["a", "b", "c"])] == metadatas
+    assert index.column_values("review_id") == [5, "r6", None]
+    assert list(index.filter_rows({"review_id": 5})) == [0]